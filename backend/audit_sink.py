@@ -0,0 +1,162 @@
+"""
+Audit Sink Module
+Buffers audit and log documents in memory and writes them to MongoDB in batches
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+BLOCK = "block"
+DROP = "drop"
+
+# A document that an earlier attempt already stored
+DUPLICATE_KEY = 11000
+
+
+class AuditSink:
+    """Moves log persistence off the request path.
+
+    ``write`` only appends the document to an in-memory buffer. A background
+    task flushes the buffer with one ``insert_many`` per collection whenever
+    ``batch_size`` documents are waiting or ``flush_interval`` seconds have
+    passed. The buffer holds at most ``max_pending`` documents; when it is
+    full ``write`` either waits for the next flush (``block``) or drops the
+    document and counts it (``drop``). Documents a flush could not write are
+    put back and retried on the following flushes, up to ``max_retries``
+    times, before they are counted as failed. ``close`` flushes what is left.
+    """
+
+    def __init__(self, db, batch_size: int = None, flush_interval: float = None,
+                 max_pending: int = None, overload: str = None):
+        self.db = db
+        self.batch_size = batch_size or int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+        self.flush_interval = flush_interval or float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+        self.max_pending = max_pending or int(os.getenv("AUDIT_MAX_PENDING", "50000"))
+        self.overload = (overload or os.getenv("AUDIT_OVERLOAD", BLOCK)).lower()
+        self.max_retries = int(os.getenv("AUDIT_MAX_RETRIES", "3"))
+        if self.overload not in (BLOCK, DROP):
+            raise ValueError(f"AUDIT_OVERLOAD must be '{BLOCK}' or '{DROP}'")
+        self.stats = {"written": 0, "dropped": 0, "failed": 0, "retried": 0, "flushes": 0, "blocked": 0}
+
+        # collection -> (attempts so far, document)
+        self._pending: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+        self._size = 0
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._last_flush_ms = 0.0
+
+    async def write(self, collection: str, document: Dict[str, Any]):
+        """Queue a document for insertion into ``collection``"""
+        while self._size >= self.max_pending and not self._closed:
+            if self.overload == DROP:
+                self.stats["dropped"] += 1
+                return
+            self.stats["blocked"] += 1
+            self._wakeup.set()
+            self._drained.clear()
+            await self._drained.wait()
+
+        if self._closed:
+            # Late writers during shutdown go straight to the database
+            await self.db[collection].insert_one(document)
+            self.stats["written"] += 1
+            return
+
+        self._pending.setdefault(collection, []).append((0, document))
+        self._size += 1
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        if self._size >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write everything buffered so far"""
+        if not self._size:
+            return
+        pending, self._pending, self._size = self._pending, {}, 0
+        started = time.perf_counter()
+
+        for collection, entries in pending.items():
+            for start in range(0, len(entries), self.batch_size):
+                await self._insert(collection, entries[start:start + self.batch_size])
+
+        self.stats["flushes"] += 1
+        self._last_flush_ms = (time.perf_counter() - started) * 1000
+        self._drained.set()
+
+    async def _insert(self, collection: str, entries: List[Tuple[int, Dict[str, Any]]]):
+        try:
+            await self.db[collection].insert_many([document for _, document in entries], ordered=False)
+            self.stats["written"] += len(entries)
+            return
+        except BulkWriteError as e:
+            # Only the documents listed in the error failed; duplicates were stored by an earlier attempt
+            failed = {error["index"] for error in e.details.get("writeErrors", [])
+                      if error.get("code") != DUPLICATE_KEY}
+            self.stats["written"] += len(entries) - len(failed)
+            retry = [entries[index] for index in sorted(failed)]
+            reason = str(e)
+        except Exception as e:
+            retry = entries
+            reason = str(e)
+
+        self._requeue(collection, retry, reason)
+
+    def _requeue(self, collection: str, entries: List[Tuple[int, Dict[str, Any]]], reason: str):
+        """Put failed documents back for the next flush, giving up after ``max_retries`` attempts"""
+        retry = [(attempts + 1, document) for attempts, document in entries if attempts < self.max_retries]
+        lost = len(entries) - len(retry)
+        if retry:
+            self._pending[collection] = retry + self._pending.get(collection, [])
+            self._size += len(retry)
+            self.stats["retried"] += len(retry)
+            logger.warning(f"Retrying {len(retry)} documents for {collection}: {reason}")
+        if lost:
+            self.stats["failed"] += lost
+            logger.error(f"Failed to write {lost} documents to {collection} after {self.max_retries} retries: {reason}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backlog": self._size,
+            "max_pending": self.max_pending,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "overload": self.overload,
+            "last_flush_ms": round(self._last_flush_ms, 2),
+            **self.stats
+        }
+
+    async def close(self):
+        """Stop the flusher and write out the remaining documents"""
+        self._closed = True
+        self._wakeup.set()
+        if self._task:
+            # Let a flush that is in progress finish rather than losing its batch
+            await self._task
+            self._task = None
+        await self.flush()
+        # Documents put back by a failed flush get their remaining attempts
+        while self._size:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+        # Release writers still waiting for room
+        self._drained.set()
@@ -13,6 +13,11 @@ import os
 from motor.motor_asyncio import AsyncIOMotorClient
 import uuid
 
+from password_hasher import PasswordHasher
+from token_cache import TokenCache
+from permission_index import PermissionIndex
+from audit_sink import AuditSink
+
 # Configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-super-secret-key-change-in-production")
 ALGORITHM = "HS256"
@@ -20,13 +25,23 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(pwd_context)
 security = HTTPBearer()
 
+# Verified tokens, so authenticated requests skip JWT decoding and the user lookup
+token_cache = TokenCache()
+
 # Database connection
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ.get('DB_NAME', 'test_database')]
 
+# In-memory permission matrix; the database is only consulted until it has loaded
+permission_index = PermissionIndex(db)
+
+# Batched writer for audit and activity logs, kept off the request path
+audit_sink = AuditSink(db)
+
 # Enums
 class UserRole(str, Enum):
     SUPER_ADMIN = "super_admin"
@@ -56,6 +71,11 @@ class UserCreate(BaseModel):
     password: str
     role: UserRole = UserRole.VIEWER
 
+class UserUpdate(BaseModel):
+    email: Optional[str] = None
+    role: Optional[UserRole] = None
+    active: Optional[bool] = None
+
 class UserLogin(BaseModel):
     username: str
     password: str
@@ -83,12 +103,20 @@ class AuditLogEntry(BaseModel):
     timestamp: datetime
 
 # Password utilities
+# The synchronous helpers are for scripts; request handlers use the async
+# variants so bcrypt never runs on the event loop
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.hash(password)
+
 # JWT utilities
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -112,28 +140,43 @@ async def authenticate_user(username: str, password: str) -> Optional[dict]:
     user = await get_user_by_username(username)
     if not user:
         return None
-    if not verify_password(password, user["password_hash"]):
+    if not await verify_password_async(password, user["password_hash"]):
         return None
     if not user.get("active", True):
         return None
     return user
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def get_user_from_token(token: str) -> Optional[dict]:
+    """Resolve a JWT to its user record, or None if the token is invalid"""
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    
+    generation = token_cache.generation()
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            return None
     except JWTError:
-        raise credentials_exception
+        return None
     
     user = await get_user_by_username(username)
+    if user is not None:
+        token_cache.put(token, user, payload.get("exp"), generation)
+    return user
+
+def invalidate_user_cache(user_id: str):
+    """Forget cached tokens of a user after their record changed"""
+    token_cache.invalidate_user(user_id)
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    user = await get_user_from_token(credentials.credentials)
     if user is None:
         raise credentials_exception
     return user
@@ -144,7 +187,18 @@ async def get_current_active_user(current_user: dict = Depends(get_current_user)
     return current_user
 
 # Permission utilities
+PERMISSION_HIERARCHY = {
+    PermissionLevel.NO_ACCESS: 0,
+    PermissionLevel.VIEW_ONLY: 1,
+    PermissionLevel.CONTROL: 2,
+    PermissionLevel.FULL_CONTROL: 3
+}
+
 async def get_user_device_permission(user_id: str, device_id: str) -> Optional[PermissionLevel]:
+    if permission_index.ready:
+        level = permission_index.get_level(user_id, device_id)
+        return PermissionLevel(level) if level is not None else None
+    
     permission = await db.user_device_permissions.find_one({
         "user_id": user_id,
         "device_id": device_id
@@ -165,18 +219,18 @@ async def has_permission(user: dict, device_id: str, required_permission: Permis
     if user_permission is None:
         return False
     
-    # Permission hierarchy
-    permission_hierarchy = {
-        PermissionLevel.NO_ACCESS: 0,
-        PermissionLevel.VIEW_ONLY: 1,
-        PermissionLevel.CONTROL: 2,
-        PermissionLevel.FULL_CONTROL: 3
-    }
-    
-    return permission_hierarchy[user_permission] >= permission_hierarchy[required_permission]
+    return PERMISSION_HIERARCHY[user_permission] >= PERMISSION_HIERARCHY[required_permission]
 
 async def get_user_accessible_devices(user: dict) -> List[str]:
     """Get list of device IDs that user can access"""
+    if permission_index.ready:
+        if user.get("role") == UserRole.SUPER_ADMIN:
+            return permission_index.get_device_ids()
+        return [
+            device_id for device_id, level in permission_index.get_user_permissions(user["id"]).items()
+            if level != PermissionLevel.NO_ACCESS
+        ]
+    
     if user.get("role") == UserRole.SUPER_ADMIN:
         # Super admin can see all devices
         devices = await db.devices.find({}, {"id": 1, "_id": 0}).to_list(1000)
@@ -204,7 +258,7 @@ async def log_user_action(user_id: str, action: str, device_id: Optional[str] =
         timestamp=datetime.utcnow()
     )
     
-    await db.audit_log.insert_one(audit_entry.dict())
+    await audit_sink.write("audit_log", audit_entry.dict())
 
 # Role-based access decorators
 def require_role(required_role: UserRole):
@@ -0,0 +1,182 @@
+"""
+Bulk Power Module
+Fleet-wide power actions with bounded concurrency, staggering and progress streaming
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PowerExecutor = Callable[[str], Awaitable[Dict[str, Any]]]
+JobCallback = Callable[["BulkPowerJob"], Awaitable[None]]
+
+
+class BulkPowerJob:
+    """A single power action applied to many devices"""
+
+    def __init__(self, action: str, device_ids: List[str], concurrency: int,
+                 stagger_seconds: float, created_by: str):
+        self.id = str(uuid.uuid4())
+        self.action = action
+        self.device_ids = device_ids
+        self.concurrency = concurrency
+        self.stagger_seconds = stagger_seconds
+        self.created_by = created_by
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.status = "pending"
+        self.results: List[Dict[str, Any]] = []
+        self.task: Optional[asyncio.Task] = None
+        self._subscribers: List[asyncio.Queue] = []
+
+    def _publish(self, event: Dict[str, Any]):
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def add_result(self, result: Dict[str, Any]):
+        self.results.append(result)
+        self._publish({"type": "device_result", "job_id": self.id, **result})
+
+    def finish(self, status: str):
+        self.status = status
+        self.finished_at = datetime.utcnow()
+        self._publish({"type": "job_complete", **self.summary()})
+
+    def summary(self) -> Dict[str, Any]:
+        succeeded = sum(1 for result in self.results if result["success"])
+        return {
+            "job_id": self.id,
+            "action": self.action,
+            "status": self.status,
+            "total": len(self.device_ids),
+            "completed": len(self.results),
+            "succeeded": succeeded,
+            "failed": len(self.results) - succeeded,
+            "concurrency": self.concurrency,
+            "stagger_ms": int(self.stagger_seconds * 1000),
+            "created_by": self.created_by,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    async def events(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield results already collected, then live results until the job ends"""
+        # Snapshot and subscribe without yielding in between, so nothing is missed or repeated
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        collected = list(self.results)
+        finished = self.finished_at is not None
+        try:
+            for result in collected:
+                yield {"type": "device_result", "job_id": self.id, **result}
+            if finished:
+                yield {"type": "job_complete", **self.summary()}
+                return
+
+            while True:
+                event = await queue.get()
+                yield event
+                if event["type"] == "job_complete":
+                    return
+        finally:
+            self._subscribers.remove(queue)
+
+
+class BulkPowerManager:
+    """Runs bulk power jobs and keeps the most recent ones for inspection"""
+
+    def __init__(self, max_jobs: int = 100):
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, BulkPowerJob]" = OrderedDict()
+
+    def start_job(self, action: str, device_ids: List[str], executor: PowerExecutor,
+                  created_by: str, concurrency: int = 10, stagger_seconds: float = 0.0,
+                  on_complete: Optional[JobCallback] = None) -> BulkPowerJob:
+        """Create a job and start running it in the background"""
+        job = BulkPowerJob(action, device_ids, concurrency, stagger_seconds, created_by)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+
+        job.task = asyncio.create_task(self._run(job, executor, on_complete))
+        return job
+
+    def get_job(self, job_id: str) -> Optional[BulkPowerJob]:
+        return self.jobs.get(job_id)
+
+    async def _run_device(self, job: BulkPowerJob, device_id: str, executor: PowerExecutor,
+                          semaphore: asyncio.Semaphore):
+        started = time.monotonic()
+        try:
+            outcome = await executor(device_id)
+        except Exception as e:
+            logger.error(f"Bulk power {job.action} failed for device {device_id}: {str(e)}")
+            outcome = {"success": False, "error": str(e)}
+        finally:
+            semaphore.release()
+
+        job.add_result({
+            "device_id": device_id,
+            "success": bool(outcome.get("success")),
+            "error": outcome.get("error"),
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
+    async def _run(self, job: BulkPowerJob, executor: PowerExecutor, on_complete: Optional[JobCallback]):
+        job.status = "running"
+        semaphore = asyncio.Semaphore(job.concurrency)
+        tasks = []
+        last_start = None
+
+        try:
+            for device_id in job.device_ids:
+                await semaphore.acquire()
+                # Space out starts so a rack does not power up all at once
+                if last_start is not None and job.stagger_seconds:
+                    delay = last_start + job.stagger_seconds - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                last_start = time.monotonic()
+                tasks.append(asyncio.create_task(self._run_device(job, device_id, executor, semaphore)))
+
+            await asyncio.gather(*tasks)
+            job.finish("completed")
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            job.finish("cancelled")
+            raise
+        finally:
+            if on_complete:
+                try:
+                    await on_complete(job)
+                except Exception as e:
+                    logger.error(f"Bulk power job {job.id} completion hook failed: {str(e)}")
+
+    async def cancel_job(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if not job or not job.task or job.task.done():
+            return False
+        job.task.cancel()
+        try:
+            await job.task
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    async def cleanup(self):
+        for job in self.jobs.values():
+            if job.task and not job.task.done():
+                job.task.cancel()
+        self.jobs.clear()
+
+
+# Global bulk power manager instance
+bulk_power_manager = BulkPowerManager()
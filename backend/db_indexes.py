@@ -0,0 +1,204 @@
+"""
+Database Index Manager
+Declares the MongoDB indexes the API's queries rely on, creates them at startup and checks query plans
+
+Usage:
+    python db_indexes.py            # create missing indexes
+    python db_indexes.py --verify   # also explain the hot queries; exits 1 on a collection scan
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from log_queries import LOG_SORT, EXPORT_SORT
+
+logger = logging.getLogger(__name__)
+
+load_dotenv(Path(__file__).parent / '.env')
+
+# Database connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ.get('DB_NAME', 'test_database')]
+
+# Index declarations per collection. Names are left to MongoDB so indexes
+# created by earlier versions of init_admin.py are recognised as the same.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "devices": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("tags", ASCENDING)]),
+        IndexModel([("ip_address", ASCENDING)]),
+    ],
+    "user_device_permissions": [
+        # Also serves lookups by user_id alone
+        IndexModel([("user_id", ASCENDING), ("device_id", ASCENDING)], unique=True),
+        IndexModel([("device_id", ASCENDING)]),
+    ],
+    # Log indexes end in (timestamp, id) to serve the keyset pagination of log_queries.py
+    "audit_log": [
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("device_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("action", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "power_logs": [
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("device_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "input_logs": [
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("device_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ],
+}
+
+PROBE_TIME = datetime(2000, 1, 1)
+
+# The hot queries of server.py and auth.py as (collection, filter, sort)
+QUERY_PLANS = [
+    ("users", {"username": "probe"}, None),
+    ("users", {"id": "probe"}, None),
+    ("users", {"email": "probe"}, None),
+    ("devices", {"id": "probe"}, None),
+    ("devices", {"id": {"$in": ["probe-1", "probe-2"]}}, None),
+    ("devices", {"tags": "probe"}, None),
+    ("user_device_permissions", {"user_id": "probe", "device_id": "probe"}, None),
+    ("user_device_permissions", {"user_id": "probe"}, None),
+    ("user_device_permissions", {"device_id": "probe"}, None),
+    ("audit_log", {}, LOG_SORT),
+    ("audit_log", {"user_id": "probe"}, LOG_SORT),
+    ("audit_log", {"device_id": "probe"}, LOG_SORT),
+    ("audit_log", {"action": "probe"}, LOG_SORT),
+    ("audit_log", {"timestamp": {"$lte": PROBE_TIME},
+                   "$or": [{"timestamp": {"$lt": PROBE_TIME}}, {"id": {"$lt": "probe"}}]}, LOG_SORT),
+    ("power_logs", {"device_id": {"$in": ["probe-1", "probe-2"]}}, LOG_SORT),
+    ("power_logs", {"timestamp": {"$gte": PROBE_TIME, "$lt": PROBE_TIME}}, LOG_SORT),
+    ("input_logs", {"device_id": {"$in": ["probe-1", "probe-2"]}}, LOG_SORT),
+    ("input_logs", {"device_id": "probe", "timestamp": {"$gte": PROBE_TIME}}, LOG_SORT),
+    ("input_logs", {"timestamp": {"$gte": PROBE_TIME, "$lt": PROBE_TIME}}, LOG_SORT),
+    # Exports read the same indexes backwards
+    ("input_logs", {"timestamp": {"$gte": PROBE_TIME, "$lt": PROBE_TIME}}, EXPORT_SORT),
+]
+
+# Index conflicts: same keys with other options (85) or same name with other keys (86)
+INDEX_CONFLICT_CODES = (85, 86)
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Every stage name in an explain plan tree"""
+    stages = [plan.get("stage", "")]
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+class IndexManager:
+    """Creates the declared indexes and checks that the hot queries use them"""
+
+    def __init__(self, db):
+        self.db = db
+        self.ready = False
+        self.stats = {"collections": 0, "conflicts": 0, "failures": 0, "seconds": 0.0}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Build missing indexes in the background; the API does not wait for them"""
+        if os.getenv("DB_ENSURE_INDEXES", "true").lower() in ("1", "true", "yes"):
+            self._task = asyncio.create_task(self.ensure_indexes())
+
+    async def ensure_indexes(self) -> bool:
+        """Create every declared index; existing identical indexes are left alone"""
+        started = time.monotonic()
+        ok = True
+        for collection, indexes in INDEXES.items():
+            try:
+                await self.db[collection].create_indexes(indexes)
+                self.stats["collections"] += 1
+            except OperationFailure as e:
+                ok = False
+                if e.code in INDEX_CONFLICT_CODES:
+                    self.stats["conflicts"] += 1
+                    logger.warning(f"Index on {collection} conflicts with an existing one, drop it to upgrade: {e}")
+                else:
+                    self.stats["failures"] += 1
+                    logger.error(f"Creating indexes on {collection} failed: {str(e)}")
+            except Exception as e:
+                ok = False
+                self.stats["failures"] += 1
+                logger.error(f"Creating indexes on {collection} failed: {str(e)}")
+
+        self.stats["seconds"] = round(time.monotonic() - started, 2)
+        self.ready = ok
+        logger.info(f"Database indexes ensured in {self.stats['seconds']}s")
+        return ok
+
+    async def verify_query_plans(self) -> List[Dict[str, Any]]:
+        """Explain every hot query and return the ones that scan a collection or sort in memory"""
+        problems = []
+        for collection, query, sort in QUERY_PLANS:
+            cursor = self.db[collection].find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            explain = await cursor.explain()
+            winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+            stages = _plan_stages(winning_plan)
+            if "COLLSCAN" in stages or (sort and "SORT" in stages):
+                problems.append({"collection": collection, "query": query, "sort": sort, "stages": stages})
+        return problems
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "building": bool(self._task and not self._task.done()), **self.stats}
+
+    async def cleanup(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# Global index manager instance
+index_manager = IndexManager(db)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Create and verify MongoDB indexes")
+    parser.add_argument("--verify", action="store_true", help="fail if a hot query scans a collection")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    try:
+        if not await index_manager.ensure_indexes():
+            sys.exit(1)
+        if args.verify:
+            problems = await index_manager.verify_query_plans()
+            for problem in problems:
+                print(f"Unindexed query on {problem['collection']}: {problem['query']} "
+                      f"sort={problem['sort']} stages={problem['stages']}")
+            if problems:
+                sys.exit(1)
+            print(f"All {len(QUERY_PLANS)} queries use an index")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+"""
+Device Credentials Module
+Encrypts the PiKVM login kept with each device document so it can be re-registered after a restart
+"""
+
+import base64
+import hashlib
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USERNAME = "admin"
+DEFAULT_PASSWORD = "admin"
+
+
+class DeviceCredentialCipher:
+    """Fernet encryption of device passwords at rest.
+
+    The key is read from ``DEVICE_CREDENTIALS_KEY`` (generate one with
+    ``Fernet.generate_key()``). Without it a key is derived from
+    ``JWT_SECRET_KEY``, so a deployment that only sets the JWT secret still
+    never stores passwords in the clear; a dedicated key can be rotated
+    without logging everyone out. Only the password is encrypted, the
+    username stays readable.
+    """
+
+    def __init__(self, key: str = None):
+        key = key or os.getenv("DEVICE_CREDENTIALS_KEY")
+        if not key:
+            logger.warning("DEVICE_CREDENTIALS_KEY not set; deriving the device credential key from JWT_SECRET_KEY")
+            secret = os.getenv("JWT_SECRET_KEY", "your-super-secret-key-change-in-production")
+            key = base64.urlsafe_b64encode(hashlib.sha256(b"device-credentials:" + secret.encode()).digest())
+        self._fernet = Fernet(key)
+
+    def seal(self, username: str, password: str) -> Dict[str, str]:
+        """The ``pikvm_credentials`` value to store for a device"""
+        return {
+            "username": username,
+            "password_encrypted": self._fernet.encrypt(password.encode()).decode()
+        }
+
+    def open(self, credentials: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+        """Username and password from a stored ``pikvm_credentials`` value"""
+        credentials = credentials or {}
+        username = credentials.get("username", DEFAULT_USERNAME)
+        if "password_encrypted" not in credentials:
+            # Written before passwords were encrypted
+            return username, credentials.get("password", DEFAULT_PASSWORD)
+        try:
+            return username, self._fernet.decrypt(credentials["password_encrypted"].encode()).decode()
+        except InvalidToken:
+            logger.error("Stored device password cannot be decrypted with the configured key; using the default")
+            return username, DEFAULT_PASSWORD
+
+
+# Global device credential cipher instance
+device_credentials = DeviceCredentialCipher()
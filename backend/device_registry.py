@@ -0,0 +1,225 @@
+"""
+Device Registry Loader
+Rebuilds the in-memory PiKVM device registries from MongoDB at startup and on demand
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from pikvm_integration import superducks_manager
+from pikvm_hardware import pikvm_hardware_manager, PiKVMDevice, PiKVMConnectionStatus
+from pikvm_driver import pikvm_drivers
+from device_sharding import device_sharding, HashRing
+from device_credentials import device_credentials
+from video_streaming import video_stream_manager
+
+logger = logging.getLogger(__name__)
+
+# Database connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ.get('DB_NAME', 'test_database')]
+
+HARDWARE = "hardware"
+SUPERDUCKS = "superducks"
+
+# How long an id that is not in the database is remembered, to avoid repeated lookups
+MISSING_TTL_SECONDS = 30
+
+
+class DeviceRegistryLoader:
+    """Registers devices stored in MongoDB with the device managers.
+
+    Loading streams the devices collection and registers every document
+    without contacting the device, so the API is ready immediately.
+    Connection tests then run in the background through a fixed pool of
+    probe workers, for the devices this worker owns. Devices that are
+    referenced before the loader reached them are hydrated individually on
+    first use.
+    """
+
+    def __init__(self, probe_concurrency: int = None):
+        self.probe_concurrency = probe_concurrency or int(os.getenv("DEVICE_PROBE_CONCURRENCY", "20"))
+        self.loading = False
+        self.stats = {"loaded": 0, "hydrated": 0, "probed": 0, "probe_failures": 0}
+
+        self._load_task: Optional[asyncio.Task] = None
+        self._probe_queue: Optional[asyncio.Queue] = None
+        self._probe_workers = []
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._missing: Dict[str, float] = {}
+
+    def device_kind(self, device_id: str) -> Optional[str]:
+        if device_id in pikvm_hardware_manager.devices:
+            return HARDWARE
+        if device_id in superducks_manager.devices:
+            return SUPERDUCKS
+        return None
+
+    def register(self, doc: Dict[str, Any]) -> str:
+        """Register a device document with the manager that serves it"""
+        username, password = device_credentials.open(doc.get("pikvm_credentials"))
+
+        if doc.get("hardware_type") == "real_pikvm":
+            pikvm_hardware_manager.register_device(PiKVMDevice(
+                id=doc["id"],
+                name=doc.get("name", doc["id"]),
+                ip_address=doc["ip_address"],
+                port=doc.get("port", 80),
+                username=username,
+                password=password,
+                use_https=doc.get("use_https", False),
+                status=PiKVMConnectionStatus.DISCONNECTED,
+                capabilities=doc.get("capabilities") or {}
+            ))
+            return HARDWARE
+
+        superducks_manager.add_device(doc["id"], doc["ip_address"], username, password)
+        return SUPERDUCKS
+
+    async def start(self):
+        """Start loading the registry in the background"""
+        self._probe_queue = asyncio.Queue()
+        self._probe_workers = [
+            asyncio.create_task(self._probe_worker()) for _ in range(self.probe_concurrency)
+        ]
+        self._load_task = asyncio.create_task(self._load_all())
+
+    async def _load_all(self):
+        self.loading = True
+        started = time.monotonic()
+        try:
+            cursor = db.devices.find({}, {"_id": 0, "last_status": 0}).batch_size(500)
+            async for doc in cursor:
+                if "id" not in doc or "ip_address" not in doc:
+                    continue
+                if self.device_kind(doc["id"]) is None:
+                    kind = self.register(doc)
+                    self.stats["loaded"] += 1
+                    if device_sharding.owns(doc["id"]):
+                        self._probe_queue.put_nowait((doc["id"], kind))
+            logger.info(f"Loaded {self.stats['loaded']} devices from database in {time.monotonic() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Device registry load failed: {str(e)}")
+        finally:
+            self.loading = False
+
+    async def _probe_worker(self):
+        while True:
+            device_id, kind = await self._probe_queue.get()
+            try:
+                if await self._probe(device_id, kind):
+                    self.stats["probed"] += 1
+                else:
+                    self.stats["probe_failures"] += 1
+            except Exception as e:
+                self.stats["probe_failures"] += 1
+                logger.warning(f"Background connection test failed for device {device_id}: {str(e)}")
+
+    async def _probe(self, device_id: str, kind: str) -> bool:
+        if kind == HARDWARE:
+            device = pikvm_hardware_manager.devices.get(device_id)
+            return bool(device) and await pikvm_hardware_manager.test_connection(device)
+
+        await superducks_manager._update_device_status(device_id)
+        return True
+
+    async def ensure_device(self, device_id: str) -> Optional[str]:
+        """Make sure a device is registered, loading it from the database if needed.
+
+        Returns the kind of manager serving the device, or None if it does not exist.
+        """
+        kind = self.device_kind(device_id)
+        if kind is not None:
+            return kind
+
+        missing_since = self._missing.get(device_id)
+        if missing_since and time.monotonic() - missing_since < MISSING_TTL_SECONDS:
+            return None
+
+        # Concurrent callers for the same device share one lookup
+        inflight = self._inflight.get(device_id)
+        if inflight is not None:
+            try:
+                # Shielded so a waiter that gives up does not cancel the lookup for the others
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+            # The caller doing the lookup was cancelled; look the device up ourselves
+            return await self.ensure_device(device_id)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[device_id] = future
+        try:
+            doc = await db.devices.find_one({"id": device_id}, {"_id": 0, "last_status": 0})
+            if doc and "ip_address" in doc:
+                kind = self.device_kind(device_id) or self.register(doc)
+                self.stats["hydrated"] += 1
+                self._missing.pop(device_id, None)
+                if self._probe_queue is not None and device_sharding.owns(device_id):
+                    self._probe_queue.put_nowait((device_id, kind))
+            else:
+                self._missing[device_id] = time.monotonic()
+            future.set_result(kind)
+            return kind
+        except Exception as e:
+            logger.error(f"Failed to hydrate device {device_id}: {str(e)}")
+            future.set_result(None)
+            return None
+        finally:
+            if not future.done():
+                # Cancelled mid-lookup: wake the waiters so they retry instead of hanging
+                future.cancel()
+            del self._inflight[device_id]
+
+    async def rebalance(self, previous: HashRing, ring: HashRing):
+        """Probe the devices this worker took over and close the HID channels of those it handed off"""
+        worker_id = device_sharding.bus.worker_id
+        if self._probe_queue is not None:
+            for device_id in [*superducks_manager.devices, *pikvm_hardware_manager.devices]:
+                key = device_sharding.owner_key(device_id)
+                if ring.owner(key) == worker_id and previous.owner(key) != worker_id:
+                    self._probe_queue.put_nowait((device_id, self.device_kind(device_id)))
+
+        for driver in list(pikvm_drivers.drivers.values()):
+            if not driver.device_ids:
+                continue
+            key = device_sharding.owner_key(min(driver.device_ids))
+            if previous.owner(key) == worker_id and ring.owner(key) != worker_id:
+                await driver.hid.suspend()
+
+    async def forget(self, device_id: str):
+        """Remove a deleted device from every manager"""
+        await superducks_manager.remove_device(device_id)
+        await pikvm_hardware_manager.remove_device(device_id)
+        self._missing[device_id] = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "loading": self.loading,
+            "registered": len(superducks_manager.devices) + len(pikvm_hardware_manager.devices),
+            "probe_backlog": self._probe_queue.qsize() if self._probe_queue else 0,
+            **self.stats
+        }
+
+    async def cleanup(self):
+        tasks = self._probe_workers + ([self._load_task] if self._load_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._probe_workers = []
+        self._load_task = None
+
+
+# Global device registry loader instance
+device_registry = DeviceRegistryLoader()
+superducks_manager.hydrator = device_registry.ensure_device
+pikvm_hardware_manager.hydrator = device_registry.ensure_device
+video_stream_manager.hydrator = device_registry.ensure_device
+device_sharding.add_listener(device_registry.rebalance)
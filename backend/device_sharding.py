@@ -0,0 +1,259 @@
+"""
+Device Sharding Module
+Assigns every device to one worker process by consistent hashing and forwards device commands to that worker
+"""
+
+import asyncio
+import bisect
+import contextvars
+import hashlib
+import itertools
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from event_bus import event_bus, EventBus
+
+logger = logging.getLogger(__name__)
+
+# Event bus channels: forwarded calls keyed by the owning worker, and their answers keyed by the caller
+CALLS_CHANNEL = "shard_calls"
+REPLIES_CHANNEL = "shard_replies"
+
+# Set while a call forwarded by another worker runs, so it is never forwarded again
+_serving = contextvars.ContextVar("device_sharding_serving", default=False)
+
+Listener = Callable[["HashRing", "HashRing"], Awaitable[None]]
+
+
+class ShardCallError(Exception):
+    """A forwarded call got no answer from the worker owning the device"""
+
+
+class _OwnerGone(ShardCallError):
+    """The owner left before answering; the call is retried with the new owner"""
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring of worker ids.
+
+    Every worker gets ``replicas`` points on the ring and a device belongs
+    to the first point after the hash of its id. Adding or removing a
+    worker only moves the devices between it and its neighbours.
+    """
+
+    def __init__(self, members: List[str], replicas: int):
+        self.members = sorted(members, key=int)
+        points = sorted((_hash(f"{member}#{replica}"), member)
+                        for member in self.members for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class DeviceSharding:
+    """Splits the devices between the workers so each device is driven by one of them.
+
+    Only the owner of a device runs its heartbeat, capture loop and HID
+    channel. Other workers ``forward`` commands for the device to the owner
+    over the event bus and wait for its answer; handlers for those calls
+    are registered by name with ``register``. The ring follows the event
+    bus members: once they have been stable for ``SHARD_REBALANCE_DELAY``
+    seconds it is rebuilt, calls waiting on departed workers are retried
+    with the new owner, and the rebalance listeners hand over whatever
+    moved. With a single worker every device is local.
+    """
+
+    def __init__(self, bus: EventBus, replicas: int = None, call_timeout: float = None,
+                 settle_delay: float = None):
+        self.bus = bus
+        self.replicas = replicas or int(os.getenv("SHARD_VIRTUAL_NODES", "64"))
+        self.call_timeout = call_timeout or float(os.getenv("SHARD_CALL_TIMEOUT", "15"))
+        self.settle_delay = settle_delay if settle_delay is not None else \
+            float(os.getenv("SHARD_REBALANCE_DELAY", "2"))
+        self.join_timeout = float(os.getenv("SHARD_JOIN_TIMEOUT", "3"))
+        self.ring = HashRing([bus.worker_id], self.replicas)
+        self.stats = {"forwarded": 0, "served": 0, "retries": 0, "call_failures": 0,
+                      "handler_errors": 0, "rebalances": 0}
+
+        self._handlers: Dict[str, Callable[..., Awaitable[Any]]] = {}
+        self._boxes: Dict[str, str] = {}
+        self._listeners: List[Listener] = []
+        self._pending: Dict[int, Tuple[asyncio.Future, str]] = {}
+        self._call_ids = itertools.count(1)
+        self._tasks: set = set()
+        self._rebalance_task: Optional[asyncio.Task] = None
+
+        bus.subscribe(CALLS_CHANNEL, self._serve)
+        bus.subscribe(REPLIES_CHANNEL, self._answer)
+        bus.on_members(self._members_changed)
+        bus.set_interest(CALLS_CHANNEL, bus.worker_id, True)
+        bus.set_interest(REPLIES_CHANNEL, bus.worker_id, True)
+
+    # --- ownership ---
+
+    def bind(self, device_id: str, box: str):
+        """Route a device by the PiKVM box it runs on, so all ids of one box share an owner"""
+        self._boxes[device_id] = box
+
+    def unbind(self, device_id: str):
+        self._boxes.pop(device_id, None)
+
+    def owner_key(self, device_id: str) -> str:
+        """The key a device is placed on the ring by"""
+        return self._boxes.get(device_id, device_id)
+
+    def owner(self, device_id: str) -> str:
+        return self.ring.owner(self.owner_key(device_id))
+
+    def owns(self, device_id: str) -> bool:
+        return self.owner(device_id) == self.bus.worker_id
+
+    def should_forward(self, device_id: str) -> bool:
+        """Whether a command for a device has to run on another worker"""
+        return not _serving.get() and not self.owns(device_id)
+
+    def register(self, name: str, handler: Callable[..., Awaitable[Any]]):
+        """Make a coroutine callable by name from other workers"""
+        self._handlers[name] = handler
+
+    def add_listener(self, listener: Listener):
+        """Register a coroutine called with the previous and the new ring after a rebalance"""
+        self._listeners.append(listener)
+
+    async def start(self):
+        """Take the current event bus members as the ring before any device is claimed"""
+        if not await self.bus.wait_ready(self.join_timeout):
+            logger.warning("Event bus not ready; owning every device until the other workers are known")
+        self.ring = HashRing(self.bus.members, self.replicas)
+
+    # --- forwarded calls ---
+
+    async def forward(self, name: str, device_id: str, *args) -> Any:
+        """Run a registered handler on the worker owning a device and return its result"""
+        for _ in range(2):
+            target = self.owner(device_id)
+            if target == self.bus.worker_id:
+                # Ownership came here while retrying
+                return await self._run(name, list(args))
+
+            call_id = next(self._call_ids)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[call_id] = (future, target)
+            self.stats["forwarded"] += 1
+            self.bus.publish(CALLS_CHANNEL, {
+                "id": call_id, "to": target, "from": self.bus.worker_id, "name": name, "args": list(args)
+            }, key=target)
+            try:
+                return await asyncio.wait_for(future, timeout=self.call_timeout)
+            except _OwnerGone:
+                self.stats["retries"] += 1
+            except asyncio.TimeoutError:
+                self.stats["call_failures"] += 1
+                raise ShardCallError(f"Worker {target} did not answer {name} for device {device_id}")
+            finally:
+                self._pending.pop(call_id, None)
+
+        self.stats["call_failures"] += 1
+        raise ShardCallError(f"No worker answered {name} for device {device_id}")
+
+    async def _run(self, name: str, args: List[Any]) -> Any:
+        handler = self._handlers.get(name)
+        if handler is None:
+            raise ShardCallError(f"Unknown sharded call {name}")
+        token = _serving.set(True)
+        try:
+            return await handler(*args)
+        finally:
+            _serving.reset(token)
+
+    def _serve(self, call: Dict[str, Any], key: Optional[str] = None):
+        # The broker sees every keyed message; only the addressed worker answers
+        if call["to"] != self.bus.worker_id:
+            return
+        # Handlers talk to devices, so they must not hold up the event bus reader
+        task = asyncio.create_task(self._execute(call))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, call: Dict[str, Any]):
+        reply: Dict[str, Any] = {"id": call["id"], "to": call["from"]}
+        try:
+            reply["result"] = await self._run(call["name"], call["args"])
+            self.stats["served"] += 1
+        except Exception as e:
+            self.stats["handler_errors"] += 1
+            logger.error(f"Forwarded call {call['name']} failed: {str(e)}")
+            reply["error"] = str(e)
+        self.bus.publish(REPLIES_CHANNEL, reply, key=call["from"])
+
+    def _answer(self, reply: Dict[str, Any], key: Optional[str] = None):
+        if reply["to"] != self.bus.worker_id:
+            return
+        pending = self._pending.get(reply["id"])
+        if pending is None or pending[0].done():
+            return
+        future = pending[0]
+        if "error" in reply:
+            future.set_exception(ShardCallError(reply["error"]))
+        else:
+            future.set_result(reply.get("result"))
+
+    # --- rebalancing ---
+
+    def _members_changed(self, members: List[str]):
+        # A running rebalance picks up the newest member list when it wakes up
+        if self._rebalance_task is None or self._rebalance_task.done():
+            self._rebalance_task = asyncio.create_task(self._rebalance())
+
+    async def _rebalance(self):
+        # Wait for the members to settle, so a broker failover does not move every device twice
+        while True:
+            await asyncio.sleep(self.settle_delay)
+            members = sorted(self.bus.members, key=int)
+            if members == self.ring.members:
+                return
+
+            previous, self.ring = self.ring, HashRing(members, self.replicas)
+            self.stats["rebalances"] += 1
+            logger.info(f"Worker {self.bus.worker_id} rebalanced devices across workers {members}")
+
+            for future, target in self._pending.values():
+                if target not in members and not future.done():
+                    future.set_exception(_OwnerGone(f"Worker {target} left"))
+
+            for listener in self._listeners:
+                try:
+                    await listener(previous, self.ring)
+                except Exception as e:
+                    logger.error(f"Rebalance listener failed: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.bus.worker_id,
+            "members": self.ring.members,
+            "virtual_nodes": self.replicas,
+            "pending_calls": len(self._pending),
+            **self.stats
+        }
+
+    async def cleanup(self):
+        tasks = list(self._tasks) + ([self._rebalance_task] if self._rebalance_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._rebalance_task = None
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.cancel()
+
+
+# Global device sharding instance
+device_sharding = DeviceSharding(event_bus)
@@ -0,0 +1,196 @@
+"""
+Device State Module
+Keeps the last persisted status of every device in memory and only writes real changes to MongoDB
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Database connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ.get('DB_NAME', 'test_database')]
+
+ONLINE = "online"
+OFFLINE = "offline"
+
+# Parts of a PiKVM status report that change on every poll; telemetry keeps those
+VOLATILE_STATUS_KEYS = ("timestamp", "error")
+VOLATILE_HARDWARE_KEYS = ("health",)
+
+
+def _fingerprint(details: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Digest of the stable part of a status report"""
+    if not details:
+        return None
+    stable = {key: value for key, value in details.items() if key not in VOLATILE_STATUS_KEYS}
+    if isinstance(stable.get("hardware"), dict):
+        stable["hardware"] = {key: value for key, value in stable["hardware"].items()
+                              if key not in VOLATILE_HARDWARE_KEYS}
+    encoded = json.dumps(stable, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()
+
+
+class DeviceStateCache:
+    """Writes device status on transitions instead of on every heartbeat.
+
+    ``report`` compares a heartbeat with the state last written for the
+    device. A status transition, or a change in the stable part of the
+    status details, is written at once and handed to the transition
+    listeners. Anything else only moves ``last_seen``, which is kept in
+    memory and written for all devices with one ``bulk_write`` every
+    ``DEVICE_LAST_SEEN_FLUSH_INTERVAL`` seconds. A device is only reported
+    offline after ``DEVICE_OFFLINE_AFTER`` failed heartbeats in a row.
+    """
+
+    def __init__(self, db, flush_interval: float = None, offline_after: int = None):
+        self.db = db
+        self.flush_interval = flush_interval or float(os.getenv("DEVICE_LAST_SEEN_FLUSH_INTERVAL", "30"))
+        self.offline_after = offline_after or int(os.getenv("DEVICE_OFFLINE_AFTER", "2"))
+        self.stats = {"reports": 0, "writes": 0, "suppressed": 0, "transitions": 0,
+                      "last_seen_flushes": 0, "last_seen_written": 0, "write_failures": 0}
+
+        self._status: Dict[str, str] = {}
+        self._fingerprints: Dict[str, Optional[str]] = {}
+        self._failures: Dict[str, int] = {}
+        self._last_seen: Dict[str, datetime] = {}
+        self._listeners: List[Callable[[Dict[str, Any]], Awaitable[None]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """Register a coroutine called with every status transition"""
+        self._listeners.append(listener)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush_last_seen()
+
+    def get_status(self, device_id: str) -> Optional[str]:
+        return self._status.get(device_id)
+
+    async def report(self, device_id: str, online: bool, details: Optional[Dict[str, Any]] = None):
+        """Record one heartbeat of a device, writing only what changed"""
+        self.stats["reports"] += 1
+        now = datetime.utcnow()
+
+        if online:
+            self._failures.pop(device_id, None)
+            status = ONLINE
+            self._last_seen[device_id] = now
+        else:
+            failures = self._failures.get(device_id, 0) + 1
+            self._failures[device_id] = failures
+            # A single lost heartbeat of a known-online device is not a transition yet
+            if self._status.get(device_id) == ONLINE and failures < self.offline_after:
+                self.stats["suppressed"] += 1
+                return
+            status = OFFLINE
+
+        previous = self._status.get(device_id)
+        changes: Dict[str, Any] = {}
+        if status != previous:
+            changes["status"] = status
+            changes["status_changed_at"] = now
+        if details is not None and status == ONLINE:
+            fingerprint = _fingerprint(details)
+            if fingerprint != self._fingerprints.get(device_id):
+                changes["last_status"] = details
+        if not changes:
+            self.stats["suppressed"] += 1
+            return
+
+        if online:
+            # last_seen rides along with the write that happens anyway
+            changes["last_seen"] = self._last_seen.pop(device_id)
+        try:
+            await self.db.devices.update_one({"id": device_id}, {"$set": changes})
+        except Exception as e:
+            self.stats["write_failures"] += 1
+            logger.warning(f"Failed to persist status of device {device_id}: {str(e)}")
+            return
+
+        self.stats["writes"] += 1
+        self._status[device_id] = status
+        if "last_status" in changes:
+            self._fingerprints[device_id] = _fingerprint(details)
+        if "status" in changes:
+            await self._publish(device_id, status, previous, now)
+
+    def note_status(self, device_id: str, status: str):
+        """Adopt a status that was written to the database elsewhere"""
+        self._status[device_id] = status
+        self._failures.pop(device_id, None)
+
+    async def _publish(self, device_id: str, status: str, previous: Optional[str], timestamp: datetime):
+        if previous is None:
+            # First sighting after a restart; the stored status may well be the same
+            return
+        self.stats["transitions"] += 1
+        transition = {"device_id": device_id, "status": status, "previous": previous, "timestamp": timestamp}
+        for listener in self._listeners:
+            try:
+                await listener(transition)
+            except Exception as e:
+                logger.warning(f"Device status listener failed: {str(e)}")
+
+    async def flush_last_seen(self) -> int:
+        """Write every pending last_seen with one bulk write"""
+        if not self._last_seen:
+            return 0
+        pending, self._last_seen = self._last_seen, {}
+        started = time.perf_counter()
+        try:
+            result = await self.db.devices.bulk_write(
+                [UpdateOne({"id": device_id}, {"$max": {"last_seen": seen}}) for device_id, seen in pending.items()],
+                ordered=False
+            )
+            self.stats["last_seen_written"] += result.matched_count
+        except Exception as e:
+            self.stats["write_failures"] += 1
+            logger.warning(f"Failed to write last_seen of {len(pending)} devices: {str(e)}")
+            # Keep newer values that arrived meanwhile, retry the rest next time
+            for device_id, seen in pending.items():
+                self._last_seen.setdefault(device_id, seen)
+            return 0
+        self.stats["last_seen_flushes"] += 1
+        logger.debug(f"Wrote last_seen of {len(pending)} devices in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return len(pending)
+
+    def forget(self, device_id: str):
+        for state in (self._status, self._fingerprints, self._failures, self._last_seen):
+            state.pop(device_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "devices": len(self._status),
+            "online": sum(1 for status in self._status.values() if status == ONLINE),
+            "last_seen_pending": len(self._last_seen),
+            "flush_interval": self.flush_interval,
+            **self.stats
+        }
+
+    async def cleanup(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush_last_seen()
+
+
+# Global device state cache instance
+device_state = DeviceStateCache(db)
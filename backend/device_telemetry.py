@@ -0,0 +1,275 @@
+"""
+Device Telemetry Module
+Polls the PiKVM hardware health of every device and keeps it as a per-device time series
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+
+from pikvm_driver import pikvm_drivers, PiKVMDriver, PiKVMError
+from device_state import device_state
+from event_bus import event_bus
+from device_sharding import device_sharding
+
+logger = logging.getLogger(__name__)
+
+# Database connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ.get('DB_NAME', 'test_database')]
+
+COLLECTION = "device_telemetry"
+
+# The numeric fields of the Device model that telemetry fills in
+TELEMETRY_FIELDS = ["cpu_usage", "memory_usage", "temperature"]
+
+# Event bus channel carrying each worker's readings to the other workers
+TELEMETRY_CHANNEL = "telemetry"
+
+
+def _number(value: Any) -> Optional[float]:
+    return round(float(value), 1) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def extract_telemetry(hw: Dict[str, Any]) -> Dict[str, Any]:
+    """Numeric health values from a PiKVM /api/hw result.
+
+    Older kvmd versions only report the temperature; the missing fields are
+    left out rather than stored as zero.
+    """
+    health = (hw or {}).get("health") or {}
+    mem = health.get("mem") or {}
+
+    values = {
+        "temperature": _number((health.get("temp") or {}).get("cpu")),
+        "cpu_usage": _number((health.get("cpu") or {}).get("percent")),
+        "memory_usage": _number(mem.get("percent")),
+    }
+    if values["memory_usage"] is None and mem.get("total") and mem.get("available") is not None:
+        values["memory_usage"] = _number(100 * (1 - mem["available"] / mem["total"]))
+
+    telemetry = {field: value for field, value in values.items() if value is not None}
+    throttling = health.get("throttling") or {}
+    if "raw_flags" in throttling:
+        telemetry["throttled"] = bool(throttling["raw_flags"])
+    return telemetry
+
+
+class DeviceTelemetryCollector:
+    """Collects hardware health from every registered PiKVM on a fixed interval.
+
+    Each round asks every driver in the pool for ``/api/hw`` once, at most
+    ``concurrency`` at a time, and attributes the reading to all device ids
+    that share that box. The latest values stay in memory for device
+    listings; every round is written to ``device_telemetry`` with one
+    ``insert_many``. That collection is a time series keyed by device where
+    MongoDB supports it and expires after ``TELEMETRY_RETENTION_DAYS``.
+    Each poll also counts as a heartbeat of its devices.
+
+    Each worker only polls the boxes it owns (a box shared by several
+    device ids belongs to the owner of the lowest id) and sends its
+    readings to the other workers over the event bus, so every box is
+    polled once per round however many workers run.
+    """
+
+    def __init__(self, db, interval: float = None, concurrency: int = None):
+        self.db = db
+        self.interval = interval or float(os.getenv("TELEMETRY_INTERVAL", "30"))
+        self.concurrency = concurrency or int(os.getenv("TELEMETRY_CONCURRENCY", "16"))
+        self.timeout = float(os.getenv("TELEMETRY_TIMEOUT", "5"))
+        self.retention = timedelta(days=float(os.getenv("TELEMETRY_RETENTION_DAYS", "7")))
+        self.hot_temperature = float(os.getenv("TELEMETRY_HOT_TEMPERATURE", "75"))
+        self.latest: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"rounds": 0, "polled": 0, "failures": 0, "stored": 0, "write_failures": 0,
+                      "late": 0, "owned_drivers": 0, "timeseries": False, "last_round_ms": 0.0}
+
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Create the collection and start polling in the background"""
+        await self._ensure_collection()
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def _ensure_collection(self):
+        ttl = int(self.retention.total_seconds())
+        try:
+            existing = await self.db.list_collection_names()
+            if COLLECTION not in existing:
+                await self.db.create_collection(
+                    COLLECTION,
+                    timeseries={"timeField": "timestamp", "metaField": "device_id", "granularity": "seconds"},
+                    expireAfterSeconds=ttl
+                )
+                self.stats["timeseries"] = True
+            else:
+                options = await self.db[COLLECTION].options()
+                self.stats["timeseries"] = "timeseries" in options
+        except Exception as e:
+            logger.info(f"Time-series collection unavailable, using a TTL index for device telemetry: {str(e)}")
+
+        try:
+            await self.db[COLLECTION].create_index([("device_id", ASCENDING), ("timestamp", ASCENDING)])
+            if not self.stats["timeseries"]:
+                await self.db[COLLECTION].create_index([("timestamp", ASCENDING)], expireAfterSeconds=ttl)
+        except Exception as e:
+            logger.warning(f"Could not create device telemetry indexes: {str(e)}")
+
+    async def _run(self):
+        next_at = time.monotonic()
+        while True:
+            await asyncio.sleep(max(next_at - time.monotonic(), 0))
+            try:
+                await self.collect()
+            except Exception as e:
+                logger.error(f"Device telemetry round failed: {str(e)}")
+
+            next_at += self.interval
+            now = time.monotonic()
+            if next_at < now:
+                # A round took longer than the interval; start the next one right away
+                self.stats["late"] += 1
+                next_at = now
+
+    async def _poll(self, driver: PiKVMDriver, semaphore: asyncio.Semaphore) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                hw = await asyncio.wait_for(driver.get_hw_info(), timeout=self.timeout)
+            except (PiKVMError, asyncio.TimeoutError) as e:
+                self.stats["failures"] += 1
+                logger.debug(f"Telemetry poll of {driver.base_url} failed: {str(e)}")
+                return None
+        self.stats["polled"] += 1
+        return extract_telemetry(hw)
+
+    async def collect(self) -> int:
+        """Poll every PiKVM this worker owns once and store the readings; returns the number of devices updated"""
+        started = time.perf_counter()
+        drivers = [driver for driver in list(pikvm_drivers.drivers.values())
+                   if driver.device_ids and device_sharding.owns(min(driver.device_ids))]
+        self.stats["owned_drivers"] = len(drivers)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._poll(driver, semaphore) for driver in drivers))
+
+        timestamp = datetime.utcnow()
+        documents = []
+        readings: Dict[str, Dict[str, Any]] = {}
+        for driver, telemetry in zip(drivers, results):
+            for device_id in list(driver.device_ids):
+                await device_state.report(device_id, telemetry is not None)
+            if not telemetry:
+                continue
+            for device_id in list(driver.device_ids):
+                readings[device_id] = telemetry
+                self.latest[device_id] = {"timestamp": timestamp, **telemetry}
+                values = {field: telemetry[field] for field in TELEMETRY_FIELDS if field in telemetry}
+                if values:
+                    documents.append({"timestamp": timestamp, "device_id": device_id, **values})
+
+        if readings:
+            event_bus.publish(TELEMETRY_CHANNEL, {"timestamp": timestamp.isoformat(), "devices": readings})
+        if documents:
+            try:
+                await self.db[COLLECTION].insert_many(documents, ordered=False)
+                self.stats["stored"] += len(documents)
+            except Exception as e:
+                self.stats["write_failures"] += len(documents)
+                logger.warning(f"Failed to store device telemetry: {str(e)}")
+
+        self.stats["rounds"] += 1
+        self.stats["last_round_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return len(documents)
+
+    def apply_remote(self, snapshot: Dict[str, Any], key: Optional[str] = None):
+        """Take over the readings polled by another worker"""
+        timestamp = datetime.fromisoformat(snapshot["timestamp"])
+        for device_id, telemetry in snapshot["devices"].items():
+            self.latest[device_id] = {"timestamp": timestamp, **telemetry}
+
+    def apply(self, device: Dict[str, Any]) -> Dict[str, Any]:
+        """A device document with the latest telemetry values filled in"""
+        telemetry = self.latest.get(device.get("id"))
+        if not telemetry:
+            return device
+        return {**device, **{field: telemetry[field] for field in TELEMETRY_FIELDS if field in telemetry}}
+
+    def fleet(self, device_ids: List[str]) -> List[Dict[str, Any]]:
+        """Latest telemetry of the given devices, hottest first"""
+        entries = []
+        for device_id in device_ids:
+            telemetry = self.latest.get(device_id)
+            if telemetry is None:
+                continue
+            temperature = telemetry.get("temperature")
+            entries.append({
+                "device_id": device_id,
+                **telemetry,
+                "hot": temperature is not None and temperature >= self.hot_temperature
+            })
+        entries.sort(key=lambda entry: entry.get("temperature") or float("-inf"), reverse=True)
+        return entries
+
+    def forget(self, device_id: str):
+        """Drop the in-memory values of a deleted device; its history expires on its own"""
+        self.latest.pop(device_id, None)
+
+    async def history(self, device_id: str, start: datetime, end: datetime, points: int = 200) -> Dict[str, Any]:
+        """min/avg/max of every telemetry field of one device over ``points`` equal steps"""
+        step = max((end - start) / max(points, 1), timedelta(seconds=1))
+        buckets: Dict[int, Dict[str, List[float]]] = {}
+        cursor = self.db[COLLECTION].find(
+            {"device_id": device_id, "timestamp": {"$gte": start, "$lt": end}},
+            {"_id": 0, "timestamp": 1, **{field: 1 for field in TELEMETRY_FIELDS}}
+        ).sort("timestamp", ASCENDING)
+        async for doc in cursor:
+            bucket = buckets.setdefault(int((doc["timestamp"] - start) / step), {})
+            for field in TELEMETRY_FIELDS:
+                if doc.get(field) is not None:
+                    bucket.setdefault(field, []).append(doc[field])
+
+        series: List[Dict[str, Any]] = []
+        for index in sorted(buckets):
+            point: Dict[str, Any] = {"timestamp": start + step * index}
+            for field, values in buckets[index].items():
+                point[field] = {
+                    "min": round(min(values), 2),
+                    "avg": round(sum(values) / len(values), 2),
+                    "max": round(max(values), 2)
+                }
+            series.append(point)
+
+        return {
+            "device_id": device_id,
+            "start": start,
+            "end": end,
+            "step_seconds": step.total_seconds(),
+            "points": series
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "concurrency": self.concurrency,
+            "running": bool(self._task and not self._task.done()),
+            "devices": len(self.latest),
+            "retention_seconds": self.retention.total_seconds(),
+            **self.stats
+        }
+
+    async def cleanup(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# Global device telemetry collector instance
+device_telemetry = DeviceTelemetryCollector(db)
+event_bus.subscribe(TELEMETRY_CHANNEL, device_telemetry.apply_remote)
@@ -0,0 +1,410 @@
+"""
+Event Bus Module
+Carries events between the uvicorn worker processes of one host over a Unix-domain socket
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import tempfile
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCAL = "local"
+UNIX = "unix"
+
+# Frame types on the socket
+MESSAGE = "m"
+INTEREST = "i"
+HELLO = "h"
+MEMBERS = "members"
+
+Handler = Callable[[Any, Optional[str]], Union[None, Awaitable[None]]]
+
+
+class _Outbox:
+    """Send queue of one connection.
+
+    Reliable lines (invalidations, forwarded calls, control frames) are
+    never dropped. Lossy lines (frames, fan-out events) are bounded and
+    lose their oldest entry when the connection falls behind.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.reliable: deque = deque()
+        self.lossy: deque = deque()
+        self._ready = asyncio.Event()
+
+    def put(self, line: bytes, lossy: bool = False) -> bool:
+        """Queue a line; returns False if an older lossy line was dropped for it"""
+        dropped = False
+        if lossy:
+            if len(self.lossy) >= self.size:
+                self.lossy.popleft()
+                dropped = True
+            self.lossy.append(line)
+        else:
+            self.reliable.append(line)
+        self._ready.set()
+        return not dropped
+
+    def qsize(self) -> int:
+        return len(self.reliable) + len(self.lossy)
+
+    def take(self) -> List[bytes]:
+        """Everything queued so far, reliable lines first"""
+        lines = list(self.reliable) + list(self.lossy)
+        self.reliable.clear()
+        self.lossy.clear()
+        self._ready.clear()
+        return lines
+
+    async def wait(self):
+        await self._ready.wait()
+
+
+class _Peer:
+    """A connected worker as seen by the broker"""
+
+    def __init__(self, worker_id: str, writer: asyncio.StreamWriter, queue_size: int):
+        self.worker_id = worker_id
+        self.writer = writer
+        self.queue = _Outbox(queue_size)
+        self.interests: Set[Tuple[str, str]] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.handler: Optional[asyncio.Task] = asyncio.current_task()
+
+
+class EventBus:
+    """Publish/subscribe between the worker processes of one deployment.
+
+    Every worker runs an ``EventBus``. The first one to take the lock file
+    next to the socket becomes the broker: it listens on the socket, and
+    the others connect to it. When the broker exits its lock is released
+    and the remaining workers elect a new one and reconnect. The broker
+    worker is also the leader for jobs that must run once per host.
+
+    ``publish`` tells the *other* workers about something; the caller has
+    already applied it locally. Messages published with a key (for example
+    the frames of one device) are only relayed to workers that declared
+    interest in that key with ``set_interest``. Messages are JSON lines.
+    Messages published as ``lossy`` go through a bounded send queue per
+    connection that drops its oldest entry when a worker falls behind;
+    all others are always delivered.
+
+    With ``EVENT_BUS=local``, or where Unix sockets are unavailable, the bus
+    only has the current process: ``publish`` does nothing and the worker
+    is always the leader.
+    """
+
+    def __init__(self, path: str = None, mode: str = None, queue_size: int = None):
+        default_path = os.path.join(
+            tempfile.gettempdir(), f"superducks-bus-{os.environ.get('DB_NAME', 'test_database')}.sock"
+        )
+        self.path = path or os.getenv("EVENT_BUS_SOCKET", default_path)
+        mode = (mode or os.getenv("EVENT_BUS", UNIX)).lower()
+        if mode == UNIX and (fcntl is None or not hasattr(socket, "AF_UNIX")):
+            mode = LOCAL
+        self.mode = mode
+        self.queue_size = queue_size or int(os.getenv("EVENT_BUS_QUEUE_SIZE", "4096"))
+        self.max_frame = int(os.getenv("EVENT_BUS_MAX_FRAME", str(16 * 1024 * 1024)))
+        self.reconnect_delay = float(os.getenv("EVENT_BUS_RECONNECT_DELAY", "0.5"))
+        self.worker_id = str(os.getpid())
+        self.is_broker = False
+        self.connected = False
+        self.members: List[str] = [self.worker_id]
+        self.stats = {"published": 0, "received": 0, "relayed": 0, "dropped": 0,
+                      "handler_errors": 0, "elections": 0, "reconnects": 0}
+
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._member_listeners: List[Callable[[List[str]], Union[None, Awaitable[None]]]] = []
+        self._interests: Set[Tuple[str, str]] = set()
+        self._peers: Dict[str, _Peer] = {}
+        self._outbox: Optional[_Outbox] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._lock_file = None
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    @property
+    def is_leader(self) -> bool:
+        return self.mode == LOCAL or self.is_broker
+
+    # --- local API ---
+
+    def subscribe(self, channel: str, handler: Handler):
+        """Call ``handler(payload, key)`` for messages on a channel from other workers"""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def on_members(self, listener: Callable[[List[str]], Union[None, Awaitable[None]]]):
+        """Call ``listener(worker_ids)`` whenever a worker joins or leaves"""
+        self._member_listeners.append(listener)
+
+    def publish(self, channel: str, payload: Any, key: Optional[str] = None, lossy: bool = False):
+        """Send a message to the other workers without waiting for it to be written.
+
+        ``lossy`` messages may be dropped when a worker falls behind; use it
+        for high-volume traffic that a newer message supersedes.
+        """
+        if self.mode == LOCAL:
+            return
+        self.stats["published"] += 1
+        frame = {"t": MESSAGE, "c": channel, "k": key, "p": payload, "w": self.worker_id}
+        if lossy:
+            frame["l"] = 1
+        if self.is_broker:
+            self._relay(frame, self._encode(frame))
+        elif self._outbox is not None:
+            self._offer(self._outbox, self._encode(frame), lossy)
+
+    def set_interest(self, channel: str, key: str, interested: bool):
+        """Declare whether this worker wants the keyed messages of a channel"""
+        entry = (channel, key)
+        if interested == (entry in self._interests):
+            return
+        if interested:
+            self._interests.add(entry)
+        else:
+            self._interests.discard(entry)
+        if self.mode == UNIX and not self.is_broker and self._outbox is not None:
+            self._offer(self._outbox, self._encode({"t": INTEREST, "c": channel, "k": key, "on": interested}))
+
+    # --- lifecycle ---
+
+    async def start(self):
+        if self.mode == UNIX:
+            self._outbox = _Outbox(self.queue_size)
+            self._task = asyncio.create_task(self._run())
+
+    async def wait_ready(self, timeout: float) -> bool:
+        """Wait until this worker knows the other members, as broker or connected worker"""
+        if self.mode == LOCAL:
+            return True
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _run(self):
+        while not self._closed:
+            if self._try_lock():
+                try:
+                    await self._serve()
+                    return
+                except OSError as e:
+                    logger.error(f"Event bus could not listen on {self.path}: {str(e)}")
+                    self._release_lock()
+            else:
+                try:
+                    await self._connect()
+                except (ConnectionError, FileNotFoundError, OSError) as e:
+                    logger.debug(f"Event bus broker not reachable yet: {str(e)}")
+                self.connected = False
+                self.stats["reconnects"] += 1
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _try_lock(self) -> bool:
+        lock_file = open(self.path + ".lock", "w")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _release_lock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    # --- broker side ---
+
+    async def _serve(self):
+        # Holding the lock means no other broker is using the socket file
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._accept, path=self.path, limit=self.max_frame)
+        self.is_broker = True
+        self.stats["elections"] += 1
+        logger.info(f"Worker {self.worker_id} is the event bus broker on {self.path}")
+        await self._set_members()
+        self._ready.set()
+
+        # Messages queued while no broker was reachable go out now
+        for line in self._outbox.take():
+            frame = json.loads(line)
+            if frame["t"] == MESSAGE:
+                self._relay(frame, line)
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = None
+        try:
+            hello = json.loads(await reader.readline() or b"{}")
+            if hello.get("t") != HELLO:
+                return
+            peer = _Peer(hello["w"], writer, self.queue_size)
+            peer.interests = {tuple(entry) for entry in hello.get("interests", [])}
+            peer.task = asyncio.create_task(self._drain(peer.queue, writer))
+            self._peers[peer.worker_id] = peer
+            await self._set_members()
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                frame = json.loads(line)
+                if frame["t"] == INTEREST:
+                    entry = (frame["c"], frame["k"])
+                    if frame["on"]:
+                        peer.interests.add(entry)
+                    else:
+                        peer.interests.discard(entry)
+                elif frame["t"] == MESSAGE:
+                    self._relay(frame, line)
+                    await self._dispatch(frame)
+        except (ConnectionError, ValueError, KeyError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"Event bus connection failed: {str(e)}")
+        finally:
+            if peer is not None:
+                if self._peers.get(peer.worker_id) is peer:
+                    del self._peers[peer.worker_id]
+                peer.task.cancel()
+                await self._set_members()
+            writer.close()
+
+    def _relay(self, frame: Dict[str, Any], line: bytes):
+        """Pass a message on to every other worker that should get it"""
+        key = frame.get("k")
+        entry = (frame["c"], key)
+        for worker_id, peer in self._peers.items():
+            if worker_id == frame["w"] or (key is not None and entry not in peer.interests):
+                continue
+            self._offer(peer.queue, line, bool(frame.get("l")))
+            self.stats["relayed"] += 1
+
+    async def _set_members(self):
+        members = sorted([self.worker_id, *self._peers], key=int)
+        line = self._encode({"t": MEMBERS, "w": members})
+        for peer in self._peers.values():
+            self._offer(peer.queue, line)
+        await self._update_members(members)
+
+    # --- worker side ---
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_unix_connection(self.path, limit=self.max_frame)
+        self._writer = writer
+        self.connected = True
+        writer.write(self._encode({"t": HELLO, "w": self.worker_id, "interests": sorted(self._interests)}))
+        drain = asyncio.create_task(self._drain(self._outbox, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                frame = json.loads(line)
+                if frame["t"] == MEMBERS:
+                    await self._update_members(frame["w"])
+                    self._ready.set()
+                elif frame["t"] == MESSAGE:
+                    await self._dispatch(frame)
+        finally:
+            drain.cancel()
+            await asyncio.gather(drain, return_exceptions=True)
+            writer.close()
+            self._writer = None
+            # Until a broker is back this worker only knows about itself
+            await self._update_members([self.worker_id])
+
+    # --- shared ---
+
+    @staticmethod
+    def _encode(frame: Dict[str, Any]) -> bytes:
+        return json.dumps(frame, separators=(",", ":"), default=str).encode() + b"\n"
+
+    def _offer(self, queue: _Outbox, line: bytes, lossy: bool = False):
+        if not queue.put(line, lossy):
+            self.stats["dropped"] += 1
+
+    async def _drain(self, queue: _Outbox, writer: asyncio.StreamWriter):
+        while True:
+            await queue.wait()
+            # Write out everything queued so far before waiting on the socket
+            writer.writelines(queue.take())
+            await writer.drain()
+
+    async def _dispatch(self, frame: Dict[str, Any]):
+        self.stats["received"] += 1
+        for handler in self._handlers.get(frame["c"], []):
+            try:
+                result = handler(frame["p"], frame.get("k"))
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                self.stats["handler_errors"] += 1
+                logger.error(f"Event bus handler for {frame['c']} failed: {str(e)}")
+
+    async def _update_members(self, members: List[str]):
+        if members == self.members:
+            return
+        self.members = members
+        for listener in self._member_listeners:
+            try:
+                result = listener(members)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Event bus member listener failed: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "worker_id": self.worker_id,
+            "role": "local" if self.mode == LOCAL else "broker" if self.is_broker else "worker",
+            "connected": self.is_broker or self.connected,
+            "members": self.members,
+            "interests": len(self._interests),
+            "backlog": (self._outbox.qsize() if self._outbox else 0) +
+                       sum(peer.queue.qsize() for peer in self._peers.values()),
+            **self.stats
+        }
+
+    async def cleanup(self):
+        self._closed = True
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._server is not None:
+            self._server.close()
+            # Closing the connections ends their handlers, which then unregister the peers
+            handlers = [peer.handler for peer in self._peers.values() if peer.handler]
+            for peer in list(self._peers.values()):
+                peer.writer.close()
+            if handlers:
+                await asyncio.wait(handlers, timeout=1)
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        if self._writer is not None:
+            self._writer.close()
+        self.is_broker = False
+        self._release_lock()
+
+
+# Global event bus instance
+event_bus = EventBus()
@@ -11,6 +11,8 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 
+from db_indexes import IndexManager
+
 # Load environment variables
 load_dotenv()
 
@@ -96,32 +98,10 @@ async def setup_database_indexes():
     db = client[db_name]
     
     try:
-        # User indexes
-        await db.users.create_index("username", unique=True)
-        await db.users.create_index("email", unique=True)
-        await db.users.create_index("role")
-        
-        # Device indexes
-        await db.devices.create_index("id", unique=True)
-        await db.devices.create_index("ip_address")
-        await db.devices.create_index("status")
-        
-        # Permission indexes
-        await db.user_device_permissions.create_index([("user_id", 1), ("device_id", 1)], unique=True)
-        await db.user_device_permissions.create_index("user_id")
-        await db.user_device_permissions.create_index("device_id")
-        
-        # Log indexes
-        await db.audit_log.create_index("timestamp")
-        await db.audit_log.create_index("user_id")
-        await db.audit_log.create_index("device_id")
-        await db.power_logs.create_index("timestamp")
-        await db.input_logs.create_index("timestamp")
-        
-        print("✅ Database indexes created successfully!")
-        
-    except Exception as e:
-        print(f"❌ Error creating indexes: {str(e)}")
+        if await IndexManager(db).ensure_indexes():
+            print("✅ Database indexes created successfully!")
+        else:
+            print("❌ Some indexes could not be created, see the log above")
     finally:
         client.close()
 
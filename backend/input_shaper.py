@@ -0,0 +1,159 @@
+"""
+Input Shaper Module
+Per-device coalescing and rate shaping of HID input before it reaches the device
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ForwardCallable = Callable[[Dict[str, Any]], Awaitable[bool]]
+
+# Result returned for a move that was superseded by a newer position
+COALESCED = {"success": True, "coalesced": True}
+
+
+class _QueuedInput:
+    __slots__ = ("event", "forward", "coalescible", "future")
+
+    def __init__(self, event: Dict[str, Any], forward: ForwardCallable, coalescible: bool):
+        self.event = event
+        self.forward = forward
+        self.coalescible = coalescible
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class InputShaper:
+    """Shapes the input stream of a single device.
+
+    Consecutive absolute mouse moves that are still waiting to be forwarded
+    are merged so only the latest position is sent. Moves are forwarded at
+    most ``max_rate`` times per second. Button, key and scroll events are
+    never merged or dropped and always keep their position in the stream.
+    """
+
+    def __init__(self, device_id: str, max_rate: float):
+        self.device_id = device_id
+        self.interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.stats = {"received": 0, "forwarded": 0, "coalesced": 0, "failed": 0}
+
+        self._queue: Deque[_QueuedInput] = deque()
+        self._wakeup = asyncio.Event()
+        self._last_move_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, event: Dict[str, Any], forward: ForwardCallable, coalescible: bool = False) -> Dict[str, Any]:
+        """Queue an input event and wait for the outcome.
+
+        Returns ``{"success": bool, "coalesced": bool}``. A coalesced move
+        was replaced by a newer one and never reached the device.
+        """
+        self.stats["received"] += 1
+        item = _QueuedInput(event, forward, coalescible)
+
+        last = self._queue[-1] if self._queue else None
+        if coalescible and last is not None and last.coalescible:
+            # Take over the slot of the pending move; its caller is done
+            self.stats["coalesced"] += 1
+            if not last.future.done():
+                last.future.set_result(COALESCED)
+            last.event = item.event
+            last.forward = item.forward
+            last.future = item.future
+        else:
+            self._queue.append(item)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+        return await item.future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._queue:
+                head = self._queue[0]
+                if head.coalescible and self.interval:
+                    delay = self._last_move_at + self.interval - time.monotonic()
+                    if delay > 0:
+                        # Newer moves keep replacing the head while we wait
+                        await asyncio.sleep(delay)
+                    self._last_move_at = time.monotonic()
+
+                item = self._queue.popleft()
+                success = False
+                try:
+                    success = await item.forward(item.event)
+                except Exception as e:
+                    logger.error(f"Input forwarding failed for device {self.device_id}: {str(e)}")
+                finally:
+                    # Also runs when close() cancels the forward, so its caller is never left waiting
+                    self.stats["forwarded" if success else "failed"] += 1
+                    if not item.future.done():
+                        item.future.set_result({"success": success, "coalesced": False})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"queued": len(self._queue), **self.stats}
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._queue:
+            item = self._queue.popleft()
+            if not item.future.done():
+                item.future.set_result({"success": False, "coalesced": False})
+
+
+class InputShaperManager:
+    """Keeps one InputShaper per device"""
+
+    def __init__(self, max_rate: float = None):
+        self.max_rate = max_rate if max_rate is not None else float(os.getenv("INPUT_MAX_RATE", "30"))
+        self.shapers: Dict[str, InputShaper] = {}
+
+    def get_shaper(self, device_id: str) -> InputShaper:
+        shaper = self.shapers.get(device_id)
+        if shaper is None:
+            shaper = InputShaper(device_id, self.max_rate)
+            self.shapers[device_id] = shaper
+        return shaper
+
+    async def submit(self, device_id: str, event: Dict[str, Any], forward: ForwardCallable,
+                     coalescible: bool = False) -> Dict[str, Any]:
+        """Route an input event through the shaper of its device"""
+        return await self.get_shaper(device_id).submit(event, forward, coalescible)
+
+    async def remove_device(self, device_id: str):
+        shaper = self.shapers.pop(device_id, None)
+        if shaper:
+            await shaper.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        devices = {device_id: shaper.get_stats() for device_id, shaper in self.shapers.items()}
+        totals = {"received": 0, "forwarded": 0, "coalesced": 0, "failed": 0}
+        for stats in devices.values():
+            for key in totals:
+                totals[key] += stats[key]
+        return {"max_rate": self.max_rate, "totals": totals, "devices": devices}
+
+    async def cleanup(self):
+        for shaper in self.shapers.values():
+            await shaper.close()
+        self.shapers.clear()
+
+
+# Global input shaper instance
+input_shaper_manager = InputShaperManager()
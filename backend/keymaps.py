@@ -0,0 +1,113 @@
+"""
+Keyboard Layout Tables
+Precomputed character to PiKVM key sequences used when typing text over the HID channel
+"""
+
+from typing import Dict, List, Tuple, Any
+
+from pikvm_hid import key_event
+
+# Maximum number of HID events written as one batch when typing text
+TYPE_TEXT_BATCH_SIZE = 256
+
+# A keystroke is (key name, needs shift, is dead key)
+Keystroke = Tuple[str, bool, bool]
+
+_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def _base_table() -> Dict[str, Keystroke]:
+    table: Dict[str, Keystroke] = {}
+    for letter in _LETTERS:
+        table[letter] = (f"Key{letter.upper()}", False, False)
+        table[letter.upper()] = (f"Key{letter.upper()}", True, False)
+    for digit in "0123456789":
+        table[digit] = (f"Digit{digit}", False, False)
+    table[" "] = ("Space", False, False)
+    table["\n"] = ("Enter", False, False)
+    table["\t"] = ("Tab", False, False)
+    return table
+
+
+def _build_en_us() -> Dict[str, Keystroke]:
+    table = _base_table()
+    shifted_digits = {"!": "1", "@": "2", "#": "3", "$": "4", "%": "5",
+                      "^": "6", "&": "7", "*": "8", "(": "9", ")": "0"}
+    for char, digit in shifted_digits.items():
+        table[char] = (f"Digit{digit}", True, False)
+    symbols = {
+        "-": ("Minus", False), "_": ("Minus", True),
+        "=": ("Equal", False), "+": ("Equal", True),
+        "[": ("BracketLeft", False), "{": ("BracketLeft", True),
+        "]": ("BracketRight", False), "}": ("BracketRight", True),
+        "\\": ("Backslash", False), "|": ("Backslash", True),
+        ";": ("Semicolon", False), ":": ("Semicolon", True),
+        "'": ("Quote", False), '"': ("Quote", True),
+        "`": ("Backquote", False), "~": ("Backquote", True),
+        ",": ("Comma", False), "<": ("Comma", True),
+        ".": ("Period", False), ">": ("Period", True),
+        "/": ("Slash", False), "?": ("Slash", True),
+    }
+    for char, (key, shift) in symbols.items():
+        table[char] = (key, shift, False)
+    return table
+
+
+def _build_pt_br() -> Dict[str, Keystroke]:
+    # Brazilian ABNT2 layout; accents are dead keys and need a trailing space
+    table = _base_table()
+    shifted_digits = {"!": "1", "@": "2", "#": "3", "$": "4", "%": "5",
+                      "&": "7", "*": "8", "(": "9", ")": "0"}
+    for char, digit in shifted_digits.items():
+        table[char] = (f"Digit{digit}", True, False)
+    symbols = {
+        "-": ("Minus", False, False), "_": ("Minus", True, False),
+        "=": ("Equal", False, False), "+": ("Equal", True, False),
+        "[": ("BracketRight", False, False), "{": ("BracketRight", True, False),
+        "]": ("Backslash", False, False), "}": ("Backslash", True, False),
+        "\\": ("IntlBackslash", False, False), "|": ("IntlBackslash", True, False),
+        ";": ("Slash", False, False), ":": ("Slash", True, False),
+        "'": ("Backquote", False, False), '"': ("Backquote", True, False),
+        ",": ("Comma", False, False), "<": ("Comma", True, False),
+        ".": ("Period", False, False), ">": ("Period", True, False),
+        "/": ("IntlRo", False, False), "?": ("IntlRo", True, False),
+        "ç": ("Semicolon", False, False), "Ç": ("Semicolon", True, False),
+        "~": ("Quote", False, True), "^": ("Quote", True, True),
+        "´": ("BracketLeft", False, True), "`": ("BracketLeft", True, True),
+    }
+    table.update(symbols)
+    return table
+
+
+KEYMAPS: Dict[str, Dict[str, Keystroke]] = {
+    "en-us": _build_en_us(),
+    "pt-br": _build_pt_br(),
+}
+
+
+def text_to_events(text: str, keymap: str = "en-us") -> List[Dict[str, Any]]:
+    """Translate text into an ordered list of PiKVM key events.
+
+    Raises ValueError for unknown layouts or characters the layout cannot type.
+    """
+    table = KEYMAPS.get(keymap)
+    if table is None:
+        raise ValueError(f"Unsupported keymap '{keymap}'. Available: {sorted(KEYMAPS)}")
+
+    events: List[Dict[str, Any]] = []
+    for char in text.replace("\r\n", "\n"):
+        stroke = table.get(char)
+        if stroke is None:
+            raise ValueError(f"Character {char!r} cannot be typed with keymap '{keymap}'")
+        key, shift, dead = stroke
+        if shift:
+            events.append(key_event("ShiftLeft", True))
+        events.append(key_event(key, True))
+        events.append(key_event(key, False))
+        if shift:
+            events.append(key_event("ShiftLeft", False))
+        if dead:
+            # Commit the dead key on its own
+            events.append(key_event("Space", True))
+            events.append(key_event("Space", False))
+    return events
@@ -0,0 +1,234 @@
+"""
+Log Queries Module
+Keyset pagination and bulk export of the audit, power and input logs, streamed straight from the cursor
+"""
+
+import base64
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pymongo import ASCENDING, DESCENDING
+
+# Newest first; id breaks ties between entries written in the same instant
+LOG_SORT = [("timestamp", DESCENDING), ("id", DESCENDING)]
+
+MAX_PAGE_SIZE = 10000
+
+# Documents are fetched from MongoDB in batches of this size while streaming
+STREAM_BATCH_SIZE = 500
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Exports run oldest first over the same indexes, read backwards
+EXPORT_SORT = [("timestamp", ASCENDING), ("id", ASCENDING)]
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Rows are gathered into chunks of about this size before being handed to the socket
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# CSV columns per collection; anything else in a document goes unexported in CSV
+EXPORT_COLUMNS = {
+    "audit_log": ["id", "timestamp", "user_id", "device_id", "action", "ip_address", "details"],
+    "input_logs": ["id", "timestamp", "device_id", "user_id", "username", "type", "keys", "modifiers",
+                   "x", "y", "button", "buttons", "action", "scroll", "characters", "keymap"],
+    "power_logs": ["id", "timestamp", "device_id", "user_id", "username", "action", "status", "bulk_job_id"],
+}
+
+
+def encode_cursor(timestamp: Any, log_id: str) -> str:
+    """Opaque cursor pointing just past the given entry"""
+    if isinstance(timestamp, datetime):
+        key = {"t": timestamp.isoformat(), "d": True, "i": log_id}
+    else:
+        key = {"t": timestamp, "d": False, "i": log_id}
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded))
+        timestamp = datetime.fromisoformat(key["t"]) if key["d"] else key["t"]
+        return timestamp, key["i"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def build_log_filter(
+    device_ids: Optional[List[str]] = None,
+    device_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    action: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    action_field: str = "action"
+) -> Optional[Dict[str, Any]]:
+    """Mongo filter for a log query, or None if it cannot match anything.
+
+    ``device_ids`` limits the result to the devices the caller may see;
+    ``device_id`` narrows it to one of them.
+    """
+    query: Dict[str, Any] = {}
+    if device_id:
+        if device_ids is not None and device_id not in device_ids:
+            return None
+        query["device_id"] = device_id
+    elif device_ids is not None:
+        if not device_ids:
+            return None
+        query["device_id"] = {"$in": device_ids}
+    if user_id:
+        query["user_id"] = user_id
+    if action:
+        query[action_field] = action
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = start
+        if end:
+            query["timestamp"]["$lt"] = end
+    return query
+
+
+def _after(query: Dict[str, Any], cursor: Optional[str]) -> Dict[str, Any]:
+    """Restrict a filter to entries that sort after the cursor"""
+    if not cursor:
+        return query
+    timestamp, log_id = decode_cursor(cursor)
+    # The $lte bound lets the (…, timestamp, id) index range-scan; the $or only trims the tie
+    keyset = {
+        "timestamp": {"$lte": timestamp},
+        "$or": [{"timestamp": {"$lt": timestamp}}, {"id": {"$lt": log_id}}]
+    }
+    return {"$and": [query, keyset]} if query else keyset
+
+
+def _through(query: Dict[str, Any], timestamp: Any, log_id: str) -> Dict[str, Any]:
+    """Restrict a filter to entries that sort at or before the given entry"""
+    keyset = {
+        "timestamp": {"$gte": timestamp},
+        "$or": [{"timestamp": {"$gt": timestamp}}, {"id": {"$gte": log_id}}]
+    }
+    return {"$and": [query, keyset]} if query else keyset
+
+
+async def _stream_json_array(cursor) -> AsyncIterator[bytes]:
+    yield b"["
+    first = True
+    async for doc in cursor:
+        yield (b"" if first else b",") + json.dumps(jsonable_encoder(doc)).encode()
+        first = False
+    yield b"]"
+
+
+async def log_page(collection, query: Optional[Dict[str, Any]], limit: int,
+                   cursor: Optional[str] = None) -> StreamingResponse:
+    """One page of log entries as a JSON array streamed from the database.
+
+    The response body keeps the plain list shape of the log endpoints. When
+    more entries follow, the cursor for the next page is returned in the
+    ``X-Next-Cursor`` header. The keys of the page are read up front with a
+    small keys-only query so the header is known before streaming starts;
+    the streamed query is then bounded by the last of those keys, so the
+    body always ends exactly where the next page begins. Entries inserted
+    between the two queries are included rather than pushing older ones
+    off the page, so a page can hold a few more than ``limit`` entries.
+    """
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    headers = {}
+    if query is None:
+        return StreamingResponse(iter([b"[]"]), media_type="application/json", headers=headers)
+
+    query = _after(query, cursor)
+
+    keys = await collection.find(query, {"_id": 0, "timestamp": 1, "id": 1}) \
+        .sort(LOG_SORT).limit(limit + 1).to_list(limit + 1)
+    if not keys:
+        return StreamingResponse(iter([b"[]"]), media_type="application/json", headers=headers)
+
+    # The last key of this page bounds the body; one more key means there is a next page
+    last = keys[min(limit, len(keys)) - 1]
+    if len(keys) > limit:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last["timestamp"], last.get("id", ""))
+
+    documents = collection.find(_through(query, last["timestamp"], last.get("id", "")), {"_id": 0}) \
+        .sort(LOG_SORT).batch_size(STREAM_BATCH_SIZE)
+    return StreamingResponse(_stream_json_array(documents), media_type="application/json", headers=headers)
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(jsonable_encoder(value))
+    return "" if value is None else value
+
+
+async def _export_rows(cursor, fmt: str, columns: List[str]) -> AsyncIterator[bytes]:
+    """Serialized export rows, batched into chunks of roughly EXPORT_CHUNK_BYTES"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(columns)
+
+    async for doc in cursor:
+        if writer:
+            writer.writerow([_csv_value(doc.get(column)) for column in columns])
+        else:
+            buffer.write(json.dumps(jsonable_encoder(doc)))
+            buffer.write("\n")
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def log_export(collection, query: Optional[Dict[str, Any]], fmt: str = "ndjson",
+               compress: bool = False) -> StreamingResponse:
+    """Stream every matching entry, oldest first, as NDJSON or CSV.
+
+    Documents are read in batches and written out chunk by chunk; the next
+    batch is only fetched once the client has taken the previous chunks, so
+    memory use does not grow with the size of the export.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    name = collection.name
+    filename = f"{name}-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.{fmt}" + (".gz" if compress else "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    if query is None:
+        # Nothing is visible to the caller; still a valid, empty export
+        query = {"_id": {"$exists": False}}
+    cursor = collection.find(query, {"_id": 0}).sort(EXPORT_SORT).batch_size(STREAM_BATCH_SIZE)
+
+    body = _export_rows(cursor, fmt, EXPORT_COLUMNS.get(name, ["id", "timestamp"]))
+    if compress:
+        body = _gzip(body)
+        media_type = "application/gzip"
+    else:
+        media_type = EXPORT_FORMATS[fmt]
+    return StreamingResponse(body, media_type=media_type, headers=headers)
@@ -0,0 +1,121 @@
+"""
+Password Hasher Module
+Runs bcrypt hashing and verification on a bounded worker pool instead of the event loop
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from passlib.context import CryptContext
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool has no room for another request"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Password hashing pool is saturated, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Offloads CryptContext work to a thread pool with a bounded backlog.
+
+    bcrypt releases the GIL while it works, so threads run in parallel and
+    the event loop stays free for streams and input. At most ``workers``
+    hashes run at once and at most ``max_pending`` more may wait; anything
+    beyond that is rejected with ``PasswordHasherBusy`` so callers can shed
+    the request instead of queueing indefinitely.
+    """
+
+    def __init__(self, context: CryptContext, workers: int = None, max_pending: int = None):
+        self.context = context
+        self.workers = workers or int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+        # Default backlog: about eight hashes' worth of waiting per worker
+        self.max_pending = max_pending if max_pending is not None else int(
+            os.getenv("PASSWORD_HASH_QUEUE", str(self.workers * 8))
+        )
+        self.stats = {"completed": 0, "rejected": 0, "failed": 0, "peak_in_flight": 0}
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight = 0
+        self._run_ms = 0.0
+        self._wait_ms = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_pending
+
+    def _retry_after(self) -> int:
+        """Seconds until the current backlog should have drained"""
+        average_ms = self._run_ms / self.stats["completed"] if self.stats["completed"] else 250.0
+        return max(1, round(self._in_flight / self.workers * average_ms / 1000))
+
+    def _release(self, loop: asyncio.AbstractEventLoop):
+        """Free a slot from the worker thread that finished (or dropped) the job"""
+        try:
+            loop.call_soon_threadsafe(self._finish)
+        except RuntimeError:
+            # Event loop already closed at shutdown
+            pass
+
+    def _finish(self):
+        self._in_flight -= 1
+
+    async def _submit(self, func: Callable, *args) -> Any:
+        if self._in_flight >= self.capacity:
+            self.stats["rejected"] += 1
+            raise PasswordHasherBusy(self._retry_after())
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+
+        self._in_flight += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self._in_flight)
+        queued_at = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            result = func(*args)
+            return result, started, time.perf_counter()
+
+        # The slot is held until the job itself ends: a cancelled caller does not stop bcrypt
+        loop = asyncio.get_running_loop()
+        job = self._executor.submit(run)
+        job.add_done_callback(lambda _: self._release(loop))
+
+        try:
+            result, started, finished = await asyncio.wrap_future(job)
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+
+        self.stats["completed"] += 1
+        self._wait_ms += (started - queued_at) * 1000
+        self._run_ms += (finished - started) * 1000
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._submit(self.context.verify, password, hashed_password)
+
+    def get_stats(self) -> Dict[str, Any]:
+        completed = self.stats["completed"]
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": self._in_flight,
+            "queued": max(self._in_flight - self.workers, 0),
+            "saturation": round(self._in_flight / self.capacity, 3),
+            "avg_wait_ms": round(self._wait_ms / completed, 2) if completed else 0.0,
+            "avg_run_ms": round(self._run_ms / completed, 2) if completed else 0.0,
+            **self.stats
+        }
+
+    def cleanup(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
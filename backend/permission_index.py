@@ -0,0 +1,243 @@
+"""
+Permission Index Module
+In-memory copy of the user/device permission matrix so permission checks need no database round trip
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PermissionIndex:
+    """Holds every user's device permissions and the set of device ids.
+
+    The index is loaded once at startup and then kept current by the routes
+    that change permissions or devices. When ``PERMISSION_CHANGE_STREAM`` is
+    enabled it also follows MongoDB change streams, so changes made by other
+    worker processes arrive here too; change streams need a replica set and
+    the index keeps working from local updates if they are unavailable.
+
+    Levels are stored as the plain strings kept in the database; their
+    ordering is applied by the auth module. Until the first load completes
+    ``ready`` is False and callers should fall back to the database.
+    """
+
+    def __init__(self, db, watch_changes: bool = None):
+        self.db = db
+        self.watch_changes = watch_changes if watch_changes is not None else \
+            os.getenv("PERMISSION_CHANGE_STREAM", "false").lower() in ("1", "true", "yes")
+        self.ready = False
+        self.stats = {"loads": 0, "local_updates": 0, "stream_events": 0, "stream_errors": 0}
+
+        # user id -> device id -> level
+        self._by_user: Dict[str, Dict[str, str]] = {}
+        # device id -> users with a permission on it
+        self._by_device: Dict[str, Set[str]] = {}
+        self._devices: Set[str] = set()
+
+        # Mongo _id bookkeeping so change stream deletes (which carry only _id) can be applied
+        self._permission_docs: Dict[Any, Tuple[str, str]] = {}
+        self._current_doc: Dict[Tuple[str, str], Any] = {}
+        self._device_docs: Dict[Any, str] = {}
+
+        self._load_task: Optional[asyncio.Task] = None
+        self._watch_tasks: List[asyncio.Task] = []
+
+    # --- lookups ---
+
+    def get_level(self, user_id: str, device_id: str) -> Optional[str]:
+        permissions = self._by_user.get(user_id)
+        return permissions.get(device_id) if permissions else None
+
+    def get_user_permissions(self, user_id: str) -> Dict[str, str]:
+        return self._by_user.get(user_id, {})
+
+    def get_device_ids(self) -> List[str]:
+        return list(self._devices)
+
+    # --- loading ---
+
+    async def start(self):
+        """Load the index in the background and start following changes if enabled"""
+        self._load_task = asyncio.create_task(self.load())
+        if self.watch_changes:
+            self._watch_tasks = [
+                asyncio.create_task(self._watch("user_device_permissions", self._apply_permission_change)),
+                asyncio.create_task(self._watch("devices", self._apply_device_change)),
+            ]
+
+    async def load(self):
+        # Updates made while a load is reading may be missing from its snapshot; read again
+        for _ in range(3):
+            local_updates = self.stats["local_updates"]
+            if not await self._load_once() or self.stats["local_updates"] == local_updates:
+                return
+
+    async def _load_once(self) -> bool:
+        started = time.monotonic()
+        by_user: Dict[str, Dict[str, str]] = {}
+        by_device: Dict[str, Set[str]] = {}
+        permission_docs: Dict[Any, Tuple[str, str]] = {}
+        current_doc: Dict[Tuple[str, str], Any] = {}
+        devices: Set[str] = set()
+        device_docs: Dict[Any, str] = {}
+
+        try:
+            cursor = self.db.user_device_permissions.find(
+                {}, {"user_id": 1, "device_id": 1, "permission_level": 1}
+            ).batch_size(1000)
+            async for doc in cursor:
+                user_id, device_id = doc["user_id"], doc["device_id"]
+                by_user.setdefault(user_id, {})[device_id] = _level(doc["permission_level"])
+                by_device.setdefault(device_id, set()).add(user_id)
+                permission_docs[doc["_id"]] = (user_id, device_id)
+                current_doc[(user_id, device_id)] = doc["_id"]
+
+            async for doc in self.db.devices.find({}, {"id": 1}).batch_size(1000):
+                if "id" in doc:
+                    devices.add(doc["id"])
+                    device_docs[doc["_id"]] = doc["id"]
+        except Exception as e:
+            logger.error(f"Permission index load failed: {str(e)}")
+            return False
+
+        self._by_user, self._by_device, self._devices = by_user, by_device, devices
+        self._permission_docs, self._current_doc, self._device_docs = permission_docs, current_doc, device_docs
+        self.ready = True
+        self.stats["loads"] += 1
+        logger.info(f"Permission index loaded {len(permission_docs)} permissions for {len(devices)} devices "
+                    f"in {time.monotonic() - started:.2f}s")
+        return True
+
+    # --- local updates ---
+
+    def set_user_permissions(self, user_id: str, docs: List[Dict[str, Any]]):
+        """Replace a user's permissions with the documents just written to the database"""
+        self._drop_user(user_id)
+        for doc in docs:
+            self._put(doc.get("_id"), user_id, doc["device_id"], _level(doc["permission_level"]))
+        self.stats["local_updates"] += 1
+
+    def remove_user(self, user_id: str):
+        self._drop_user(user_id)
+        self.stats["local_updates"] += 1
+
+    def add_device(self, device_id: str, doc_id: Any = None):
+        self._devices.add(device_id)
+        if doc_id is not None:
+            self._device_docs[doc_id] = device_id
+        self.stats["local_updates"] += 1
+
+    def remove_device(self, device_id: str):
+        self._devices.discard(device_id)
+        for user_id in self._by_device.pop(device_id, set()):
+            self._remove(user_id, device_id)
+        self.stats["local_updates"] += 1
+
+    def _put(self, doc_id: Any, user_id: str, device_id: str, level: str):
+        self._by_user.setdefault(user_id, {})[device_id] = level
+        self._by_device.setdefault(device_id, set()).add(user_id)
+        if doc_id is not None:
+            previous = self._current_doc.get((user_id, device_id))
+            if previous is not None and previous != doc_id:
+                self._permission_docs.pop(previous, None)
+            self._permission_docs[doc_id] = (user_id, device_id)
+            self._current_doc[(user_id, device_id)] = doc_id
+
+    def _remove(self, user_id: str, device_id: str):
+        permissions = self._by_user.get(user_id)
+        if permissions is not None:
+            permissions.pop(device_id, None)
+            if not permissions:
+                del self._by_user[user_id]
+        users = self._by_device.get(device_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self._by_device[device_id]
+        doc_id = self._current_doc.pop((user_id, device_id), None)
+        if doc_id is not None:
+            self._permission_docs.pop(doc_id, None)
+
+    def _drop_user(self, user_id: str):
+        for device_id in list(self._by_user.get(user_id, {})):
+            self._remove(user_id, device_id)
+
+    # --- change streams ---
+
+    async def _watch(self, collection: str, apply):
+        """Follow a collection's change stream, resuming after transient errors"""
+        resume_token = None
+        while True:
+            try:
+                async with self.db[collection].watch(full_document="updateLookup",
+                                                     resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        if self.ready:
+                            apply(change)
+                        self.stats["stream_events"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["stream_errors"] += 1
+                if "replica set" in str(e).lower() or "not supported" in str(e).lower():
+                    logger.warning(f"Change streams unavailable, permission index follows local changes only: {e}")
+                    return
+                logger.warning(f"Change stream on {collection} failed, retrying: {str(e)}")
+                resume_token = None
+                # Changes may have been missed while disconnected
+                await self.load()
+                await asyncio.sleep(5)
+
+    def _apply_permission_change(self, change: Dict[str, Any]):
+        operation = change.get("operationType")
+        doc_id = change.get("documentKey", {}).get("_id")
+        if operation in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc:
+                self._put(doc_id, doc["user_id"], doc["device_id"], _level(doc["permission_level"]))
+        elif operation == "delete":
+            key = self._permission_docs.get(doc_id)
+            # Ignore deletes of documents that were already replaced locally
+            if key is not None and self._current_doc.get(key) == doc_id:
+                self._remove(*key)
+
+    def _apply_device_change(self, change: Dict[str, Any]):
+        operation = change.get("operationType")
+        doc_id = change.get("documentKey", {}).get("_id")
+        if operation == "insert":
+            doc = change.get("fullDocument") or {}
+            if "id" in doc:
+                self.add_device(doc["id"], doc_id)
+        elif operation == "delete":
+            device_id = self._device_docs.pop(doc_id, None)
+            if device_id is not None:
+                self.remove_device(device_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "watching_changes": any(not task.done() for task in self._watch_tasks),
+            "users": len(self._by_user),
+            "devices": len(self._devices),
+            "permissions": sum(len(permissions) for permissions in self._by_user.values()),
+            **self.stats
+        }
+
+    async def cleanup(self):
+        tasks = self._watch_tasks + ([self._load_task] if self._load_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._watch_tasks = []
+        self._load_task = None
+
+
+def _level(value: Any) -> str:
+    """Permission levels may be stored as enum members or plain strings"""
+    return getattr(value, "value", value)
@@ -0,0 +1,303 @@
+"""
+PiKVM Discovery Module
+Concurrent subnet scanning for PiKVM devices with streamed results and cancellable jobs
+"""
+
+import asyncio
+import ipaddress
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = [80, 443]
+HTTPS_PORTS = {443, 8443}
+
+# Largest scan accepted in one job (a /16)
+MAX_DISCOVERY_HOSTS = int(os.getenv("DISCOVERY_MAX_HOSTS", "65536"))
+
+
+def parse_targets(cidrs: List[str]) -> Tuple[List[ipaddress.IPv4Network], int]:
+    """Parse CIDR ranges (or single addresses) and count the hosts they cover.
+
+    Raises ValueError for malformed ranges, IPv6 and scans above MAX_DISCOVERY_HOSTS.
+    """
+    networks = []
+    total = 0
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr.strip(), strict=False)
+        if network.version != 4:
+            raise ValueError(f"Only IPv4 ranges can be scanned: {cidr}")
+        networks.append(network)
+        total += network.num_addresses if network.prefixlen >= 31 else network.num_addresses - 2
+    if total > MAX_DISCOVERY_HOSTS:
+        raise ValueError(f"Scan covers {total} hosts, the limit is {MAX_DISCOVERY_HOSTS}")
+    return networks, total
+
+
+def iter_hosts(networks: List[ipaddress.IPv4Network]) -> Iterator[str]:
+    seen = set()
+    for network in networks:
+        hosts = network.hosts() if network.prefixlen < 31 else iter(network)
+        for host in hosts:
+            address = str(host)
+            if address not in seen:
+                seen.add(address)
+                yield address
+
+
+class DiscoveryJob:
+    """A scan of one or more address ranges"""
+
+    def __init__(self, cidrs: List[str], ports: List[int], total_hosts: int, concurrency: int,
+                 connect_timeout: float, http_timeout: float, created_by: str):
+        self.id = str(uuid.uuid4())
+        self.cidrs = cidrs
+        self.ports = ports
+        self.total_hosts = total_hosts
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.http_timeout = http_timeout
+        self.created_by = created_by
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.status = "pending"
+        self.scanned = 0
+        self.open_ports = 0
+        self.found: List[Dict[str, Any]] = []
+        self.task: Optional[asyncio.Task] = None
+        self._started = time.monotonic()
+        self._progress_every = max(total_hosts // 100, 1)
+        self._subscribers: List[asyncio.Queue] = []
+
+    def _publish(self, event: Dict[str, Any]):
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def add_found(self, device: Dict[str, Any]):
+        self.found.append(device)
+        self._publish({"type": "device_found", "job_id": self.id, **device})
+
+    def host_scanned(self):
+        self.scanned += 1
+        if self.scanned % self._progress_every == 0:
+            self._publish({"type": "progress", **self.summary()})
+
+    def finish(self, status: str):
+        self.status = status
+        self.finished_at = datetime.utcnow()
+        self._publish({"type": "job_complete", **self.summary()})
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = ((self.finished_at - self.created_at).total_seconds() if self.finished_at
+                   else time.monotonic() - self._started)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "cidrs": self.cidrs,
+            "ports": self.ports,
+            "total_hosts": self.total_hosts,
+            "scanned": self.scanned,
+            "open_ports": self.open_ports,
+            "found": len(self.found),
+            "concurrency": self.concurrency,
+            "elapsed_seconds": round(elapsed, 2),
+            "hosts_per_second": round(self.scanned / elapsed, 1) if elapsed > 0 else 0.0,
+            "created_by": self.created_by,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    async def events(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield devices already found, then live progress until the scan ends"""
+        # Snapshot and subscribe without yielding in between, so nothing is missed or repeated
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        found = list(self.found)
+        finished = self.finished_at is not None
+        try:
+            for device in found:
+                yield {"type": "device_found", "job_id": self.id, **device}
+            if finished:
+                yield {"type": "job_complete", **self.summary()}
+                return
+
+            while True:
+                event = await queue.get()
+                yield event
+                if event["type"] == "job_complete":
+                    return
+        finally:
+            self._subscribers.remove(queue)
+
+
+class PiKVMDiscovery:
+    """Runs discovery scans and keeps the most recent ones for inspection.
+
+    Each scan uses a fixed pool of ``concurrency`` workers pulling addresses
+    from a shared iterator, so memory stays flat however large the range is.
+    A host is first checked with a plain TCP connect on every port; only open
+    ports get an HTTP request to fingerprint the PiKVM API.
+    """
+
+    def __init__(self, max_jobs: int = 20):
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, DiscoveryJob]" = OrderedDict()
+
+    def start_job(self, cidrs: List[str], created_by: str, ports: Optional[List[int]] = None,
+                  concurrency: int = 256, connect_timeout: float = 0.5, http_timeout: float = 3.0,
+                  username: Optional[str] = None, password: Optional[str] = None) -> DiscoveryJob:
+        """Validate the ranges, create a job and start scanning in the background"""
+        networks, total = parse_targets(cidrs)
+        ports = list(dict.fromkeys(ports or DEFAULT_PORTS))
+        job = DiscoveryJob(cidrs, ports, total, concurrency, connect_timeout, http_timeout, created_by)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.max_jobs:
+            _, old = self.jobs.popitem(last=False)
+            if old.task and not old.task.done():
+                old.task.cancel()
+
+        job.task = asyncio.create_task(self._run(job, iter_hosts(networks), username, password))
+        return job
+
+    def get_job(self, job_id: str) -> Optional[DiscoveryJob]:
+        return self.jobs.get(job_id)
+
+    async def _port_open(self, host: str, port: int, timeout: float) -> bool:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    async def _fingerprint(self, session: aiohttp.ClientSession, host: str, port: int, timeout: float,
+                           username: Optional[str], password: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Check whether an open port serves the PiKVM API"""
+        scheme = "https" if port in HTTPS_PORTS else "http"
+        base_url = f"{scheme}://{host}:{port}"
+        headers = {"X-KVMD-User": username, "X-KVMD-Passwd": password} if username else {}
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        started = time.monotonic()
+
+        try:
+            async with session.get(f"{base_url}/api/auth/check", headers=headers,
+                                   timeout=client_timeout, allow_redirects=False) as response:
+                if response.status not in (200, 401, 403):
+                    return None
+                data = await response.json(content_type=None)
+                latency_ms = round((time.monotonic() - started) * 1000, 1)
+                authenticated = response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+
+        # kvmd wraps every answer, including auth errors, as {"ok": ..., "result": ...}
+        if not isinstance(data, dict) or "ok" not in data or "result" not in data:
+            return None
+
+        device = {
+            "ip_address": host if port in (80, 443) else f"{host}:{port}",
+            "host": host,
+            "port": port,
+            "use_https": scheme == "https",
+            "authenticated": authenticated,
+            "latency_ms": latency_ms,
+            "hostname": None,
+            "version": None,
+            "platform": None,
+            "discovered_at": datetime.utcnow().isoformat()
+        }
+
+        if authenticated:
+            try:
+                async with session.get(f"{base_url}/api/info", headers=headers, timeout=client_timeout) as response:
+                    if response.status == 200:
+                        info = (await response.json(content_type=None)).get("result") or {}
+                        device["hostname"] = (info.get("meta") or {}).get("server", {}).get("host")
+                        device["version"] = (info.get("system") or {}).get("kvmd", {}).get("version")
+                        device["platform"] = (info.get("hw") or {}).get("platform", {}).get("type")
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, AttributeError):
+                pass
+
+        return device
+
+    async def _scan_host(self, job: DiscoveryJob, session: aiohttp.ClientSession, host: str,
+                         username: Optional[str], password: Optional[str]):
+        for port in job.ports:
+            if not await self._port_open(host, port, job.connect_timeout):
+                continue
+            job.open_ports += 1
+            device = await self._fingerprint(session, host, port, job.http_timeout, username, password)
+            if device:
+                job.add_found(device)
+                # One PiKVM per address; 80 usually just redirects to 443
+                return
+
+    async def _worker(self, job: DiscoveryJob, hosts: Iterator[str], session: aiohttp.ClientSession,
+                      username: Optional[str], password: Optional[str]):
+        for host in hosts:
+            try:
+                await self._scan_host(job, session, host, username, password)
+            except Exception as e:
+                logger.warning(f"Discovery probe of {host} failed: {str(e)}")
+            job.host_scanned()
+
+    async def _run(self, job: DiscoveryJob, hosts: Iterator[str],
+                   username: Optional[str], password: Optional[str]):
+        job.status = "running"
+        connector = aiohttp.TCPConnector(limit=job.concurrency, ssl=False, force_close=True)
+        workers = []
+        try:
+            async with aiohttp.ClientSession(connector=connector) as session:
+                workers = [
+                    asyncio.create_task(self._worker(job, hosts, session, username, password))
+                    for _ in range(min(job.concurrency, max(job.total_hosts, 1)))
+                ]
+                await asyncio.gather(*workers)
+            job.finish("completed")
+            logger.info(f"Discovery {job.id} found {len(job.found)} PiKVM devices in {job.scanned} hosts")
+        except asyncio.CancelledError:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            job.finish("cancelled")
+            raise
+
+    async def scan(self, cidrs: List[str], **kwargs) -> List[Dict[str, Any]]:
+        """Run a scan to completion and return the devices found"""
+        job = self.start_job(cidrs, created_by=kwargs.pop("created_by", "system"), **kwargs)
+        await job.task
+        return job.found
+
+    async def cancel_job(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if not job or not job.task or job.task.done():
+            return False
+        job.task.cancel()
+        try:
+            await job.task
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    async def cleanup(self):
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.jobs.clear()
+
+
+# Global discovery instance
+pikvm_discovery = PiKVMDiscovery()
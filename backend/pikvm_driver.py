@@ -0,0 +1,367 @@
+"""
+PiKVM Device Driver
+Single async driver per physical PiKVM with a shared connection pool, circuit breaker and HID channel
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+
+import aiohttp
+
+from pikvm_hid import PiKVMHIDChannel
+from keymaps import text_to_events, TYPE_TEXT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Dashboard power actions mapped to PiKVM ATX endpoints and their argument.
+# "power_off" is the soft ATX off; callers that need to cut power use "power_off_hard".
+ATX_ACTIONS = {
+    "power_on": ("power", "action", "on"),
+    "power_off": ("power", "action", "off"),
+    "power_off_hard": ("power", "action", "off_hard"),
+    "restart": ("power", "action", "reset_hard"),
+    "reset": ("power", "action", "reset_hard"),
+    "sleep": ("click", "button", "power"),
+}
+
+
+class PiKVMError(Exception):
+    """Raised when a PiKVM request fails"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(PiKVMError):
+    """Raised without contacting the device while its circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops hammering a device that keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    requests fail fast. Once ``reset_timeout`` has passed a single trial
+    request is let through; success closes the circuit again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Let one trial request through per reset period
+            self.state = "half_open"
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.state = "closed"
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class DriverResponse:
+    def __init__(self, status: int, content_type: str, body: bytes):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+
+    def json(self) -> Any:
+        return json.loads(self.body) if self.body else {}
+
+    def result(self) -> Any:
+        """PiKVM wraps payloads as {"ok": ..., "result": ...}"""
+        data = self.json()
+        if isinstance(data, dict) and "result" in data:
+            return data["result"]
+        return data
+
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+
+def split_host_port(address: str, default_port: int = 80) -> Tuple[str, int]:
+    """Accept both "10.0.0.5" and "10.0.0.5:8080" style addresses"""
+    if address.count(":") == 1:
+        host, port = address.split(":")
+        if port.isdigit():
+            return host, int(port)
+    return address, default_port
+
+
+def box_key(address: str, default_port: int = 80) -> str:
+    """Identify the PiKVM box behind an address, whichever device id refers to it"""
+    host, port = split_host_port(address, default_port)
+    return f"{host}:{port}"
+
+
+class PiKVMDriver:
+    """Async client for one physical PiKVM box"""
+
+    def __init__(self, host: str, port: int, username: str, password: str, use_https: bool,
+                 session_getter, request_timeout: float = 10.0):
+        protocol = "https" if use_https else "http"
+        self.base_url = f"{protocol}://{host}:{port}"
+        self.host = host
+        self.port = port
+        self.username = username
+        self.request_timeout = request_timeout
+        self.device_ids: Set[str] = set()
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("PIKVM_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("PIKVM_BREAKER_RESET_SECONDS", "30"))
+        )
+        self.stats = {"requests": 0, "failures": 0, "rejected": 0}
+
+        self._auth_headers = {"X-KVMD-User": username, "X-KVMD-Passwd": password}
+        self._session_getter = session_getter
+        self.hid = PiKVMHIDChannel(self.base_url, username, password, session_getter=session_getter)
+
+    async def request(self, method: str, endpoint: str, timeout: Optional[float] = None,
+                      **kwargs) -> DriverResponse:
+        """Send a request through the shared pool, guarded by the circuit breaker"""
+        if not self.breaker.allow():
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(f"Circuit open for {self.base_url}")
+
+        session = await self._session_getter()
+        headers = kwargs.pop("headers", {})
+        headers.update(self._auth_headers)
+        self.stats["requests"] += 1
+
+        try:
+            async with session.request(
+                method, f"{self.base_url}{endpoint}",
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=timeout or self.request_timeout),
+                ssl=False,
+                **kwargs
+            ) as response:
+                body = await response.read()
+                if response.status >= 500:
+                    self.breaker.record_failure()
+                    self.stats["failures"] += 1
+                    raise PiKVMError(f"HTTP {response.status}: {body[:200].decode(errors='replace')}", response.status)
+
+                # A 4xx still proves the device is reachable
+                self.breaker.record_success()
+                if response.status >= 400:
+                    raise PiKVMError(f"HTTP {response.status}: {body[:200].decode(errors='replace')}", response.status)
+                return DriverResponse(response.status, response.content_type, body)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.breaker.record_failure()
+            self.stats["failures"] += 1
+            raise PiKVMError(f"Error connecting to PiKVM {self.base_url}: {str(e) or type(e).__name__}")
+
+    async def auth_check(self) -> bool:
+        try:
+            await self.request("GET", "/api/auth/check", timeout=5)
+            return True
+        except PiKVMError:
+            return False
+
+    async def get_info(self) -> Dict[str, Any]:
+        return (await self.request("GET", "/api/info")).result()
+
+    async def get_hw_info(self) -> Dict[str, Any]:
+        return (await self.request("GET", "/api/hw")).result()
+
+    async def get_capabilities(self) -> Dict[str, bool]:
+        """Probe the PiKVM subsystems concurrently"""
+        async def probe(endpoint: str) -> bool:
+            try:
+                await self.request("GET", endpoint, timeout=3)
+                return True
+            except PiKVMError:
+                return False
+
+        atx, hid, streamer, msd = await asyncio.gather(
+            probe("/api/atx"), probe("/api/hid"), probe("/api/streamer"), probe("/api/msd")
+        )
+        return {
+            "power_control": atx,
+            "hid_control": hid,
+            "video_streaming": streamer,
+            "mass_storage": msd,
+            "webrtc": False
+        }
+
+    async def power_action(self, action: str) -> Any:
+        """Execute a dashboard power action (power_on, power_off, restart, reset, sleep)"""
+        if action not in ATX_ACTIONS:
+            raise PiKVMError(f"Unsupported power action: {action}")
+        endpoint, param, value = ATX_ACTIONS[action]
+        response = await self.request("POST", f"/api/atx/{endpoint}", params={param: value})
+        return response.result()
+
+    async def type_text(self, text: str, keymap: str = "en-us") -> str:
+        """Type a whole string, returning the method that was used"""
+        try:
+            # PiKVM translates the text with its own keymap in a single request
+            await self.request(
+                "POST", "/api/hid/print",
+                params={"limit": "0", "keymap": keymap},
+                data=text.encode("utf-8"),
+                headers={"Content-Type": "text/plain; charset=utf-8"},
+                timeout=max(self.request_timeout, len(text) / 100)
+            )
+            return "print"
+        except CircuitOpenError:
+            raise
+        except PiKVMError as e:
+            logger.info(f"Falling back to HID channel typing for {self.base_url}: {str(e)}")
+
+        # Older firmware: stream precomputed key sequences over the HID channel
+        events = text_to_events(text, keymap)
+        for start in range(0, len(events), TYPE_TEXT_BATCH_SIZE):
+            if not await self.hid.send_events(events[start:start + TYPE_TEXT_BATCH_SIZE]):
+                raise PiKVMError("HID channel unavailable")
+        return "hid_channel"
+
+    async def snapshot(self, preview: bool = True, quality: int = 80) -> DriverResponse:
+        params = {"preview": "1", "preview_quality": str(quality)} if preview else {}
+        return await self.request("GET", "/api/streamer/snapshot", params=params)
+
+    async def set_streamer_params(self, quality: int = 80, fps: int = 30):
+        await self.request("POST", "/api/streamer/set_params", params={"quality": quality, "desired_fps": fps})
+
+    async def mount_iso(self, image: str):
+        await self.request("POST", "/api/msd/set_params", params={"image": image})
+
+    async def reset_hid(self):
+        await self.request("POST", "/api/hid/reset")
+
+    def stream_url(self) -> str:
+        return f"{self.base_url}/api/streamer/stream"
+
+    async def get_status(self) -> Dict[str, Any]:
+        """Get comprehensive device status"""
+        info, hw_info = await asyncio.gather(self.get_info(), self.get_hw_info(), return_exceptions=True)
+        status = {
+            "online": not isinstance(info, Exception),
+            "timestamp": datetime.utcnow().isoformat(),
+            "info": None if isinstance(info, Exception) else info,
+            "hardware": None if isinstance(hw_info, Exception) else hw_info
+        }
+        if isinstance(info, Exception):
+            status["error"] = str(info)
+        return status
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "device_ids": sorted(self.device_ids),
+            "circuit": self.breaker.state,
+            "hid": self.hid.get_stats(),
+            **self.stats
+        }
+
+    async def close(self):
+        await self.hid.close()
+
+
+class PiKVMDriverPool:
+    """One driver per physical PiKVM, shared by every device id and route that targets it"""
+
+    def __init__(self):
+        self.connections_per_device = int(os.getenv("PIKVM_CONNECTIONS_PER_DEVICE", "4"))
+        self.drivers: Dict[Tuple, PiKVMDriver] = {}
+        self.device_keys: Dict[str, Tuple] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=0,
+                limit_per_host=self.connections_per_device,
+                ttl_dns_cache=300,
+                ssl=False
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def acquire(self, device_id: str, address: str, port: int, username: str, password: str,
+                use_https: bool = False) -> PiKVMDriver:
+        """Get the driver for a device, sharing it with other ids that target the same box"""
+        host, port = split_host_port(address, port)
+        # A changed password gets a new driver instead of reusing the old login
+        secret = hashlib.sha256(password.encode()).hexdigest()
+        key = ("https" if use_https else "http", host, port, username, secret)
+
+        current = self.device_keys.get(device_id)
+        if current == key:
+            return self.drivers[key]
+        if current is not None:
+            stale = self._detach(device_id)
+            if stale:
+                asyncio.get_running_loop().create_task(stale.close())
+
+        driver = self.drivers.get(key)
+        if driver is None:
+            driver = PiKVMDriver(host, port, username, password, use_https, self._get_session)
+            self.drivers[key] = driver
+        driver.device_ids.add(device_id)
+        self.device_keys[device_id] = key
+        return driver
+
+    def get(self, device_id: str) -> Optional[PiKVMDriver]:
+        key = self.device_keys.get(device_id)
+        return self.drivers.get(key) if key else None
+
+    def _detach(self, device_id: str) -> Optional[PiKVMDriver]:
+        key = self.device_keys.pop(device_id, None)
+        driver = self.drivers.get(key) if key else None
+        if driver is None:
+            return None
+        driver.device_ids.discard(device_id)
+        if driver.device_ids:
+            return None
+        del self.drivers[key]
+        return driver
+
+    async def release(self, device_id: str):
+        """Stop using a driver for a device, closing it when nothing else needs it"""
+        driver = self._detach(device_id)
+        if driver:
+            await driver.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "drivers": len(self.drivers),
+            "device_ids": len(self.device_keys),
+            "open_circuits": sum(1 for driver in self.drivers.values() if driver.breaker.state != "closed"),
+            "connections_per_device": self.connections_per_device
+        }
+
+    async def cleanup(self):
+        for driver in self.drivers.values():
+            await driver.close()
+        self.drivers.clear()
+        self.device_keys.clear()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+# Global driver pool instance
+pikvm_drivers = PiKVMDriverPool()
@@ -3,18 +3,26 @@ PiKVM Hardware Integration Module
 Real hardware integration for PiKVM devices
 """
 
-import aiohttp
 import asyncio
 import logging
 import base64
-import json
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Awaitable, Callable
 from datetime import datetime
 from pydantic import BaseModel, Field
 from enum import Enum
 
+from pikvm_driver import pikvm_drivers, PiKVMDriver, box_key
+from pikvm_hid import key_event, mouse_move_event, mouse_button_event, mouse_wheel_event
+from device_sharding import device_sharding
+
 logger = logging.getLogger(__name__)
 
+# Hardware devices have always cut power on "power_off" and used the soft off for "sleep"
+HARDWARE_POWER_ACTIONS = {
+    "power_off": "power_off_hard",
+    "sleep": "power_off"
+}
+
 class PiKVMConnectionStatus(str, Enum):
     CONNECTED = "connected"
     DISCONNECTED = "disconnected"
@@ -38,48 +46,71 @@ class PiKVMHardwareManager:
     
     def __init__(self):
         self.devices: Dict[str, PiKVMDevice] = {}
-        self.sessions: Dict[str, aiohttp.ClientSession] = {}
-        self.auth_tokens: Dict[str, str] = {}
+        # Optional coroutine that loads a device missing from memory (set by the registry loader)
+        self.hydrator: Optional[Callable[[str], Awaitable[Any]]] = None
         
     async def add_device(self, device: PiKVMDevice) -> bool:
         """Add a new PiKVM device"""
         try:
             # Test connection first
             if await self.test_connection(device):
-                self.devices[device.id] = device
+                self.register_device(device)
                 logger.info(f"Added PiKVM device: {device.name} ({device.ip_address})")
                 return True
             else:
                 logger.error(f"Failed to connect to PiKVM device: {device.name} ({device.ip_address})")
+                if device.id not in self.devices:
+                    await pikvm_drivers.release(device.id)
                 return False
         except Exception as e:
             logger.error(f"Error adding device {device.name}: {str(e)}")
             return False
     
+    def register_device(self, device: PiKVMDevice):
+        """Add a known device to the registry without testing the connection"""
+        self.devices[device.id] = device
+        device_sharding.bind(device.id, box_key(device.ip_address, device.port))
+    
+    async def remove_device(self, device_id: str):
+        """Drop a device and release its driver"""
+        self.devices.pop(device_id, None)
+        device_sharding.unbind(device_id)
+        await pikvm_drivers.release(device_id)
+    
+    async def _get_device(self, device_id: str) -> Optional[PiKVMDevice]:
+        """Look up a device, hydrating it from the database on first use.
+
+        Commands look the device up before deciding whether to forward it, as
+        registering it binds it to its box and the box decides the owner.
+        """
+        if device_id not in self.devices and self.hydrator is not None:
+            await self.hydrator(device_id)
+        return self.devices.get(device_id)
+    
+    def _driver(self, device: PiKVMDevice) -> PiKVMDriver:
+        """Get the shared driver for the PiKVM behind a device"""
+        return pikvm_drivers.acquire(
+            device.id, device.ip_address, device.port, device.username, device.password, device.use_https
+        )
+    
     async def test_connection(self, device: PiKVMDevice) -> bool:
         """Test connection to a PiKVM device"""
         try:
-            protocol = "https" if device.use_https else "http"
-            base_url = f"{protocol}://{device.ip_address}:{device.port}"
+            driver = self._driver(device)
             
-            async with aiohttp.ClientSession() as session:
-                # Test authentication
-                auth_url = f"{base_url}/api/auth/check"
-                auth = aiohttp.BasicAuth(device.username, device.password)
+            # Test authentication
+            if await driver.auth_check():
+                device.status = PiKVMConnectionStatus.CONNECTED
+                device.last_heartbeat = datetime.now()
                 
-                async with session.get(auth_url, auth=auth, timeout=5) as response:
-                    if response.status == 200:
-                        device.status = PiKVMConnectionStatus.CONNECTED
-                        device.last_heartbeat = datetime.now()
-                        
-                        # Get device capabilities
-                        capabilities = await self.get_device_capabilities(device)
-                        device.capabilities = capabilities
-                        
-                        return True
-                    else:
-                        device.status = PiKVMConnectionStatus.ERROR
-                        return False
+                # Get device capabilities
+                capabilities = await self.get_device_capabilities(device)
+                device.capabilities = capabilities
+                
+                return True
+            else:
+                device.status = PiKVMConnectionStatus.ERROR
+                return False
                         
         except Exception as e:
             logger.error(f"Connection test failed for {device.name}: {str(e)}")
@@ -89,146 +120,33 @@ class PiKVMHardwareManager:
     async def get_device_capabilities(self, device: PiKVMDevice) -> Dict[str, bool]:
         """Get capabilities of a PiKVM device"""
         try:
-            protocol = "https" if device.use_https else "http"
-            base_url = f"{protocol}://{device.ip_address}:{device.port}"
-            
-            async with aiohttp.ClientSession() as session:
-                auth = aiohttp.BasicAuth(device.username, device.password)
-                
-                # Check various capabilities
-                capabilities = {
-                    "power_control": False,
-                    "hid_control": False,
-                    "video_streaming": False,
-                    "mass_storage": False,
-                    "webrtc": False
-                }
-                
-                # Test ATX (power control)
-                try:
-                    async with session.get(f"{base_url}/api/atx", auth=auth, timeout=3) as response:
-                        if response.status == 200:
-                            capabilities["power_control"] = True
-                except:
-                    pass
-                
-                # Test HID (keyboard/mouse)
-                try:
-                    async with session.get(f"{base_url}/api/hid", auth=auth, timeout=3) as response:
-                        if response.status == 200:
-                            capabilities["hid_control"] = True
-                except:
-                    pass
-                
-                # Test video streaming
-                try:
-                    async with session.get(f"{base_url}/api/streamer", auth=auth, timeout=3) as response:
-                        if response.status == 200:
-                            capabilities["video_streaming"] = True
-                except:
-                    pass
-                
-                # Test mass storage
-                try:
-                    async with session.get(f"{base_url}/api/msd", auth=auth, timeout=3) as response:
-                        if response.status == 200:
-                            capabilities["mass_storage"] = True
-                except:
-                    pass
-                
-                return capabilities
-                
+            return await self._driver(device).get_capabilities()
         except Exception as e:
             logger.error(f"Error getting capabilities for {device.name}: {str(e)}")
             return {}
     
-    async def authenticate_device(self, device_id: str) -> Optional[str]:
-        """Authenticate with a PiKVM device and get session token"""
-        try:
-            device = self.devices.get(device_id)
-            if not device:
-                return None
-            
-            protocol = "https" if device.use_https else "http"
-            base_url = f"{protocol}://{device.ip_address}:{device.port}"
-            
-            # Create session if not exists
-            if device_id not in self.sessions:
-                self.sessions[device_id] = aiohttp.ClientSession()
-            
-            session = self.sessions[device_id]
-            auth = aiohttp.BasicAuth(device.username, device.password)
-            
-            # Get authentication token if needed
-            async with session.post(f"{base_url}/api/auth/login", auth=auth) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    token = data.get("access_token")
-                    if token:
-                        self.auth_tokens[device_id] = token
-                        return token
-            
-            # Fallback to basic auth
-            return "basic_auth"
-            
-        except Exception as e:
-            logger.error(f"Authentication failed for device {device_id}: {str(e)}")
-            return None
-    
     async def power_action(self, device_id: str, action: str) -> Dict[str, Any]:
         """Execute power action on PiKVM device"""
         try:
-            device = self.devices.get(device_id)
+            device = await self._get_device(device_id)
             if not device:
                 raise ValueError(f"Device {device_id} not found")
             
+            if device_sharding.should_forward(device_id):
+                return await device_sharding.forward("hardware.power_action", device_id, action)
+            
             if not device.capabilities.get("power_control", False):
                 raise ValueError(f"Device {device_id} does not support power control")
             
-            protocol = "https" if device.use_https else "http"
-            base_url = f"{protocol}://{device.ip_address}:{device.port}"
-            
-            session = self.sessions.get(device_id)
-            if not session:
-                await self.authenticate_device(device_id)
-                session = self.sessions.get(device_id)
+            result = await self._driver(device).power_action(HARDWARE_POWER_ACTIONS.get(action, action))
             
-            auth = aiohttp.BasicAuth(device.username, device.password)
-            
-            # Map actions to PiKVM ATX commands
-            action_map = {
-                "power_on": "power_on",
-                "power_off": "power_off_hard",
-                "restart": "power_reset_hard",
-                "reset": "power_reset_hard",
-                "sleep": "power_off"
+            return {
+                "success": True,
+                "action": action,
+                "device_id": device_id,
+                "pikvm_response": result,
+                "timestamp": datetime.now().isoformat()
             }
-            
-            pikvm_action = action_map.get(action, action)
-            
-            payload = {"action": pikvm_action}
-            
-            async with session.post(f"{base_url}/api/atx", 
-                                  auth=auth, 
-                                  json=payload) as response:
-                
-                if response.status == 200:
-                    result = await response.json()
-                    return {
-                        "success": True,
-                        "action": action,
-                        "device_id": device_id,
-                        "pikvm_response": result,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                else:
-                    error_text = await response.text()
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status}: {error_text}",
-                        "action": action,
-                        "device_id": device_id
-                    }
                     
         except Exception as e:
             logger.error(f"Power action {action} failed for device {device_id}: {str(e)}")
@@ -242,51 +160,42 @@ class PiKVMHardwareManager:
     async def send_keyboard_input(self, device_id: str, keys: List[str], modifiers: List[str] = None) -> Dict[str, Any]:
         """Send keyboard input to PiKVM device"""
         try:
-            device = self.devices.get(device_id)
+            device = await self._get_device(device_id)
             if not device:
                 raise ValueError(f"Device {device_id} not found")
             
+            if device_sharding.should_forward(device_id):
+                return await device_sharding.forward("hardware.keyboard", device_id, keys, modifiers)
+            
             if not device.capabilities.get("hid_control", False):
                 raise ValueError(f"Device {device_id} does not support HID control")
             
-            protocol = "https" if device.use_https else "http"
-            base_url = f"{protocol}://{device.ip_address}:{device.port}"
-            
-            session = self.sessions.get(device_id)
-            if not session:
-                await self.authenticate_device(device_id)
-                session = self.sessions.get(device_id)
+            channel = self._driver(device).hid
             
-            auth = aiohttp.BasicAuth(device.username, device.password)
+            if isinstance(keys, str):
+                keys = [keys]
             
-            # Build HID payload
-            payload = {
-                "keys": keys,
-                "modifiers": modifiers or []
-            }
+            # Hold modifiers around the keys, releasing everything in reverse order
+            modifiers = modifiers or []
+            events = [key_event(key, True) for key in modifiers + keys]
+            events += [key_event(key, False) for key in reversed(modifiers + keys)]
             
-            async with session.post(f"{base_url}/api/hid/keyboard", 
-                                  auth=auth, 
-                                  json=payload) as response:
-                
-                if response.status == 200:
-                    result = await response.json()
-                    return {
-                        "success": True,
-                        "keys": keys,
-                        "modifiers": modifiers,
-                        "device_id": device_id,
-                        "pikvm_response": result,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                else:
-                    error_text = await response.text()
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status}: {error_text}",
-                        "keys": keys,
-                        "device_id": device_id
-                    }
+            if await channel.send_events(events):
+                return {
+                    "success": True,
+                    "keys": keys,
+                    "modifiers": modifiers,
+                    "device_id": device_id,
+                    "pikvm_response": {"transport": "websocket", "events": len(events)},
+                    "timestamp": datetime.now().isoformat()
+                }
+            else:
+                return {
+                    "success": False,
+                    "error": "HID channel unavailable",
+                    "keys": keys,
+                    "device_id": device_id
+                }
                     
         except Exception as e:
             logger.error(f"Keyboard input failed for device {device_id}: {str(e)}")
@@ -300,57 +209,78 @@ class PiKVMHardwareManager:
     async def send_mouse_input(self, device_id: str, x: int, y: int, buttons: List[str] = None, scroll: int = 0) -> Dict[str, Any]:
         """Send mouse input to PiKVM device"""
         try:
-            device = self.devices.get(device_id)
+            device = await self._get_device(device_id)
             if not device:
                 raise ValueError(f"Device {device_id} not found")
             
+            if device_sharding.should_forward(device_id):
+                return await device_sharding.forward("hardware.mouse", device_id, x, y, buttons, scroll)
+            
             if not device.capabilities.get("hid_control", False):
                 raise ValueError(f"Device {device_id} does not support HID control")
             
-            protocol = "https" if device.use_https else "http"
-            base_url = f"{protocol}://{device.ip_address}:{device.port}"
+            channel = self._driver(device).hid
+            
+            events = [mouse_move_event(x, y)]
+            for button in buttons or []:
+                events.append(mouse_button_event(button, True))
+                events.append(mouse_button_event(button, False))
+            if scroll:
+                events.append(mouse_wheel_event(0, scroll))
+            
+            if await channel.send_events(events):
+                return {
+                    "success": True,
+                    "x": x,
+                    "y": y,
+                    "buttons": buttons,
+                    "scroll": scroll,
+                    "device_id": device_id,
+                    "pikvm_response": {"transport": "websocket", "events": len(events)},
+                    "timestamp": datetime.now().isoformat()
+                }
+            else:
+                return {
+                    "success": False,
+                    "error": "HID channel unavailable",
+                    "device_id": device_id
+                }
+                    
+        except Exception as e:
+            logger.error(f"Mouse input failed for device {device_id}: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "device_id": device_id
+            }
+    
+    async def type_text(self, device_id: str, text: str, keymap: str = "en-us") -> Dict[str, Any]:
+        """Type a whole string on the PiKVM device"""
+        try:
+            device = await self._get_device(device_id)
+            if not device:
+                raise ValueError(f"Device {device_id} not found")
             
-            session = self.sessions.get(device_id)
-            if not session:
-                await self.authenticate_device(device_id)
-                session = self.sessions.get(device_id)
+            if device_sharding.should_forward(device_id):
+                return await device_sharding.forward("hardware.type_text", device_id, text, keymap)
             
-            auth = aiohttp.BasicAuth(device.username, device.password)
+            if not device.capabilities.get("hid_control", False):
+                raise ValueError(f"Device {device_id} does not support HID control")
             
-            # Build HID payload
-            payload = {
-                "x": x,
-                "y": y,
-                "buttons": buttons or [],
-                "scroll": scroll
-            }
+            # The driver uses /api/hid/print and falls back to the HID channel
+            method = await self._driver(device).type_text(text, keymap)
             
-            async with session.post(f"{base_url}/api/hid/mouse", 
-                                  auth=auth, 
-                                  json=payload) as response:
-                
-                if response.status == 200:
-                    result = await response.json()
-                    return {
-                        "success": True,
-                        "x": x,
-                        "y": y,
-                        "buttons": buttons,
-                        "scroll": scroll,
-                        "device_id": device_id,
-                        "pikvm_response": result,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                else:
-                    error_text = await response.text()
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status}: {error_text}",
-                        "device_id": device_id
-                    }
+            return {
+                "success": True,
+                "device_id": device_id,
+                "characters": len(text),
+                "keymap": keymap,
+                "method": method,
+                "timestamp": datetime.now().isoformat()
+            }
                     
         except Exception as e:
-            logger.error(f"Mouse input failed for device {device_id}: {str(e)}")
+            logger.error(f"Text typing failed for device {device_id}: {str(e)}")
             return {
                 "success": False,
                 "error": str(e),
@@ -360,45 +290,26 @@ class PiKVMHardwareManager:
     async def get_video_snapshot(self, device_id: str) -> Dict[str, Any]:
         """Get video snapshot from PiKVM device"""
         try:
-            device = self.devices.get(device_id)
+            device = await self._get_device(device_id)
             if not device:
                 raise ValueError(f"Device {device_id} not found")
             
+            if device_sharding.should_forward(device_id):
+                return await device_sharding.forward("hardware.snapshot", device_id)
+            
             if not device.capabilities.get("video_streaming", False):
                 raise ValueError(f"Device {device_id} does not support video streaming")
             
-            protocol = "https" if device.use_https else "http"
-            base_url = f"{protocol}://{device.ip_address}:{device.port}"
-            
-            session = self.sessions.get(device_id)
-            if not session:
-                await self.authenticate_device(device_id)
-                session = self.sessions.get(device_id)
-            
-            auth = aiohttp.BasicAuth(device.username, device.password)
+            response = await self._driver(device).snapshot(preview=True, quality=80)
+            image_base64 = base64.b64encode(response.body).decode('utf-8')
             
-            async with session.get(f"{base_url}/api/streamer/snapshot", 
-                                 auth=auth, 
-                                 params={"preview": "1", "preview_quality": "80"}) as response:
-                
-                if response.status == 200:
-                    image_data = await response.read()
-                    image_base64 = base64.b64encode(image_data).decode('utf-8')
-                    
-                    return {
-                        "success": True,
-                        "device_id": device_id,
-                        "image_data": image_base64,
-                        "content_type": response.headers.get("content-type", "image/jpeg"),
-                        "timestamp": datetime.now().isoformat()
-                    }
-                else:
-                    error_text = await response.text()
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status}: {error_text}",
-                        "device_id": device_id
-                    }
+            return {
+                "success": True,
+                "device_id": device_id,
+                "image_data": image_base64,
+                "content_type": response.content_type or "image/jpeg",
+                "timestamp": datetime.now().isoformat()
+            }
                     
         except Exception as e:
             logger.error(f"Video snapshot failed for device {device_id}: {str(e)}")
@@ -411,7 +322,7 @@ class PiKVMHardwareManager:
     async def get_device_status(self, device_id: str) -> Dict[str, Any]:
         """Get comprehensive status of PiKVM device"""
         try:
-            device = self.devices.get(device_id)
+            device = await self._get_device(device_id)
             if not device:
                 raise ValueError(f"Device {device_id} not found")
             
@@ -438,11 +349,14 @@ class PiKVMHardwareManager:
             }
     
     async def cleanup(self):
-        """Clean up sessions and connections"""
-        for session in self.sessions.values():
-            await session.close()
-        self.sessions.clear()
-        self.auth_tokens.clear()
+        """Release the drivers of every device"""
+        for device_id in list(self.devices):
+            await pikvm_drivers.release(device_id)
 
 # Global hardware manager instance
-pikvm_hardware_manager = PiKVMHardwareManager()
\ No newline at end of file
+pikvm_hardware_manager = PiKVMHardwareManager()
+device_sharding.register("hardware.power_action", pikvm_hardware_manager.power_action)
+device_sharding.register("hardware.keyboard", pikvm_hardware_manager.send_keyboard_input)
+device_sharding.register("hardware.mouse", pikvm_hardware_manager.send_mouse_input)
+device_sharding.register("hardware.type_text", pikvm_hardware_manager.type_text)
+device_sharding.register("hardware.snapshot", pikvm_hardware_manager.get_video_snapshot)
\ No newline at end of file
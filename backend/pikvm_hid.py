@@ -0,0 +1,286 @@
+"""
+PiKVM HID Channel
+Persistent WebSocket channel to PiKVM /api/ws for keyboard and mouse events
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Any, Tuple, Awaitable, Callable
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Friendly key names used by the dashboard mapped to PiKVM key names
+# (PiKVM uses the browser KeyboardEvent.code naming)
+KEY_ALIASES = {
+    "ctrl": "ControlLeft",
+    "control": "ControlLeft",
+    "alt": "AltLeft",
+    "shift": "ShiftLeft",
+    "cmd": "MetaLeft",
+    "win": "MetaLeft",
+    "meta": "MetaLeft",
+    "super": "MetaLeft",
+    "del": "Delete",
+    "delete": "Delete",
+    "tab": "Tab",
+    "enter": "Enter",
+    "return": "Enter",
+    "esc": "Escape",
+    "escape": "Escape",
+    "backspace": "Backspace",
+    "space": "Space",
+    "insert": "Insert",
+    "home": "Home",
+    "end": "End",
+    "pageup": "PageUp",
+    "pagedown": "PageDown",
+    "up": "ArrowUp",
+    "down": "ArrowDown",
+    "left": "ArrowLeft",
+    "right": "ArrowRight",
+    "capslock": "CapsLock",
+    "printscreen": "PrintScreen",
+}
+
+
+def normalize_key(key: str) -> str:
+    """Translate a dashboard key name into a PiKVM key name"""
+    alias = KEY_ALIASES.get(key.lower())
+    if alias:
+        return alias
+    if len(key) == 1 and key.isalpha():
+        return f"Key{key.upper()}"
+    if len(key) == 1 and key.isdigit():
+        return f"Digit{key}"
+    if key.lower().startswith("f") and key[1:].isdigit():
+        return key.upper()
+    return key
+
+
+def key_event(key: str, state: bool) -> Dict[str, Any]:
+    return {"event_type": "key", "event": {"key": normalize_key(key), "state": state}}
+
+
+def mouse_move_event(x: int, y: int) -> Dict[str, Any]:
+    return {"event_type": "mouse_move", "event": {"to": {"x": x, "y": y}}}
+
+
+def mouse_button_event(button: str, state: bool) -> Dict[str, Any]:
+    return {"event_type": "mouse_button", "event": {"button": button, "state": state}}
+
+
+def mouse_wheel_event(delta_x: int, delta_y: int) -> Dict[str, Any]:
+    return {"event_type": "mouse_wheel", "event": {"delta": {"x": delta_x, "y": delta_y}}}
+
+
+def key_combination_events(keys: List[str]) -> List[Dict[str, Any]]:
+    """Press all keys in order, then release them in reverse order"""
+    return [key_event(key, True) for key in keys] + [key_event(key, False) for key in reversed(keys)]
+
+
+class PiKVMHIDChannel:
+    """Long-lived upstream WebSocket carrying HID events to a single PiKVM.
+
+    Events are queued and written by a single task, so they reach the device
+    in the order they were submitted. The connection is re-established with
+    exponential backoff whenever it drops.
+    """
+
+    def __init__(self, base_url: str, username: str, password: str,
+                 queue_size: int = 1000, send_timeout: float = 5.0,
+                 connect_timeout: float = 5.0, max_backoff: float = 10.0,
+                 session_getter: Optional[Callable[[], Awaitable[aiohttp.ClientSession]]] = None):
+        self.ws_url = base_url.replace("https://", "wss://", 1).replace("http://", "ws://", 1) + "/api/ws?stream=0"
+        self.username = username
+        self.password = password
+        self.send_timeout = send_timeout
+        self.connect_timeout = connect_timeout
+        self.max_backoff = max_backoff
+        self.connected = False
+        self.stats = {"sent": 0, "dropped": 0, "reconnects": 0}
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # A shared session may be supplied by the caller; otherwise the channel owns one
+        self._session_getter = session_getter
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def _ensure_started(self):
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._run())
+
+    async def send_events(self, events: List[Dict[str, Any]]) -> bool:
+        """Queue a batch of HID events and wait until they are written upstream.
+
+        The batch is written as one unit, so key combinations are never
+        interleaved with events from other callers.
+        """
+        if self._closed or not events:
+            return False
+
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((events, future))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += len(events)
+            logger.warning(f"HID queue full for {self.ws_url}, dropping {len(events)} events")
+            return False
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.send_timeout)
+        except asyncio.TimeoutError:
+            # Mark the batch stale so the writer skips it instead of replaying it late
+            future.cancel()
+            logger.warning(f"HID events timed out for {self.ws_url}")
+            return False
+
+    async def send_key(self, key: str, state: bool = True) -> bool:
+        return await self.send_events([key_event(key, state)])
+
+    async def send_key_combination(self, keys: List[str]) -> bool:
+        return await self.send_events(key_combination_events(keys))
+
+    async def send_mouse_move(self, x: int, y: int) -> bool:
+        return await self.send_events([mouse_move_event(x, y)])
+
+    async def send_mouse_button(self, button: str = "left", state: bool = True) -> bool:
+        return await self.send_events([mouse_button_event(button, state)])
+
+    async def send_mouse_click(self, x: int, y: int, button: str = "left") -> bool:
+        return await self.send_events([
+            mouse_move_event(x, y),
+            mouse_button_event(button, True),
+            mouse_button_event(button, False),
+        ])
+
+    async def send_mouse_wheel(self, delta_x: int = 0, delta_y: int = 0) -> bool:
+        return await self.send_events([mouse_wheel_event(delta_x, delta_y)])
+
+    async def _connect(self):
+        if self._session_getter is not None:
+            session = await self._session_getter()
+        else:
+            if self._session is None or self._session.closed:
+                self._session = aiohttp.ClientSession()
+            session = self._session
+
+        headers = {"X-KVMD-User": self.username, "X-KVMD-Passwd": self.password}
+        self._ws = await session.ws_connect(
+            self.ws_url,
+            headers=headers,
+            heartbeat=15,
+            timeout=self.connect_timeout,
+            ssl=False
+        )
+        self._reader_task = asyncio.create_task(self._drain(self._ws))
+        self.connected = True
+        logger.info(f"HID channel connected: {self.ws_url}")
+
+    async def _drain(self, ws: aiohttp.ClientWebSocketResponse):
+        """Consume state pushes from PiKVM so the socket never stalls"""
+        try:
+            async for _ in ws:
+                pass
+        except Exception:
+            pass
+        finally:
+            if self._ws is ws:
+                self.connected = False
+
+    async def _disconnect(self):
+        self.connected = False
+        if self._reader_task:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._ws is not None:
+            try:
+                await self._ws.close()
+            except Exception:
+                pass
+            self._ws = None
+
+    async def _run(self):
+        backoff = 0.5
+        pending: Optional[Tuple[List[Dict[str, Any]], asyncio.Future]] = None
+        offset = 0
+
+        while not self._closed:
+            if not self.connected:
+                try:
+                    await self._disconnect()
+                    await self._connect()
+                    backoff = 0.5
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"HID channel connect failed for {self.ws_url}: {str(e)}")
+                    self.stats["reconnects"] += 1
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+
+            if pending is None:
+                pending = await self._queue.get()
+                offset = 0
+                if not self.connected:
+                    continue
+
+            events, future = pending
+            if future.done() and offset == 0:
+                # Caller gave up waiting; never replay stale input
+                self.stats["dropped"] += len(events)
+                pending = None
+                continue
+
+            try:
+                # Resume a partially written batch where it stopped
+                while offset < len(events):
+                    await self._ws.send_json(events[offset])
+                    offset += 1
+                self.stats["sent"] += len(events)
+                if not future.done():
+                    future.set_result(True)
+                pending = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep the batch and retry it after reconnecting to preserve order
+                logger.warning(f"HID channel send failed for {self.ws_url}: {str(e)}")
+                self.connected = False
+                self.stats["reconnects"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self.connected,
+            "queued": self._queue.qsize(),
+            **self.stats
+        }
+
+    async def suspend(self):
+        """Close the upstream connection until the next event is sent"""
+        if self._writer_task:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._writer_task = None
+        await self._disconnect()
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_result(False)
+
+    async def close(self):
+        """Stop the writer and close the upstream connection"""
+        self._closed = True
+        await self.suspend()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -1,223 +1,181 @@
 """
 Super Ducks Integration Layer - Handles communication with actual Super Ducks devices
 """
-import aiohttp
 import asyncio
-from typing import Optional, Dict, List, Any
-import base64
-import json
-from datetime import datetime
+from typing import Optional, Dict, List, Any, Awaitable, Callable
 import logging
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
 
-logger = logging.getLogger(__name__)
+from pikvm_driver import pikvm_drivers, PiKVMDriver, PiKVMError, ATX_ACTIONS, box_key
+from pikvm_discovery import pikvm_discovery
+from device_state import device_state
+from device_sharding import device_sharding, ShardCallError
 
-# Database connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
+logger = logging.getLogger(__name__)
 
 class SuperDucksDevice:
+    """Device handle backed by the shared PiKVM driver for its box"""
+    
     def __init__(self, device_id: str, ip_address: str, username: str = "admin", password: str = "admin"):
         self.device_id = device_id
         self.ip_address = ip_address
         self.username = username  
-        self.password = password
-        self.base_url = f"http://{ip_address}"
-        self.session = None
-        self.auth_header = None
-        
-    async def _get_session(self):
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
-            # Create basic auth header
-            credentials = f"{self.username}:{self.password}"
-            encoded_credentials = base64.b64encode(credentials.encode()).decode()
-            self.auth_header = {"Authorization": f"Basic {encoded_credentials}"}
-        return self.session
-    
-    async def _make_request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict]:
-        """Make HTTP request to PiKVM device"""
-        session = await self._get_session()
-        url = f"{self.base_url}{endpoint}"
-        
+        self.driver: PiKVMDriver = pikvm_drivers.acquire(device_id, ip_address, 80, username, password)
+        self.base_url = self.driver.base_url
+    
+    @property
+    def hid(self):
+        return self.driver.hid
+    
+    async def _call(self, coro) -> bool:
+        """Run a driver call, turning PiKVM failures into False"""
         try:
-            headers = kwargs.pop('headers', {})
-            headers.update(self.auth_header)
-            
-            async with session.request(method, url, headers=headers, timeout=30, **kwargs) as response:
-                if response.status == 200:
-                    if response.content_type == 'application/json':
-                        return await response.json()
-                    else:
-                        return {"status": "success", "data": await response.text()}
-                else:
-                    logger.error(f"PiKVM request failed: {response.status} - {await response.text()}")
-                    return None
-        except asyncio.TimeoutError:
-            logger.error(f"Timeout connecting to PiKVM {self.ip_address}")
-            return None
-        except Exception as e:
-            logger.error(f"Error connecting to PiKVM {self.ip_address}: {str(e)}")
-            return None
+            await coro
+            return True
+        except PiKVMError as e:
+            logger.error(f"PiKVM request failed for {self.device_id}: {str(e)}")
+            return False
     
     async def get_info(self) -> Optional[Dict]:
         """Get PiKVM device information"""
-        return await self._make_request("GET", "/api/info")
+        try:
+            return await self.driver.get_info()
+        except PiKVMError:
+            return None
     
     async def get_hw_info(self) -> Optional[Dict]:
         """Get hardware information"""
-        return await self._make_request("GET", "/api/hw")
+        try:
+            return await self.driver.get_hw_info()
+        except PiKVMError:
+            return None
     
     async def power_action(self, action: str) -> bool:
-        """Execute power action (on, off, reset_hard, reset_soft)"""
-        valid_actions = ["on", "off", "reset_hard", "reset_soft"]
-        if action not in valid_actions:
+        """Execute power action (power_on, power_off, restart, reset, sleep)"""
+        if action not in ATX_ACTIONS:
             return False
-        
-        data = {"action": action}
-        response = await self._make_request("POST", "/api/atx/power", json=data)
-        return response is not None
+        return await self._call(self.driver.power_action(action))
     
     async def send_key(self, key: str, state: bool = True) -> bool:
         """Send keyboard key"""
-        data = {"key": key, "state": state}
-        response = await self._make_request("POST", "/api/hid/events/sendkey", json=data)
-        return response is not None
+        return await self.hid.send_key(key, state)
     
     async def send_key_combination(self, keys: List[str]) -> bool:
         """Send key combination (e.g., ['ctrl', 'alt', 'del'])"""
-        # Press keys down
-        for key in keys:
-            await self.send_key(key, True)
-            await asyncio.sleep(0.01)
-        
-        # Release keys
-        for key in reversed(keys):
-            await self.send_key(key, False)
-            await asyncio.sleep(0.01)
-        
-        return True
+        # Presses and releases go out as one ordered batch on the HID channel
+        return await self.hid.send_key_combination(keys)
     
     async def send_mouse_move(self, x: int, y: int) -> bool:
         """Send mouse movement"""
-        data = {"to": {"x": x, "y": y}}
-        response = await self._make_request("POST", "/api/hid/events/mouse/move", json=data)
-        return response is not None
+        return await self.hid.send_mouse_move(x, y)
     
     async def send_mouse_click(self, button: str = "left", state: bool = True) -> bool:
         """Send mouse click"""
-        data = {"button": button, "state": state}
-        response = await self._make_request("POST", "/api/hid/events/mouse/button", json=data)
-        return response is not None
+        return await self.hid.send_mouse_button(button, state)
+    
+    async def type_text(self, text: str, keymap: str = "en-us") -> bool:
+        """Type a whole string on the target machine"""
+        try:
+            await self.driver.type_text(text, keymap)
+            return True
+        except (PiKVMError, ValueError) as e:
+            logger.error(f"Typing text failed for {self.device_id}: {str(e)}")
+            return False
     
     async def reset_hid(self) -> bool:
         """Reset HID (keyboard/mouse)"""
-        response = await self._make_request("POST", "/api/hid/reset")
-        return response is not None
+        return await self._call(self.driver.reset_hid())
     
     async def get_stream_url(self) -> str:
         """Get video stream URL"""
-        return f"{self.base_url}/api/streamer/stream"
+        return self.driver.stream_url()
     
     async def set_streamer_params(self, quality: int = 80, fps: int = 30) -> bool:
         """Set video streaming parameters"""
-        data = {"quality": quality, "fps": fps}
-        response = await self._make_request("POST", "/api/streamer/set_params", json=data)
-        return response is not None
+        return await self._call(self.driver.set_streamer_params(quality, fps))
     
     async def mount_iso(self, iso_path: str) -> bool:
         """Mount ISO file"""
-        data = {"image": iso_path}
-        response = await self._make_request("POST", "/api/msd/set_image", json=data)
-        return response is not None
+        return await self._call(self.driver.mount_iso(iso_path))
     
     async def get_status(self) -> Dict[str, Any]:
         """Get comprehensive device status"""
-        try:
-            info = await self.get_info()
-            hw_info = await self.get_hw_info()
-            
-            status = {
-                "online": info is not None,
-                "timestamp": datetime.utcnow().isoformat(),
-                "info": info,
-                "hardware": hw_info
-            }
-            
-            return status
-        except Exception as e:
-            logger.error(f"Error getting status for {self.device_id}: {str(e)}")
-            return {
-                "online": False,
-                "timestamp": datetime.utcnow().isoformat(),
-                "error": str(e)
-            }
+        return await self.driver.get_status()
     
     async def close(self):
-        """Close the session"""
-        if self.session:
-            await self.session.close()
+        """Release the shared driver"""
+        await pikvm_drivers.release(self.device_id)
 
 class SuperDucksManager:
     def __init__(self):
         self.devices: Dict[str, SuperDucksDevice] = {}
+        # Optional coroutine that loads a device missing from memory (set by the registry loader)
+        self.hydrator: Optional[Callable[[str], Awaitable[Any]]] = None
     
-    async def register_device(self, device_id: str, ip_address: str, username: str = "admin", password: str = "admin"):
-        """Register a new Super Ducks device"""
+    def add_device(self, device_id: str, ip_address: str, username: str = "admin", password: str = "admin") -> SuperDucksDevice:
+        """Add a device to the in-memory registry without contacting it"""
         device = SuperDucksDevice(device_id, ip_address, username, password)
         self.devices[device_id] = device
+        device_sharding.bind(device_id, box_key(ip_address))
+        return device
+    
+    async def register_device(self, device_id: str, ip_address: str, username: str = "admin", password: str = "admin"):
+        """Register a new Super Ducks device"""
+        self.add_device(device_id, ip_address, username, password)
         
         # Update device status in database
         await self._update_device_status(device_id)
     
+    async def remove_device(self, device_id: str):
+        """Drop a device from the registry and close its connections"""
+        device = self.devices.pop(device_id, None)
+        device_sharding.unbind(device_id)
+        if device:
+            await device.close()
+    
+    async def _get_device(self, device_id: str) -> Optional[SuperDucksDevice]:
+        """Look up a device, hydrating it from the database on first use.
+
+        Commands look the device up before deciding whether to forward it, as
+        registering it binds it to its box and the box decides the owner.
+        """
+        if device_id not in self.devices and self.hydrator is not None:
+            await self.hydrator(device_id)
+        return self.devices.get(device_id)
+    
+    async def _forward(self, name: str, device_id: str, *args) -> bool:
+        """Run a command on the worker that owns the device"""
+        try:
+            return await device_sharding.forward(name, device_id, *args)
+        except ShardCallError as e:
+            logger.error(f"Forwarding {name} for {device_id} failed: {str(e)}")
+            return False
+    
     async def _update_device_status(self, device_id: str):
-        """Update device status in database"""
+        """Report the current device status; only changes reach the database"""
         if device_id not in self.devices:
             return
         
         device = self.devices[device_id]
         status = await device.get_status()
-        
-        await db.devices.update_one(
-            {"id": device_id},
-            {
-                "$set": {
-                    "status": "online" if status["online"] else "offline",
-                    "last_seen": datetime.utcnow(),
-                    "last_status": status
-                }
-            }
-        )
+        await device_state.report(device_id, status["online"], status)
     
     async def execute_power_action(self, device_id: str, action: str) -> bool:
         """Execute power action on device"""
-        if device_id not in self.devices:
+        device = await self._get_device(device_id)
+        if not device:
             return False
+        if device_sharding.should_forward(device_id):
+            return await self._forward("superducks.power_action", device_id, action)
         
-        device = self.devices[device_id]
-        
-        # Map our actions to PiKVM actions
-        action_map = {
-            "power_on": "on",
-            "power_off": "off", 
-            "restart": "reset_soft",
-            "reset": "reset_hard"
-        }
-        
-        pikvm_action = action_map.get(action)
-        if not pikvm_action:
-            return False
-        
-        return await device.power_action(pikvm_action)
+        return await device.power_action(action)
     
     async def send_keyboard_input(self, device_id: str, keys: str, modifiers: List[str] = None) -> bool:
         """Send keyboard input to device"""
-        if device_id not in self.devices:
+        device = await self._get_device(device_id)
+        if not device:
             return False
-        
-        device = self.devices[device_id]
+        if device_sharding.should_forward(device_id):
+            return await self._forward("superducks.keyboard", device_id, keys, modifiers)
         
         # Handle special key combinations
         if keys == "ctrl+alt+del":
@@ -225,7 +183,7 @@ class SuperDucksManager:
         elif keys == "alt+tab":
             return await device.send_key_combination(["alt", "tab"])
         elif keys == "win":
-            return await device.send_key("cmd", True) and await device.send_key("cmd", False)
+            return await device.send_key_combination(["cmd"])
         elif keys == "hid_reset":
             return await device.reset_hid()
         elif keys.startswith("resolution_"):
@@ -233,7 +191,17 @@ class SuperDucksManager:
             return await self._change_resolution(device, keys.replace("resolution_", ""))
         else:
             # Send individual key
-            return await device.send_key(keys, True) and await device.send_key(keys, False)
+            return await device.send_key_combination([keys])
+    
+    async def type_text(self, device_id: str, text: str, keymap: str = "en-us") -> bool:
+        """Type a string on the device in one operation"""
+        device = await self._get_device(device_id)
+        if not device:
+            return False
+        if device_sharding.should_forward(device_id):
+            return await self._forward("superducks.type_text", device_id, text, keymap)
+        
+        return await device.type_text(text, keymap)
     
     async def _change_resolution(self, device: SuperDucksDevice, resolution: str) -> bool:
         """Change screen resolution (basic implementation)"""
@@ -248,43 +216,38 @@ class SuperDucksManager:
     
     async def send_mouse_input(self, device_id: str, x: int, y: int, button: str = None, action: str = "move") -> bool:
         """Send mouse input to device"""
-        if device_id not in self.devices:
+        device = await self._get_device(device_id)
+        if not device:
             return False
-        
-        device = self.devices[device_id]
+        if device_sharding.should_forward(device_id):
+            return await self._forward("superducks.mouse", device_id, x, y, button, action)
         
         if action == "move":
             return await device.send_mouse_move(x, y)
         elif action == "click" and button:
-            await device.send_mouse_move(x, y)
-            return await device.send_mouse_click(button, True) and await device.send_mouse_click(button, False)
+            return await device.hid.send_mouse_click(x, y, button)
         
         return False
     
     async def get_device_status(self, device_id: str) -> Optional[Dict]:
         """Get device status"""
-        if device_id not in self.devices:
+        device = await self._get_device(device_id)
+        if not device:
             return None
-        
-        device = self.devices[device_id]
         return await device.get_status()
     
     async def get_stream_url(self, device_id: str) -> Optional[str]:
         """Get video stream URL for device"""
-        if device_id not in self.devices:
+        device = await self._get_device(device_id)
+        if not device:
             return None
-        
-        device = self.devices[device_id]
         return await device.get_stream_url()
     
     async def discover_devices(self, ip_range: str = "192.168.1.0/24") -> List[Dict]:
-        """Discover PiKVM devices on network (basic implementation)"""
-        # This is a simplified implementation
-        # In production, you'd implement proper network scanning
-        discovered = []
-        
-        # For now, return empty list - manual registration required
-        return discovered
+        """Discover PiKVM devices on network"""
+        found = await pikvm_discovery.scan([cidr for cidr in ip_range.split(",") if cidr.strip()])
+        known = {device.ip_address for device in self.devices.values()}
+        return [device for device in found if device["ip_address"] not in known]
     
     async def cleanup(self):
         """Clean up all device connections"""
@@ -293,4 +256,8 @@ class SuperDucksManager:
         self.devices.clear()
 
 # Global manager instance
-superducks_manager = SuperDucksManager()
\ No newline at end of file
+superducks_manager = SuperDucksManager()
+device_sharding.register("superducks.power_action", superducks_manager.execute_power_action)
+device_sharding.register("superducks.keyboard", superducks_manager.send_keyboard_input)
+device_sharding.register("superducks.type_text", superducks_manager.type_text)
+device_sharding.register("superducks.mouse", superducks_manager.send_mouse_input)
\ No newline at end of file
@@ -0,0 +1,591 @@
+#!/usr/bin/env python3
+"""
+PiKVM Device Simulator
+Serves the subset of the kvmd API used by the backend from hundreds of virtual devices on localhost
+
+Usage:
+    python pikvm_simulator.py --devices 200 --port 20000 --latency-ms 20 --jitter-ms 10
+    python pikvm_simulator.py --devices 50 --host-mode --port 8080   # 127.1.1.x:8080, for discovery
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import random
+import struct
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger(__name__)
+
+# Per-device stats endpoint; never delayed, failed or authenticated
+STATS_PATH = "/__sim__/stats"
+
+
+# --- Synthetic JPEG frames -------------------------------------------------
+#
+# A minimal baseline JPEG encoder for greyscale images made of flat 8x8
+# blocks. Flat blocks only have a DC coefficient, so every block is one DC
+# difference plus an end-of-block code. That is enough to produce valid,
+# changing frames of realistic size without an imaging library.
+
+# Quantisation table of ones keeps DC values exact
+_DQT = b"\xff\xdb" + struct.pack(">H", 67) + b"\x00" + b"\x01" * 64
+# DC table: categories 0-11 all coded with 4 bits (0000-1011)
+_DHT_DC = b"\xff\xc4" + struct.pack(">H", 2 + 1 + 16 + 12) + b"\x00" + bytes([0, 0, 0, 12] + [0] * 12) + bytes(range(12))
+# AC table: only end-of-block, coded as a single 0 bit
+_DHT_AC = b"\xff\xc4" + struct.pack(">H", 2 + 1 + 16 + 1) + b"\x10" + bytes([1] + [0] * 15) + b"\x00"
+_APP0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+_SOS = b"\xff\xda" + struct.pack(">HBBBBBB", 8, 1, 1, 0x00, 0, 63, 0)
+
+
+class _BitWriter:
+    def __init__(self):
+        self.out = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value: int, length: int):
+        self._acc = (self._acc << length) | (value & ((1 << length) - 1))
+        self._bits += length
+        while self._bits >= 8:
+            self._bits -= 8
+            byte = (self._acc >> self._bits) & 0xFF
+            self.out.append(byte)
+            if byte == 0xFF:
+                self.out.append(0)
+        self._acc &= (1 << self._bits) - 1
+
+    def flush(self) -> bytes:
+        if self._bits:
+            pad = 8 - self._bits
+            self.write((1 << pad) - 1, pad)
+        return bytes(self.out)
+
+
+def encode_blocks_jpeg(levels: List[List[int]]) -> bytes:
+    """Encode a grid of 8x8 block brightness levels (0-255) as a greyscale JPEG"""
+    rows, cols = len(levels), len(levels[0])
+    sof = b"\xff\xc0" + struct.pack(">HBHHBBBB", 11, 8, rows * 8, cols * 8, 1, 1, 0x11, 0)
+
+    writer = _BitWriter()
+    previous = 0
+    for row in levels:
+        for level in row:
+            dc = 8 * (level - 128)
+            diff = dc - previous
+            previous = dc
+            category = abs(diff).bit_length()
+            writer.write(category, 4)
+            if category:
+                writer.write(diff if diff >= 0 else diff + (1 << category) - 1, category)
+            writer.write(0, 1)  # end of block
+
+    return b"\xff\xd8" + _APP0 + _DQT + sof + _DHT_DC + _DHT_AC + _SOS + writer.flush() + b"\xff\xd9"
+
+
+def render_frames(width: int, height: int, count: int) -> List[bytes]:
+    """Render a looping test pattern: a gradient with a sweeping bar and a moving stripe"""
+    cols, rows = max(width // 8, 1), max(height // 8, 1)
+    frames = []
+    for index in range(count):
+        bar = (index * cols) // count
+        stripe = (index * rows) // count
+        levels = []
+        for by in range(rows):
+            row = []
+            for bx in range(cols):
+                if bar <= bx < bar + 3:
+                    row.append(235)
+                elif by == stripe:
+                    row.append(16)
+                else:
+                    row.append(40 + (bx * 120) // cols + (by * 60) // rows)
+            levels.append(row)
+        frames.append(encode_blocks_jpeg(levels))
+    return frames
+
+
+# --- Virtual devices -------------------------------------------------------
+
+class SimulatorConfig:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 bandwidth_kbps: float = 0.0, fps: int = 15, width: int = 1280, height: int = 720,
+                 frame_count: int = 30, username: str = "admin", password: str = "admin"):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.bandwidth_kbps = bandwidth_kbps
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.frame_count = frame_count
+        self.username = username
+        self.password = password
+
+
+class VirtualPiKVM:
+    """State of one simulated PiKVM"""
+
+    def __init__(self, index: int, host: str, port: int):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.hostname = f"pikvm-sim-{index:04d}"
+        self.powered = True
+        self.msd_image: Optional[str] = None
+        self.streamer_quality = 80
+        self.streamer_fps = 0
+        self.temperature = 45.0 + random.uniform(-5, 5)
+        self.cpu_percent = random.uniform(5, 20)
+        self.mem_percent = random.uniform(20, 40)
+        self.stats = {
+            "requests": 0, "injected_errors": 0, "auth_failures": 0, "bytes_sent": 0,
+            "hid_events": 0, "printed_chars": 0, "power_actions": 0, "snapshots": 0,
+            "streams": 0, "ws_clients": 0
+        }
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def drift(self):
+        """Random-walk the health readings so telemetry has something to show"""
+        self.temperature = min(max(self.temperature + random.uniform(-0.5, 0.5), 35.0), 80.0)
+        self.cpu_percent = min(max(self.cpu_percent + random.uniform(-3, 3), 1.0), 100.0)
+        self.mem_percent = min(max(self.mem_percent + random.uniform(-1, 1), 10.0), 90.0)
+
+
+def _ok(result: Any = None, status: int = 200) -> web.Response:
+    return web.json_response({"ok": status < 400, "result": {} if result is None else result}, status=status)
+
+
+def _error(name: str, message: str, status: int) -> web.Response:
+    return _ok({"error": name, "error_msg": message}, status)
+
+
+class PiKVMSimulator:
+    """Runs many virtual PiKVMs in one process.
+
+    All devices share a single aiohttp application; each one listens on its
+    own socket and requests are routed to the device by the local address
+    they arrived on. Frames are rendered once at startup and shared.
+    """
+
+    def __init__(self, config: Optional[SimulatorConfig] = None):
+        self.config = config or SimulatorConfig()
+        self.devices: Dict[Tuple[str, int], VirtualPiKVM] = {}
+        self.frames: List[bytes] = []
+        self.preview_frames: List[bytes] = []
+        self._runner: Optional[web.AppRunner] = None
+        self._started = time.monotonic()
+
+    def _build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware], client_max_size=64 * 1024 * 1024)
+        app.router.add_get(STATS_PATH, self.handle_stats)
+        app.router.add_get("/api/auth/check", self.handle_auth_check)
+        app.router.add_post("/api/auth/login", self.handle_login)
+        app.router.add_get("/api/info", self.handle_info)
+        app.router.add_get("/api/hw", self.handle_hw)
+        app.router.add_get("/api/atx", self.handle_atx)
+        app.router.add_post("/api/atx/power", self.handle_atx_power)
+        app.router.add_post("/api/atx/click", self.handle_atx_click)
+        app.router.add_get("/api/hid", self.handle_hid)
+        app.router.add_post("/api/hid/print", self.handle_hid_print)
+        app.router.add_post("/api/hid/reset", self.handle_hid_reset)
+        app.router.add_post("/api/hid/events/send_key", self.handle_hid_event)
+        app.router.add_post("/api/hid/events/send_mouse_button", self.handle_hid_event)
+        app.router.add_post("/api/hid/events/send_mouse_move", self.handle_hid_event)
+        app.router.add_post("/api/hid/events/send_mouse_wheel", self.handle_hid_event)
+        app.router.add_get("/api/streamer", self.handle_streamer)
+        app.router.add_post("/api/streamer/set_params", self.handle_streamer_params)
+        app.router.add_get("/api/streamer/snapshot", self.handle_snapshot)
+        app.router.add_get("/api/streamer/stream", self.handle_stream)
+        app.router.add_get("/api/msd", self.handle_msd)
+        app.router.add_post("/api/msd/set_params", self.handle_msd_params)
+        app.router.add_get("/api/ws", self.handle_ws)
+        return app
+
+    async def start(self, count: int, host: str = "127.0.0.1", base_port: int = 20000,
+                    host_mode: bool = False) -> List[VirtualPiKVM]:
+        """Start ``count`` devices.
+
+        By default devices listen on consecutive ports of one host. In host
+        mode they share ``base_port`` on consecutive loopback addresses
+        (127.1.1.1, 127.1.1.2, ...), which is what a subnet scan expects.
+        """
+        config = self.config
+        self.frames = render_frames(config.width, config.height, config.frame_count)
+        self.preview_frames = render_frames(config.width // 2, config.height // 2, config.frame_count)
+
+        self._runner = web.AppRunner(self._build_app(), access_log=None)
+        await self._runner.setup()
+
+        for index in range(count):
+            if host_mode:
+                block = index // 254
+                address = f"127.{1 + block // 255}.{1 + block % 255}.{1 + index % 254}"
+                port = base_port
+            else:
+                address, port = host, base_port + index
+            site = web.TCPSite(self._runner, address, port, backlog=256)
+            await site.start()
+            device = VirtualPiKVM(index, address, port)
+            self.devices[(address, port)] = device
+
+        logger.info(f"Started {count} simulated PiKVM devices")
+        return list(self.devices.values())
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        self.devices.clear()
+
+    def manifest(self) -> List[Dict[str, Any]]:
+        """Device list in the shape the backend registration routes expect"""
+        return [
+            {
+                "name": device.hostname,
+                "ip_address": device.address,
+                "host": device.host,
+                "port": device.port,
+                "pikvm_username": self.config.username,
+                "pikvm_password": self.config.password
+            }
+            for device in self.devices.values()
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        totals: Dict[str, int] = {}
+        for device in self.devices.values():
+            for key, value in device.stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return {"devices": len(self.devices), "uptime_seconds": round(time.monotonic() - self._started, 1), **totals}
+
+    # --- plumbing ---
+
+    def _device(self, request: web.Request) -> VirtualPiKVM:
+        sockname = request.transport.get_extra_info("sockname") if request.transport else None
+        device = self.devices.get((sockname[0], sockname[1])) if sockname else None
+        if device is None:
+            raise web.HTTPNotFound()
+        return device
+
+    def _authorized(self, request: web.Request) -> bool:
+        config = self.config
+        if (request.headers.get("X-KVMD-User") == config.username
+                and request.headers.get("X-KVMD-Passwd") == config.password):
+            return True
+        if request.cookies.get("auth_token") == self._token():
+            return True
+        header = request.headers.get("Authorization", "")
+        if header.startswith("Basic "):
+            try:
+                user, _, password = base64.b64decode(header[6:]).decode().partition(":")
+            except (ValueError, UnicodeDecodeError):
+                return False
+            return user == config.username and password == config.password
+        return False
+
+    def _token(self) -> str:
+        return base64.b16encode(f"{self.config.username}:{self.config.password}".encode()).decode().lower()
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        if request.path == STATS_PATH:
+            return await handler(request)
+
+        device = self._device(request)
+        device.stats["requests"] += 1
+        config = self.config
+
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000.0)
+
+        if request.path not in ("/api/auth/login",) and not self._authorized(request):
+            device.stats["auth_failures"] += 1
+            return _error("UnauthorizedError", "Invalid credentials", 401)
+
+        if config.error_rate and request.path != "/api/ws" and random.random() < config.error_rate:
+            device.stats["injected_errors"] += 1
+            return _error("SimulatedError", "Injected failure", 500)
+
+        request["device"] = device
+        return await handler(request)
+
+    async def _write(self, response: web.StreamResponse, device: VirtualPiKVM, data: bytes):
+        """Write a body, pacing it to the configured bandwidth cap"""
+        rate = self.config.bandwidth_kbps * 1000 / 8
+        if not rate:
+            await response.write(data)
+        else:
+            chunk = max(int(rate / 20), 1024)
+            for start in range(0, len(data), chunk):
+                piece = data[start:start + chunk]
+                await response.write(piece)
+                await asyncio.sleep(len(piece) / rate)
+        device.stats["bytes_sent"] += len(data)
+
+    def _frame(self, preview: bool) -> bytes:
+        frames = self.preview_frames if preview else self.frames
+        fps = self.config.fps or 1
+        return frames[int(time.monotonic() * fps) % len(frames)]
+
+    # --- handlers ---
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        device = self._device(request)
+        return web.json_response({"hostname": device.hostname, "powered": device.powered, **device.stats})
+
+    async def handle_auth_check(self, request: web.Request) -> web.Response:
+        return _ok()
+
+    async def handle_login(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        if data.get("user") != self.config.username or data.get("passwd") != self.config.password:
+            request["device"].stats["auth_failures"] += 1
+            return _error("ForbiddenError", "Invalid credentials", 403)
+        response = _ok()
+        response.set_cookie("auth_token", self._token())
+        return response
+
+    async def handle_info(self, request: web.Request) -> web.Response:
+        device = request["device"]
+        return _ok({
+            "meta": {"server": {"host": device.hostname}, "kvm": {}},
+            "system": {"kvmd": {"version": "3.291-sim"}, "streamer": {"app": "ustreamer", "version": "6.0"}},
+            "hw": {"platform": {"type": "rpi", "base": "Raspberry Pi 4 Model B (simulated)"}},
+            "extras": {}
+        })
+
+    async def handle_hw(self, request: web.Request) -> web.Response:
+        device = request["device"]
+        device.drift()
+        return _ok({
+            "platform": {"type": "rpi", "base": "Raspberry Pi 4 Model B (simulated)", "serial": f"{device.index:016x}"},
+            "health": {
+                "temp": {"cpu": round(device.temperature, 1)},
+                "throttling": {"raw_flags": 0, "parsed_flags": {}},
+                "cpu": {"percent": round(device.cpu_percent, 1)},
+                "mem": {
+                    "percent": round(device.mem_percent, 1),
+                    "total": 4 * 1024 ** 3,
+                    "available": int(4 * 1024 ** 3 * (1 - device.mem_percent / 100))
+                }
+            }
+        })
+
+    async def handle_atx(self, request: web.Request) -> web.Response:
+        device = request["device"]
+        return _ok({"enabled": True, "busy": False, "leds": {"power": device.powered, "hdd": False}})
+
+    async def handle_atx_power(self, request: web.Request) -> web.Response:
+        device = request["device"]
+        action = request.query.get("action")
+        if action not in ("on", "off", "off_hard", "reset_hard"):
+            return _error("BadRequestError", f"Invalid action: {action}", 400)
+        device.stats["power_actions"] += 1
+        if action == "on":
+            device.powered = True
+        elif action in ("off", "off_hard"):
+            device.powered = False
+        return _ok()
+
+    async def handle_atx_click(self, request: web.Request) -> web.Response:
+        device = request["device"]
+        button = request.query.get("button")
+        if button not in ("power", "power_long", "reset"):
+            return _error("BadRequestError", f"Invalid button: {button}", 400)
+        device.stats["power_actions"] += 1
+        if button == "power":
+            device.powered = not device.powered
+        elif button == "power_long":
+            device.powered = False
+        return _ok()
+
+    async def handle_hid(self, request: web.Request) -> web.Response:
+        return _ok({
+            "online": True,
+            "busy": False,
+            "keyboard": {"online": True, "leds": {"caps": False, "num": False, "scroll": False}},
+            "mouse": {"online": True, "absolute": True}
+        })
+
+    async def handle_hid_print(self, request: web.Request) -> web.Response:
+        device = request["device"]
+        text = await request.text()
+        device.stats["printed_chars"] += len(text)
+        return _ok()
+
+    async def handle_hid_reset(self, request: web.Request) -> web.Response:
+        return _ok()
+
+    async def handle_hid_event(self, request: web.Request) -> web.Response:
+        request["device"].stats["hid_events"] += 1
+        return _ok()
+
+    async def handle_streamer(self, request: web.Request) -> web.Response:
+        device = request["device"]
+        config = self.config
+        return _ok({
+            "streamer": {
+                "source": {
+                    "online": device.powered,
+                    "resolution": {"width": config.width, "height": config.height},
+                    "captured_fps": config.fps
+                },
+                "encoder": {"type": "CPU", "quality": device.streamer_quality}
+            },
+            "params": {"quality": device.streamer_quality, "desired_fps": device.streamer_fps}
+        })
+
+    async def handle_streamer_params(self, request: web.Request) -> web.Response:
+        device = request["device"]
+        try:
+            device.streamer_quality = int(request.query.get("quality", device.streamer_quality))
+            device.streamer_fps = int(request.query.get("desired_fps", device.streamer_fps))
+        except ValueError:
+            return _error("BadRequestError", "Invalid streamer parameters", 400)
+        return _ok()
+
+    async def handle_snapshot(self, request: web.Request) -> web.StreamResponse:
+        device = request["device"]
+        device.stats["snapshots"] += 1
+        frame = self._frame(request.query.get("preview") in ("1", "true"))
+        response = web.StreamResponse(headers={"Content-Type": "image/jpeg"})
+        response.content_length = len(frame)
+        await response.prepare(request)
+        await self._write(response, device, frame)
+        await response.write_eof()
+        return response
+
+    async def handle_stream(self, request: web.Request) -> web.StreamResponse:
+        """MJPEG stream, as served by ustreamer"""
+        device = request["device"]
+        device.stats["streams"] += 1
+        boundary = "boundarydonotcross"
+        response = web.StreamResponse(headers={
+            "Content-Type": f"multipart/x-mixed-replace;boundary={boundary}",
+            "Cache-Control": "no-store"
+        })
+        await response.prepare(request)
+
+        interval = 1.0 / (device.streamer_fps or self.config.fps or 1)
+        try:
+            while True:
+                started = time.monotonic()
+                frame = self._frame(False)
+                header = (f"--{boundary}\r\nContent-Type: image/jpeg\r\n"
+                          f"Content-Length: {len(frame)}\r\n\r\n").encode()
+                await self._write(response, device, header + frame + b"\r\n")
+                await asyncio.sleep(max(interval - (time.monotonic() - started), 0))
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return response
+
+    async def handle_msd(self, request: web.Request) -> web.Response:
+        device = request["device"]
+        return _ok({
+            "enabled": True,
+            "online": True,
+            "busy": False,
+            "drive": {"image": {"name": device.msd_image} if device.msd_image else None, "connected": bool(device.msd_image)},
+            "storage": {"size": 32 * 1024 ** 3, "free": 24 * 1024 ** 3, "images": {}}
+        })
+
+    async def handle_msd_params(self, request: web.Request) -> web.Response:
+        request["device"].msd_image = request.query.get("image") or None
+        return _ok()
+
+    async def handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        """Event socket: pushes initial state, accepts HID events and answers pings"""
+        device = request["device"]
+        ws = web.WebSocketResponse(heartbeat=15)
+        await ws.prepare(request)
+        device.stats["ws_clients"] += 1
+
+        try:
+            await ws.send_json({"event_type": "atx_state", "event": {"leds": {"power": device.powered, "hdd": False}}})
+            await ws.send_json({"event_type": "hid_state", "event": {"online": True}})
+            await ws.send_json({"event_type": "loop", "event": {}})
+
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    data = json.loads(message.data)
+                except ValueError:
+                    continue
+                event_type = data.get("event_type")
+                if event_type == "ping":
+                    await ws.send_json({"event_type": "pong", "event": {}})
+                elif event_type in ("key", "mouse_move", "mouse_button", "mouse_wheel", "mouse_relative"):
+                    device.stats["hid_events"] += 1
+        finally:
+            device.stats["ws_clients"] -= 1
+        return ws
+
+
+async def _main(args: argparse.Namespace):
+    config = SimulatorConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        bandwidth_kbps=args.bandwidth_kbps,
+        fps=args.fps,
+        width=args.width,
+        height=args.height,
+        username=args.username,
+        password=args.password
+    )
+    simulator = PiKVMSimulator(config)
+    await simulator.start(args.devices, host=args.host, base_port=args.port, host_mode=args.host_mode)
+
+    if args.manifest:
+        with open(args.manifest, "w") as manifest:
+            json.dump(simulator.manifest(), manifest, indent=2)
+    first, last = simulator.manifest()[0], simulator.manifest()[-1]
+    print(f"Simulating {args.devices} PiKVM devices ({first['ip_address']} .. {last['ip_address']}), Ctrl+C to stop")
+
+    try:
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            print(json.dumps(simulator.get_stats()))
+    finally:
+        await simulator.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate PiKVM devices for load tests")
+    parser.add_argument("--devices", type=int, default=10, help="number of virtual devices")
+    parser.add_argument("--host", default="127.0.0.1", help="bind address in port mode")
+    parser.add_argument("--port", type=int, default=20000, help="first port (port mode) or shared port (host mode)")
+    parser.add_argument("--host-mode", action="store_true", help="one loopback address per device on a shared port")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of API calls answered with HTTP 500")
+    parser.add_argument("--bandwidth-kbps", type=float, default=0.0, help="per-response cap for snapshots and streams")
+    parser.add_argument("--fps", type=int, default=15)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--manifest", help="write the device list as JSON to this file")
+    parser.add_argument("--stats-interval", type=float, default=10.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Pub/Sub Hub Module
+Topic-based fan-out of events to WebSocket clients, limited to what each user may see
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from fastapi import WebSocket
+from fastapi.encoders import jsonable_encoder
+
+from event_bus import event_bus
+
+logger = logging.getLogger(__name__)
+
+# Event bus channel carrying publications to the other workers, keyed by topic
+PUBSUB_CHANNEL = "pubsub"
+
+
+def device_topic(device_id: str) -> str:
+    """Topic carrying the events of one device"""
+    return f"device:{device_id}"
+
+
+class Subscriber:
+    """One WebSocket connection and the queue of messages waiting to be sent to it"""
+
+    def __init__(self, websocket: WebSocket, user: Optional[Dict[str, Any]], queue_size: int):
+        self.websocket = websocket
+        self.user = user
+        self.topics: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.writer: Optional[asyncio.Task] = None
+
+    def offer(self, text: str) -> bool:
+        """Queue a message, dropping the oldest one if the client is behind"""
+        dropped = False
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            dropped = True
+        self.queue.put_nowait(text)
+        return not dropped
+
+
+class PubSubHub:
+    """Delivers each event only to the sockets subscribed to its topic.
+
+    ``publish`` serializes a message once and puts the text on the bounded
+    queue of every subscriber of the topic; it never waits for a socket.
+    Each connection has its own writer task, so sends to different clients
+    run concurrently and a slow client only falls behind itself, losing its
+    oldest messages once ``PUBSUB_QUEUE_SIZE`` are waiting. Subscriptions
+    are checked with ``authorizer`` and re-checked when a user's
+    permissions change.
+
+    With several workers, every publication also goes out on the event bus;
+    a worker only receives the topics its own sockets are subscribed to.
+    """
+
+    def __init__(self, queue_size: int = None, send_timeout: float = None):
+        self.queue_size = queue_size or int(os.getenv("PUBSUB_QUEUE_SIZE", "256"))
+        self.send_timeout = send_timeout or float(os.getenv("PUBSUB_SEND_TIMEOUT", "10"))
+        # Coroutine deciding whether a user may subscribe to a topic (set by server.py)
+        self.authorizer: Optional[Callable[[Dict[str, Any], str], Awaitable[bool]]] = None
+        self.topics: Dict[str, Set[Subscriber]] = {}
+        self.subscribers: Dict[WebSocket, Subscriber] = {}
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0, "unrouted": 0,
+                      "denied": 0, "revoked": 0, "send_failures": 0}
+
+    def connect(self, websocket: WebSocket, user: Optional[Dict[str, Any]]) -> Subscriber:
+        """Register an accepted socket; it receives nothing until it subscribes"""
+        subscriber = Subscriber(websocket, user, self.queue_size)
+        subscriber.writer = asyncio.create_task(self._write(subscriber))
+        self.subscribers[websocket] = subscriber
+        return subscriber
+
+    async def disconnect(self, websocket: WebSocket):
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber is None:
+            return
+        for topic in list(subscriber.topics):
+            self._remove(subscriber, topic)
+        if subscriber.writer is not None and subscriber.writer is not asyncio.current_task():
+            subscriber.writer.cancel()
+            await asyncio.gather(subscriber.writer, return_exceptions=True)
+
+    async def subscribe(self, websocket: WebSocket, topic: str) -> bool:
+        """Subscribe a socket to a topic if its user is allowed to see it"""
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is None:
+            return False
+        if subscriber.user is None or self.authorizer is None or \
+                not await self.authorizer(subscriber.user, topic):
+            self.stats["denied"] += 1
+            return False
+        subscriber.topics.add(topic)
+        if topic not in self.topics:
+            self.topics[topic] = set()
+            event_bus.set_interest(PUBSUB_CHANNEL, topic, True)
+        self.topics[topic].add(subscriber)
+        return True
+
+    def unsubscribe(self, websocket: WebSocket, topic: str):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is not None and topic in subscriber.topics:
+            self._remove(subscriber, topic)
+
+    def _remove(self, subscriber: Subscriber, topic: str):
+        subscriber.topics.discard(topic)
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.topics[topic]
+                event_bus.set_interest(PUBSUB_CHANNEL, topic, False)
+
+    def publish(self, topic: str, message: Dict[str, Any]) -> int:
+        """Queue a message for every subscriber of a topic, here and on the other workers.
+
+        Returns the number of local subscribers.
+        """
+        self.stats["published"] += 1
+        remote = len(event_bus.members) > 1
+        if not remote and not self.topics.get(topic):
+            self.stats["unrouted"] += 1
+            return 0
+        text = json.dumps(jsonable_encoder(message))
+        if remote:
+            event_bus.publish(PUBSUB_CHANNEL, text, key=topic, lossy=True)
+        return self.deliver(text, topic)
+
+    def deliver(self, text: str, topic: str) -> int:
+        """Queue an already serialized message for the local subscribers of a topic"""
+        subscribers = self.topics.get(topic)
+        if not subscribers:
+            return 0
+        for subscriber in subscribers:
+            if not subscriber.offer(text):
+                self.stats["dropped"] += 1
+        return len(subscribers)
+
+    async def _write(self, subscriber: Subscriber):
+        websocket = subscriber.websocket
+        while True:
+            text = await subscriber.queue.get()
+            try:
+                await asyncio.wait_for(websocket.send_text(text), timeout=self.send_timeout)
+                self.stats["delivered"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Closed or stuck socket; its receive loop will notice and disconnect it
+                self.stats["send_failures"] += 1
+                logger.debug(f"Dropping subscriber after failed send: {str(e)}")
+                await self.disconnect(websocket)
+                return
+
+    async def revalidate_user(self, user_id: str, user: Optional[Dict[str, Any]]):
+        """Re-check the subscriptions of a user whose role or permissions changed.
+
+        ``user`` is the updated user, or None if the user was deleted or
+        deactivated, which ends all of their subscriptions.
+        """
+        for subscriber in list(self.subscribers.values()):
+            if not subscriber.user or subscriber.user.get("id") != user_id:
+                continue
+            subscriber.user = user
+            for topic in list(subscriber.topics):
+                if user is None or self.authorizer is None or not await self.authorizer(user, topic):
+                    self._remove(subscriber, topic)
+                    self.stats["revoked"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.subscribers),
+            "topic_count": len(self.topics),
+            "subscriptions": sum(len(subscribers) for subscribers in self.topics.values()),
+            "backlog": sum(subscriber.queue.qsize() for subscriber in self.subscribers.values()),
+            "topics": {topic: len(subscribers) for topic, subscribers in self.topics.items()},
+            **self.stats
+        }
+
+    async def cleanup(self):
+        for websocket in list(self.subscribers):
+            await self.disconnect(websocket)
+
+
+# Global pub/sub hub instance
+pubsub_hub = PubSubHub()
+event_bus.subscribe(PUBSUB_CHANNEL, pubsub_hub.deliver)
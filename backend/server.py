@@ -1,5 +1,6 @@
 from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File, Depends, Request
 from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -9,22 +10,37 @@ from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
 import asyncio
-import subprocess
 import psutil
 import aiofiles
 from enum import Enum
 
 # Import authentication and Super Ducks integration
 from auth import (
-    User, UserCreate, UserLogin, Token, UserRole, PermissionLevel,
-    authenticate_user, create_access_token, get_current_active_user,
-    get_password_hash, has_permission, get_user_accessible_devices,
-    log_user_action, require_role, AuditLogEntry
+    User, UserCreate, UserUpdate, UserLogin, Token, UserRole, PermissionLevel,
+    authenticate_user, create_access_token, get_current_active_user, get_user_from_token,
+    get_password_hash_async, has_permission, get_user_accessible_devices,
+    log_user_action, require_role, AuditLogEntry, password_hasher, token_cache, invalidate_user_cache,
+    permission_index, audit_sink
 )
+from password_hasher import PasswordHasherBusy
 from pikvm_integration import superducks_manager
+from input_shaper import input_shaper_manager
+from bulk_power import bulk_power_manager
+from device_registry import device_registry, HARDWARE
+from db_indexes import index_manager
+from system_metrics import system_metrics_store, system_metrics_sampler
+from device_telemetry import device_telemetry
+from device_state import device_state
+from pubsub import pubsub_hub, device_topic
+from event_bus import event_bus
+from device_sharding import device_sharding
+from device_credentials import device_credentials
+from log_queries import build_log_filter, log_page, log_export, NEXT_CURSOR_HEADER
+from pikvm_driver import pikvm_drivers
+from pikvm_discovery import pikvm_discovery
 
 
 ROOT_DIR = Path(__file__).parent
@@ -41,26 +57,96 @@ app = FastAPI(title="Super Ducks Enterprise Manager", version="2.0.0")
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
-
-manager = ConnectionManager()
+# WebSocket pub/sub
+async def authorize_topic(user: Dict[str, Any], topic: str) -> bool:
+    """Whether a user may subscribe to a pub/sub topic"""
+    kind, _, target = topic.partition(":")
+    if kind == "device" and target:
+        return await has_permission(user, target, PermissionLevel.VIEW_ONLY)
+    return False
+
+pubsub_hub.authorizer = authorize_topic
+
+async def publish_device_status(transition: Dict[str, Any]):
+    pubsub_hub.publish(device_topic(transition["device_id"]), {"type": "device_status", **transition})
+
+device_state.add_listener(publish_device_status)
+
+# Changes every worker must apply to its in-memory state, sent to the others over the event bus
+CHANGES_CHANNEL = "changes"
+
+def _without_ids(value: Any) -> Any:
+    """Drop MongoDB _ids, which only mean something to the worker that wrote the documents"""
+    if isinstance(value, dict):
+        return {k: _without_ids(v) for k, v in value.items() if k not in ("_id", "doc_id")}
+    if isinstance(value, list):
+        return [_without_ids(v) for v in value]
+    return value
+
+def _session_user(user: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: user.get(k) for k in ("id", "username", "role", "active")}
+
+# user id -> sessions of the device sockets that user has open on this worker
+input_sessions: Dict[str, List[Dict[str, Any]]] = {}
+
+async def revalidate_input_sessions(user_id: str, user: Optional[Dict[str, Any]]):
+    """Re-check the device sockets of a user whose record or permissions changed.
+
+    ``user`` is None if the user was deleted. Sockets the user may no longer
+    view are closed; the others get their control permission refreshed.
+    """
+    for session in list(input_sessions.get(user_id, [])):
+        device_id = session["device_id"]
+        if user is None or not user.get("active", True) or \
+                not await has_permission(user, device_id, PermissionLevel.VIEW_ONLY):
+            session["can_control"] = False
+            try:
+                await session["websocket"].close(code=1008)
+            except RuntimeError:
+                # Already closed by the client
+                pass
+            continue
+        session["user"] = {**session["user"], **user}
+        session["can_control"] = await has_permission(user, device_id, PermissionLevel.CONTROL)
+
+async def apply_change(change: Dict[str, Any], key: Optional[str] = None):
+    """Bring this worker's caches in line with a change to a user, their permissions or a device"""
+    kind = change["kind"]
+    if kind == "user_updated":
+        invalidate_user_cache(change["user_id"])
+        user = change["user"]
+        await pubsub_hub.revalidate_user(change["user_id"], user if user.get("active", True) else None)
+        await revalidate_input_sessions(change["user_id"], user)
+    elif kind == "user_deleted":
+        invalidate_user_cache(change["user_id"])
+        permission_index.remove_user(change["user_id"])
+        await pubsub_hub.revalidate_user(change["user_id"], None)
+        await revalidate_input_sessions(change["user_id"], None)
+    elif kind == "permissions_set":
+        permission_index.set_user_permissions(change["user_id"], change["permissions"])
+        await pubsub_hub.revalidate_user(change["user_id"], change["user"])
+        await revalidate_input_sessions(change["user_id"], change["user"])
+    elif kind == "device_added":
+        permission_index.add_device(change["device_id"], change.get("doc_id"))
+    elif kind == "device_deleted":
+        await device_registry.forget(change["device_id"])
+        await input_shaper_manager.remove_device(change["device_id"])
+        device_telemetry.forget(change["device_id"])
+        device_state.forget(change["device_id"])
+        permission_index.remove_device(change["device_id"])
+
+async def propagate_change(change: Dict[str, Any]):
+    """Apply a change here and tell the other workers about it"""
+    await apply_change(change)
+    event_bus.publish(CHANGES_CHANNEL, _without_ids(change))
+
+event_bus.subscribe(CHANGES_CHANNEL, apply_change)
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Stored timestamps are naive UTC; bring a query bound that carries a timezone in line with them"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 # Enums
 class PowerAction(str, Enum):
@@ -93,6 +179,7 @@ class Device(BaseModel):
     cpu_usage: Optional[float] = None
     memory_usage: Optional[float] = None
     temperature: Optional[float] = None
+    tags: List[str] = Field(default_factory=list)
     
 class DeviceCreate(BaseModel):
     name: str
@@ -107,6 +194,11 @@ class KeyboardInput(BaseModel):
     keys: str
     modifiers: Optional[List[str]] = []
 
+class TextInput(BaseModel):
+    device_id: str
+    text: str = Field(..., max_length=65536)
+    keymap: str = "en-us"
+
 class MouseInput(BaseModel):
     device_id: str
     x: int
@@ -114,6 +206,22 @@ class MouseInput(BaseModel):
     button: Optional[str] = None
     action: str  # click, move, scroll
 
+class BulkPowerRequest(BaseModel):
+    action: PowerAction
+    device_ids: Optional[List[str]] = None
+    tag: Optional[str] = None
+    concurrency: int = Field(10, ge=1, le=100)
+    stagger_ms: int = Field(0, ge=0, le=60000)
+
+class DiscoveryRequest(BaseModel):
+    cidrs: List[str] = Field(..., min_length=1)
+    ports: List[int] = Field(default_factory=lambda: [80, 443])
+    concurrency: int = Field(256, ge=1, le=2048)
+    connect_timeout_ms: int = Field(500, ge=50, le=10000)
+    http_timeout_ms: int = Field(3000, ge=100, le=30000)
+    pikvm_username: Optional[str] = None
+    pikvm_password: Optional[str] = None
+
 class SystemMetrics(BaseModel):
     cpu_usage: float
     memory_usage: float
@@ -133,7 +241,16 @@ async def login(user_credentials: UserLogin, request: Request):
     """Login user and return JWT token"""
     logger.info(f"Login attempt for username: {user_credentials.username}")
     
-    user = await authenticate_user(user_credentials.username, user_credentials.password)
+    try:
+        user = await authenticate_user(user_credentials.username, user_credentials.password)
+    except PasswordHasherBusy as e:
+        # Shed logins rather than let a backlog of bcrypt work pile up
+        logger.warning(f"Login shed for username: {user_credentials.username}: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many concurrent logins, please retry",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     if not user:
         logger.warning(f"Authentication failed for username: {user_credentials.username}")
         raise HTTPException(
@@ -185,7 +302,14 @@ async def register(user_data: UserCreate, current_user: dict = Depends(require_r
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    try:
+        hashed_password = await get_password_hash_async(user_data.password)
+    except PasswordHasherBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Password hashing is busy, please retry",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     user_dict = {
         "id": str(uuid.uuid4()),
         "username": user_data.username,
@@ -220,6 +344,69 @@ async def get_users(current_user: dict = Depends(require_role(UserRole.ADMIN))):
     users = await db.users.find({}, {"_id": 0, "password_hash": 0}).to_list(1000)
     return [User(**user) for user in users]
 
+def _check_can_manage(current_user: dict, target: dict):
+    """Only super admins may change super admins"""
+    if target.get("role") == UserRole.SUPER_ADMIN and current_user.get("role") != UserRole.SUPER_ADMIN:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+
+@api_router.put("/users/{user_id}", response_model=User)
+async def update_user(
+    user_id: str,
+    user_update: UserUpdate,
+    current_user: dict = Depends(require_role(UserRole.ADMIN))
+):
+    """Update a user's email, role or active flag (Admin only)"""
+    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    _check_can_manage(current_user, user)
+    
+    changes = user_update.dict(exclude_none=True)
+    if changes.get("role") == UserRole.SUPER_ADMIN and current_user.get("role") != UserRole.SUPER_ADMIN:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    if user_id == current_user["id"] and ("role" in changes or changes.get("active") is False):
+        raise HTTPException(status_code=400, detail="Cannot change your own role or deactivate yourself")
+    if "email" in changes and changes["email"] != user["email"]:
+        if await db.users.find_one({"email": changes["email"]}):
+            raise HTTPException(status_code=400, detail="Email already registered")
+    
+    if changes:
+        await db.users.update_one({"id": user_id}, {"$set": changes})
+        user.update(changes)
+        # Tokens issued before the change must not keep the old role or active flag, on any worker
+        await propagate_change({"kind": "user_updated", "user_id": user_id, "user": _session_user(user)})
+        
+        await log_user_action(
+            user_id=current_user["id"],
+            action="update_user",
+            details={"target_user_id": user_id, "changes": changes}
+        )
+    
+    return User(**{k: v for k, v in user.items() if k != "password_hash"})
+
+@api_router.delete("/users/{user_id}")
+async def delete_user(user_id: str, current_user: dict = Depends(require_role(UserRole.ADMIN))):
+    """Delete a user and their device permissions (Admin only)"""
+    if user_id == current_user["id"]:
+        raise HTTPException(status_code=400, detail="Cannot delete yourself")
+    
+    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    _check_can_manage(current_user, user)
+    
+    await db.users.delete_one({"id": user_id})
+    await db.user_device_permissions.delete_many({"user_id": user_id})
+    await propagate_change({"kind": "user_deleted", "user_id": user_id})
+    
+    await log_user_action(
+        user_id=current_user["id"],
+        action="delete_user",
+        details={"target_user_id": user_id, "username": user["username"]}
+    )
+    
+    return {"message": "User deleted successfully"}
+
 @api_router.put("/users/{user_id}/permissions")
 async def set_user_device_permissions(
     user_id: str,
@@ -250,6 +437,9 @@ async def set_user_device_permissions(
     
     if permissions:
         await db.user_device_permissions.insert_many(permissions)
+    await propagate_change({
+        "kind": "permissions_set", "user_id": user_id, "user": _session_user(user), "permissions": permissions
+    })
     
     # Log permission change
     await log_user_action(
@@ -295,6 +485,7 @@ class DeviceCreateEnterprise(BaseModel):
     description: Optional[str] = None
     pikvm_username: str = "admin"
     pikvm_password: str = "admin"
+    tags: List[str] = []
 
 class DeviceStatusUpdate(BaseModel):
     status: DeviceStatus
@@ -308,7 +499,8 @@ async def create_device(
     device_obj = Device(
         name=device.name,
         ip_address=device.ip_address,
-        status=DeviceStatus.UNKNOWN
+        status=DeviceStatus.UNKNOWN,
+        tags=device.tags
     )
     
     # Save to database
@@ -317,10 +509,13 @@ async def create_device(
         "location": device.location,
         "description": device.description,
         "created_by": current_user["id"],
-        "created_at": datetime.utcnow()
+        "created_at": datetime.utcnow(),
+        # Kept so the device can be re-registered after a restart
+        "pikvm_credentials": device_credentials.seal(device.pikvm_username, device.pikvm_password)
     })
     
     await db.devices.insert_one(device_dict)
+    await propagate_change({"kind": "device_added", "device_id": device_obj.id, "doc_id": device_dict.get("_id")})
     
     # Register with PiKVM Manager
     await superducks_manager.register_device(
@@ -353,7 +548,16 @@ async def get_devices(current_user: dict = Depends(get_current_active_user)):
         {"_id": 0}
     ).to_list(1000)
     
-    return [Device(**device) for device in devices]
+    return [Device(**device_telemetry.apply(device)) for device in devices]
+
+@api_router.get("/devices/telemetry")
+async def get_fleet_telemetry(current_user: dict = Depends(get_current_active_user)):
+    """Get the latest hardware health of every accessible device, hottest first"""
+    accessible_device_ids = await get_user_accessible_devices(current_user)
+    return {
+        "hot_temperature": device_telemetry.hot_temperature,
+        "devices": device_telemetry.fleet(accessible_device_ids)
+    }
 
 @api_router.get("/devices/{device_id}", response_model=Device)
 async def get_device(device_id: str, current_user: dict = Depends(get_current_active_user)):
@@ -366,7 +570,26 @@ async def get_device(device_id: str, current_user: dict = Depends(get_current_ac
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     
-    return Device(**device)
+    return Device(**device_telemetry.apply(device))
+
+@api_router.get("/devices/{device_id}/telemetry")
+async def get_device_telemetry(
+    device_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = 200,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Get min/avg/max hardware health of a device over a time range, downsampled to about `points` values"""
+    if not await has_permission(current_user, device_id, PermissionLevel.VIEW_ONLY):
+        raise HTTPException(status_code=403, detail="Access denied to this device")
+    end = _naive_utc(end) or datetime.utcnow()
+    start = _naive_utc(start) or end - timedelta(hours=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if not 1 <= points <= 2000:
+        raise HTTPException(status_code=400, detail="points must be between 1 and 2000")
+    return await device_telemetry.history(device_id, start, end, points)
 
 @api_router.put("/devices/{device_id}/status")
 async def update_device_status(
@@ -381,6 +604,7 @@ async def update_device_status(
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Device not found")
+    device_state.note_status(device_id, status_update.status.value)
     
     return {"message": f"Device status updated to {status_update.status}"}
 
@@ -391,13 +615,12 @@ async def delete_device(device_id: str, current_user: dict = Depends(require_rol
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Device not found")
     
-    # Remove from PiKVM manager
-    if device_id in superducks_manager.devices:
-        del superducks_manager.devices[device_id]
-    
     # Remove all user permissions for this device
     await db.user_device_permissions.delete_many({"device_id": device_id})
     
+    # Drop it from the device managers and caches of every worker
+    await propagate_change({"kind": "device_deleted", "device_id": device_id})
+    
     # Log device deletion
     await log_user_action(
         user_id=current_user["id"],
@@ -440,7 +663,7 @@ async def execute_power_action(
         "user_id": current_user["id"]
     }
     
-    await db.power_logs.insert_one(action_log)
+    await audit_sink.write("power_logs", action_log)
     
     # Log user action for audit
     await log_user_action(
@@ -451,17 +674,155 @@ async def execute_power_action(
         ip_address=client_request.client.host if client_request and client_request.client else "unknown"
     )
     
-    await manager.broadcast(json.dumps({
+    pubsub_hub.publish(device_topic(request.device_id), {
         "type": "power_action",
         "device_id": request.device_id,
         "action": request.action,
         "timestamp": action_log["timestamp"].isoformat(),
         "user": current_user["username"]
-    }))
+    })
     
     return {"message": f"Power action '{request.action}' executed successfully", "log_id": action_log["id"]}
 
 # Input Control with Real PiKVM Integration
+background_tasks = set()
+
+def _run_in_background(coro):
+    """Run a coroutine off the request path, keeping a reference until it finishes"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def _record_keyboard_input(event: Dict[str, Any]) -> str:
+    """Write the input log, audit entry and broadcast for a keyboard event"""
+    input_log = {
+        "id": str(uuid.uuid4()),
+        "device_id": event["device_id"],
+        "type": "keyboard",
+        "keys": event["keys"],
+        "modifiers": event["modifiers"],
+        "timestamp": datetime.utcnow(),
+        "user_id": event["user_id"]
+    }
+    
+    await audit_sink.write("input_logs", input_log)
+    
+    # Log user action for audit
+    await log_user_action(
+        user_id=event["user_id"],
+        action="keyboard_input",
+        device_id=event["device_id"],
+        details={"keys": event["keys"], "modifiers": event["modifiers"]},
+        ip_address=event["ip_address"]
+    )
+    
+    pubsub_hub.publish(device_topic(event["device_id"]), {
+        "type": "keyboard_input",
+        "device_id": event["device_id"],
+        "keys": event["keys"],
+        "timestamp": input_log["timestamp"].isoformat(),
+        "user": event["username"]
+    })
+    
+    return input_log["id"]
+
+async def _record_mouse_input(event: Dict[str, Any]) -> str:
+    """Write the input log, audit entry and broadcast for a mouse event"""
+    input_log = {
+        "id": str(uuid.uuid4()),
+        "device_id": event["device_id"],
+        "type": "mouse",
+        "x": event["x"],
+        "y": event["y"],
+        "button": event["button"],
+        "action": event["action"],
+        "timestamp": datetime.utcnow(),
+        "user_id": event["user_id"]
+    }
+    
+    await audit_sink.write("input_logs", input_log)
+    
+    # Log user action for audit
+    await log_user_action(
+        user_id=event["user_id"],
+        action="mouse_input",
+        device_id=event["device_id"],
+        details={"x": event["x"], "y": event["y"], "button": event["button"], "action": event["action"]},
+        ip_address=event["ip_address"]
+    )
+    
+    pubsub_hub.publish(device_topic(event["device_id"]), {
+        "type": "mouse_input",
+        "device_id": event["device_id"],
+        "x": event["x"],
+        "y": event["y"],
+        "action": event["action"],
+        "timestamp": input_log["timestamp"].isoformat(),
+        "user": event["username"]
+    })
+    
+    return input_log["id"]
+
+async def _record_text_input(event: Dict[str, Any]) -> str:
+    """Write a single input log and audit entry for a typed text block"""
+    # The text itself is not stored; it is often a password
+    input_log = {
+        "id": str(uuid.uuid4()),
+        "device_id": event["device_id"],
+        "type": "text",
+        "characters": len(event["text"]),
+        "keymap": event["keymap"],
+        "timestamp": datetime.utcnow(),
+        "user_id": event["user_id"]
+    }
+    
+    await audit_sink.write("input_logs", input_log)
+    
+    await log_user_action(
+        user_id=event["user_id"],
+        action="text_input",
+        device_id=event["device_id"],
+        details={"characters": len(event["text"]), "keymap": event["keymap"]},
+        ip_address=event["ip_address"]
+    )
+    
+    return input_log["id"]
+
+async def _forward_keyboard_input(event: Dict[str, Any]) -> bool:
+    """Send a keyboard event to the device and record it"""
+    success = await superducks_manager.send_keyboard_input(
+        event["device_id"],
+        event["keys"],
+        event["modifiers"]
+    )
+    
+    if success:
+        if event.get("deferred_logging"):
+            _run_in_background(_record_keyboard_input(event))
+        else:
+            event["log_id"] = await _record_keyboard_input(event)
+    
+    return success
+
+async def _forward_mouse_input(event: Dict[str, Any]) -> bool:
+    """Send a shaped mouse event to the device and record it"""
+    success = await superducks_manager.send_mouse_input(
+        event["device_id"],
+        event["x"],
+        event["y"],
+        event["button"],
+        event["action"]
+    )
+    
+    if success:
+        if event.get("deferred_logging"):
+            _run_in_background(_record_mouse_input(event))
+        else:
+            event["log_id"] = await _record_mouse_input(event)
+    
+    return success
+
 @api_router.post("/input/keyboard")
 async def send_keyboard_input(
     input_data: KeyboardInput, 
@@ -473,47 +834,58 @@ async def send_keyboard_input(
     if not await has_permission(current_user, input_data.device_id, PermissionLevel.CONTROL):
         raise HTTPException(status_code=403, detail="Insufficient permissions for input control")
     
-    # Execute keyboard input via PiKVM Manager
-    success = await superducks_manager.send_keyboard_input(
-        input_data.device_id, 
-        input_data.keys, 
-        input_data.modifiers or []
-    )
+    event = {
+        "device_id": input_data.device_id,
+        "keys": input_data.keys,
+        "modifiers": input_data.modifiers or [],
+        "user_id": current_user["id"],
+        "username": current_user["username"],
+        "ip_address": client_request.client.host if client_request and client_request.client else "unknown"
+    }
     
-    if not success:
+    # Keys share the device input stream with mouse events so ordering is kept
+    result = await input_shaper_manager.submit(input_data.device_id, event, _forward_keyboard_input)
+    
+    if not result["success"]:
         raise HTTPException(status_code=500, detail="Failed to send keyboard input")
     
-    # Log the input
-    input_log = {
-        "id": str(uuid.uuid4()),
+    return {"message": "Keyboard input sent successfully", "log_id": event.get("log_id")}
+
+@api_router.post("/input/text")
+async def send_text_input(
+    input_data: TextInput,
+    current_user: dict = Depends(get_current_active_user),
+    client_request: Request = None
+):
+    """Type a whole string on the remote device"""
+    if not await has_permission(current_user, input_data.device_id, PermissionLevel.CONTROL):
+        raise HTTPException(status_code=403, detail="Insufficient permissions for input control")
+    
+    event = {
         "device_id": input_data.device_id,
-        "type": "keyboard",
-        "keys": input_data.keys,
-        "modifiers": input_data.modifiers,
-        "timestamp": datetime.utcnow(),
-        "user_id": current_user["id"]
+        "text": input_data.text,
+        "keymap": input_data.keymap,
+        "user_id": current_user["id"],
+        "username": current_user["username"],
+        "ip_address": client_request.client.host if client_request and client_request.client else "unknown"
     }
     
-    await db.input_logs.insert_one(input_log)
+    async def forward(event: Dict[str, Any]) -> bool:
+        success = await superducks_manager.type_text(event["device_id"], event["text"], event["keymap"])
+        if success:
+            event["log_id"] = await _record_text_input(event)
+        return success
     
-    # Log user action for audit
-    await log_user_action(
-        user_id=current_user["id"],
-        action="keyboard_input",
-        device_id=input_data.device_id,
-        details={"keys": input_data.keys, "modifiers": input_data.modifiers},
-        ip_address=client_request.client.host if client_request and client_request.client else "unknown"
-    )
+    result = await input_shaper_manager.submit(input_data.device_id, event, forward)
     
-    await manager.broadcast(json.dumps({
-        "type": "keyboard_input",
-        "device_id": input_data.device_id,
-        "keys": input_data.keys,
-        "timestamp": input_log["timestamp"].isoformat(),
-        "user": current_user["username"]
-    }))
+    if not result["success"]:
+        raise HTTPException(status_code=500, detail="Failed to type text")
     
-    return {"message": "Keyboard input sent successfully", "log_id": input_log["id"]}
+    return {
+        "message": "Text typed successfully",
+        "characters": len(input_data.text),
+        "log_id": event.get("log_id")
+    }
 
 @api_router.post("/input/mouse")
 async def send_mouse_input(
@@ -526,87 +898,84 @@ async def send_mouse_input(
     if not await has_permission(current_user, input_data.device_id, PermissionLevel.CONTROL):
         raise HTTPException(status_code=403, detail="Insufficient permissions for input control")
     
-    # Execute mouse input via PiKVM Manager
-    success = await superducks_manager.send_mouse_input(
-        input_data.device_id,
-        input_data.x,
-        input_data.y,
-        input_data.button,
-        input_data.action
-    )
-    
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to send mouse input")
-    
-    # Log the input
-    input_log = {
-        "id": str(uuid.uuid4()),
+    event = {
         "device_id": input_data.device_id,
-        "type": "mouse",
         "x": input_data.x,
         "y": input_data.y,
         "button": input_data.button,
         "action": input_data.action,
-        "timestamp": datetime.utcnow(),
-        "user_id": current_user["id"]
+        "user_id": current_user["id"],
+        "username": current_user["username"],
+        "ip_address": client_request.client.host if client_request and client_request.client else "unknown"
     }
     
-    await db.input_logs.insert_one(input_log)
-    
-    # Log user action for audit
-    await log_user_action(
-        user_id=current_user["id"],
-        action="mouse_input",
-        device_id=input_data.device_id,
-        details={"x": input_data.x, "y": input_data.y, "button": input_data.button, "action": input_data.action},
-        ip_address=client_request.client.host if client_request and client_request.client else "unknown"
+    # Moves are coalesced and rate limited per device; clicks keep their order
+    result = await input_shaper_manager.submit(
+        input_data.device_id,
+        event,
+        _forward_mouse_input,
+        coalescible=input_data.action == "move"
     )
     
-    await manager.broadcast(json.dumps({
-        "type": "mouse_input",
-        "device_id": input_data.device_id,
-        "x": input_data.x,
-        "y": input_data.y,
-        "action": input_data.action,
-        "timestamp": input_log["timestamp"].isoformat(),
-        "user": current_user["username"]
-    }))
+    if not result["success"]:
+        raise HTTPException(status_code=500, detail="Failed to send mouse input")
     
-    return {"message": "Mouse input sent successfully", "log_id": input_log["id"]}
+    return {
+        "message": "Mouse input sent successfully",
+        "log_id": event.get("log_id"),
+        "coalesced": result["coalesced"]
+    }
 
 # System Monitoring Routes
 @api_router.get("/system/metrics", response_model=SystemMetrics)
 async def get_system_metrics():
-    """Get current system metrics"""
-    try:
-        cpu_usage = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
-        uptime = subprocess.check_output(['uptime', '-p']).decode().strip()
-        
-        # Try to get temperature (works on Raspberry Pi)
-        temperature = None
-        try:
-            temp_output = subprocess.check_output(['vcgencmd', 'measure_temp']).decode()
-            temperature = float(temp_output.split('=')[1].split('\'')[0])
-        except:
-            pass
-        
-        metrics = SystemMetrics(
-            cpu_usage=cpu_usage,
-            memory_usage=memory.percent,
-            disk_usage=disk.percent,
-            temperature=temperature,
-            uptime=uptime
+    """Get the latest system metrics sample"""
+    sample = system_metrics_sampler.latest
+    if sample is None:
+        # Sampling CPU here would move the baseline the sampler's next reading is measured from
+        raise HTTPException(
+            status_code=503,
+            detail="System metrics are not sampled yet, please retry",
+            headers={"Retry-After": str(max(1, round(system_metrics_sampler.interval)))}
         )
-        
-        # Store metrics in database
-        await db.system_metrics.insert_one(metrics.dict())
-        
-        return metrics
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting system metrics: {str(e)}")
+    return SystemMetrics(**sample)
+
+@api_router.get("/system/metrics/history")
+async def get_system_metrics_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = 200,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Get min/avg/max system metrics over a time range, downsampled to about `points` values"""
+    end = _naive_utc(end) or datetime.utcnow()
+    start = _naive_utc(start) or end - timedelta(hours=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if not 1 <= points <= 2000:
+        raise HTTPException(status_code=400, detail="points must be between 1 and 2000")
+    return await system_metrics_store.history(start, end, points)
+
+@api_router.get("/system/runtime")
+async def get_runtime_stats(current_user: dict = Depends(require_role(UserRole.ADMIN))):
+    """Get internal pipeline statistics (Admin only)"""
+    return {
+        "input_shaper": input_shaper_manager.get_stats(),
+        "device_registry": device_registry.get_stats(),
+        "pikvm_drivers": pikvm_drivers.get_stats(),
+        "password_hasher": password_hasher.get_stats(),
+        "token_cache": token_cache.get_stats(),
+        "permission_index": permission_index.get_stats(),
+        "audit_sink": audit_sink.get_stats(),
+        "db_indexes": index_manager.get_stats(),
+        "system_metrics": {**system_metrics_sampler.get_stats(), "store": system_metrics_store.get_stats()},
+        "device_telemetry": device_telemetry.get_stats(),
+        "device_state": device_state.get_stats(),
+        "pubsub": pubsub_hub.get_stats(),
+        "video_streaming": video_stream_manager.get_stats(),
+        "event_bus": event_bus.get_stats(),
+        "device_sharding": device_sharding.get_stats()
+    }
 
 # File Upload Routes
 @api_router.post("/upload/iso")
@@ -648,33 +1017,143 @@ async def list_uploaded_files():
     return files
 
 # WebSocket for real-time communication
+async def _handle_ws_input(websocket: WebSocket, device_id: str, message: Dict[str, Any],
+                           session: Dict[str, Any]):
+    """Feed a keyboard or mouse message from the device socket into the HID pipeline"""
+    received_at = asyncio.get_running_loop().time()
+    ack = {"type": "input_ack", "seq": message.get("seq")}
+    
+    # Resolved at connect time and refreshed when the user or their permissions change
+    if not session.get("can_control"):
+        ack.update({"success": False, "error": "Insufficient permissions for input control"})
+        await websocket.send_text(json.dumps(ack))
+        return
+    
+    user = session["user"]
+    event = {
+        "device_id": device_id,
+        "user_id": user["id"],
+        "username": user["username"],
+        "ip_address": session["ip_address"],
+        "deferred_logging": True
+    }
+    
+    try:
+        if message["type"] == "keyboard":
+            event.update({"keys": message["keys"], "modifiers": message.get("modifiers") or []})
+            result = await input_shaper_manager.submit(device_id, event, _forward_keyboard_input)
+        else:
+            action = message.get("action", "move")
+            event.update({
+                "x": int(message["x"]),
+                "y": int(message["y"]),
+                "button": message.get("button"),
+                "action": action
+            })
+            result = await input_shaper_manager.submit(
+                device_id, event, _forward_mouse_input, coalescible=action == "move"
+            )
+        ack.update(result)
+    except (KeyError, TypeError, ValueError) as e:
+        ack.update({"success": False, "error": f"Invalid input message: {str(e)}"})
+    
+    ack["latency_ms"] = round((asyncio.get_running_loop().time() - received_at) * 1000, 3)
+    await websocket.send_text(json.dumps(ack))
+
+@api_router.websocket("/ws/system/metrics")
+async def system_metrics_websocket(websocket: WebSocket, token: Optional[str] = None):
+    """Push every new system metrics sample, starting with the buffered recent ones"""
+    user = await get_user_from_token(token) if token else None
+    if user is None or not user.get("active", True):
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    queue = system_metrics_sampler.subscribe()
+    
+    async def push_samples():
+        await websocket.send_text(json.dumps({
+            "type": "system_metrics_history",
+            "samples": jsonable_encoder(system_metrics_sampler.recent())
+        }))
+        while True:
+            sample = await queue.get()
+            await websocket.send_text(json.dumps({"type": "system_metrics", "sample": jsonable_encoder(sample)}))
+    
+    pusher = asyncio.create_task(push_samples())
+    try:
+        # Nothing is expected from the client; reading notices the disconnect
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        system_metrics_sampler.unsubscribe(queue)
+        pusher.cancel()
+        await asyncio.gather(pusher, return_exceptions=True)
+
 @api_router.websocket("/ws/{device_id}")
-async def websocket_endpoint(websocket: WebSocket, device_id: str):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, device_id: str, token: Optional[str] = None):
+    # Authenticate once per connection; input messages reuse the cached result
+    session = {"user": None, "can_control": False, "websocket": websocket, "device_id": device_id}
+    if token:
+        user = await get_user_from_token(token)
+        if user is None or not user.get("active", True) or \
+                not await has_permission(user, device_id, PermissionLevel.VIEW_ONLY):
+            await websocket.close(code=1008)
+            return
+        session.update({
+            "user": user,
+            "can_control": await has_permission(user, device_id, PermissionLevel.CONTROL),
+            "ip_address": websocket.client.host if websocket.client else "unknown"
+        })
+    
+    await websocket.accept()
+    if session["user"]:
+        input_sessions.setdefault(session["user"]["id"], []).append(session)
+    pubsub_hub.connect(websocket, session["user"])
+    # Events of the device the socket was opened for arrive without asking
+    await pubsub_hub.subscribe(websocket, device_topic(device_id))
     try:
         while True:
             data = await websocket.receive_text()
             message = json.loads(data)
             
             # Handle different message types
-            if message.get("type") == "video_request":
+            if message.get("type") in ("keyboard", "mouse"):
+                # Not awaited so queued moves can coalesce; acks carry the seq
+                _run_in_background(_handle_ws_input(websocket, device_id, message, session))
+            elif message.get("type") in ("subscribe", "unsubscribe"):
+                topic = str(message.get("topic", ""))
+                if message["type"] == "subscribe":
+                    subscribed = await pubsub_hub.subscribe(websocket, topic)
+                else:
+                    pubsub_hub.unsubscribe(websocket, topic)
+                    subscribed = False
+                await websocket.send_text(json.dumps({"type": "subscription", "topic": topic, "subscribed": subscribed}))
+            elif message.get("type") == "video_request":
                 # In real implementation, this would stream video from PiKVM
-                await manager.send_personal_message(
-                    json.dumps({
-                        "type": "video_frame",
-                        "device_id": device_id,
-                        "frame": "base64_encoded_frame_data"
-                    }), 
-                    websocket
-                )
+                await websocket.send_text(json.dumps({
+                    "type": "video_frame",
+                    "device_id": device_id,
+                    "frame": "base64_encoded_frame_data"
+                }))
             elif message.get("type") == "heartbeat":
-                await manager.send_personal_message(
-                    json.dumps({"type": "heartbeat_response", "timestamp": datetime.utcnow().isoformat()}),
-                    websocket
+                await websocket.send_text(
+                    json.dumps({"type": "heartbeat_response", "timestamp": datetime.utcnow().isoformat()})
                 )
                 
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
+    finally:
+        await pubsub_hub.disconnect(websocket)
+        if session["user"]:
+            user_id = session["user"]["id"]
+            remaining = [other for other in input_sessions.get(user_id, []) if other is not session]
+            if remaining:
+                input_sessions[user_id] = remaining
+            else:
+                input_sessions.pop(user_id, None)
 
 # Health Check Routes
 @api_router.get("/health")
@@ -723,57 +1202,101 @@ async def get_video_stream(
 @api_router.get("/audit/logs")
 async def get_audit_logs(
     limit: int = 100,
+    cursor: Optional[str] = None,
     device_id: Optional[str] = None,
     user_id: Optional[str] = None,
+    action: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
     current_user: dict = Depends(require_role(UserRole.ADMIN))
 ):
-    """Get audit logs (Admin only)"""
-    filter_query = {}
-    
-    if device_id:
-        filter_query["device_id"] = device_id
-    if user_id:
-        filter_query["user_id"] = user_id
-    
-    logs = await db.audit_log.find(filter_query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
+    """Get audit logs, newest first (Admin only)
+    
+    Pass the X-Next-Cursor response header back as ``cursor`` for the next page.
+    """
+    query = build_log_filter(device_id=device_id, user_id=user_id, action=action, start=start, end=end)
+    return await log_page(db.audit_log, query, limit, cursor)
+
+@api_router.get("/audit/export")
+async def export_audit_logs(
+    request: Request,
+    format: str = "ndjson",
+    gzip: bool = False,
+    device_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    action: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: dict = Depends(require_role(UserRole.ADMIN))
+):
+    """Export audit logs as NDJSON or CSV, optionally gzip-compressed (Admin only)"""
+    query = build_log_filter(device_id=device_id, user_id=user_id, action=action, start=start, end=end)
+    response = log_export(db.audit_log, query, format, gzip)
     
-    return logs
+    await log_user_action(
+        user_id=current_user["id"],
+        action="export_audit_logs",
+        details={"format": format, "gzip": gzip, "filter": jsonable_encoder(query)},
+        ip_address=request.client.host if request.client else "unknown"
+    )
+    return response
 
 @api_router.get("/logs/power")
 async def get_power_logs(
-    limit: int = 100, 
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    device_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    action: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Get power action logs for accessible devices"""
+    """Get power action logs for accessible devices, newest first"""
     accessible_device_ids = await get_user_accessible_devices(current_user)
-    
-    if not accessible_device_ids:
-        return []
-    
-    logs = await db.power_logs.find(
-        {"device_id": {"$in": accessible_device_ids}}, 
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(limit).to_list(limit)
-    
-    return logs
+    query = build_log_filter(accessible_device_ids, device_id, user_id, action, start, end)
+    return await log_page(db.power_logs, query, limit, cursor)
 
 @api_router.get("/logs/input")
 async def get_input_logs(
-    limit: int = 100, 
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    device_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    input_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Get input logs for accessible devices"""
+    """Get input logs for accessible devices, newest first"""
     accessible_device_ids = await get_user_accessible_devices(current_user)
+    query = build_log_filter(accessible_device_ids, device_id, user_id, input_type, start, end, action_field="type")
+    return await log_page(db.input_logs, query, limit, cursor)
+
+@api_router.get("/logs/input/export")
+async def export_input_logs(
+    request: Request,
+    format: str = "ndjson",
+    gzip: bool = False,
+    device_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    input_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: dict = Depends(require_role(UserRole.ADMIN))
+):
+    """Export input logs of accessible devices as NDJSON or CSV, optionally gzip-compressed (Admin only)"""
+    accessible_device_ids = await get_user_accessible_devices(current_user)
+    query = build_log_filter(accessible_device_ids, device_id, user_id, input_type, start, end, action_field="type")
+    response = log_export(db.input_logs, query, format, gzip)
     
-    if not accessible_device_ids:
-        return []
-    
-    logs = await db.input_logs.find(
-        {"device_id": {"$in": accessible_device_ids}}, 
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(limit).to_list(limit)
-    
-    return logs
+    await log_user_action(
+        user_id=current_user["id"],
+        action="export_input_logs",
+        details={"format": format, "gzip": gzip, "filter": jsonable_encoder(query)},
+        ip_address=request.client.host if request.client else "unknown"
+    )
+    return response
 
 # Import hardware and streaming modules
 from pikvm_hardware import pikvm_hardware_manager, PiKVMDevice
@@ -809,14 +1332,18 @@ async def add_pikvm_device(
                 "ip_address": device.ip_address,
                 "port": device.port,
                 "use_https": device.use_https,
-                "status": device.status.value,
+                # Stored in the Device vocabulary so /devices can list hardware too
+                "status": DeviceStatus.ONLINE.value,
                 "capabilities": device.capabilities,
+                "tags": device_data.get("tags", []),
                 "hardware_type": "real_pikvm",
+                "pikvm_credentials": device_credentials.seal(device.username, device.password),
                 "created_at": datetime.utcnow().isoformat(),
                 "created_by": current_user["id"]
             }
             
             await db.devices.insert_one(device_doc)
+            await propagate_change({"kind": "device_added", "device_id": device.id, "doc_id": device_doc.get("_id")})
             
             await log_user_action(
                 user_id=current_user["id"],
@@ -884,11 +1411,11 @@ async def hardware_power_action(
                 "action": action,
                 "user_id": current_user["id"],
                 "username": current_user["username"],
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.utcnow(),
                 "hardware_response": result.get("pikvm_response", {})
             }
             
-            await db.power_logs.insert_one(log_entry)
+            await audit_sink.write("power_logs", log_entry)
             
             await log_user_action(
                 user_id=current_user["id"],
@@ -902,6 +1429,193 @@ async def hardware_power_action(
         logger.error(f"Hardware power action error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Bulk Power Management
+async def _execute_device_power_action(device_id: str, action: str) -> Dict[str, Any]:
+    """Run a power action through whichever manager owns the device"""
+    if await device_registry.ensure_device(device_id) == HARDWARE:
+        return await pikvm_hardware_manager.power_action(device_id, action)
+    
+    success = await superducks_manager.execute_power_action(device_id, action)
+    return {"success": success, "error": None if success else "Failed to execute power action"}
+
+@api_router.post("/power/bulk")
+async def start_bulk_power_action(
+    request: BulkPowerRequest,
+    current_user: dict = Depends(get_current_active_user),
+    client_request: Request = None
+):
+    """Run a power action on many devices in parallel"""
+    if not request.device_ids and not request.tag:
+        raise HTTPException(status_code=400, detail="Either device_ids or tag is required")
+    
+    if request.device_ids:
+        device_ids = list(dict.fromkeys(request.device_ids))
+    else:
+        devices = await db.devices.find({"tags": request.tag}, {"id": 1, "_id": 0}).to_list(None)
+        device_ids = [device["id"] for device in devices]
+    
+    if not device_ids:
+        raise HTTPException(status_code=404, detail="No devices matched the request")
+    
+    allowed = set()
+    for device_id in device_ids:
+        if await has_permission(current_user, device_id, PermissionLevel.CONTROL):
+            allowed.add(device_id)
+    
+    action = request.action.value
+    ip_address = client_request.client.host if client_request and client_request.client else "unknown"
+    
+    async def executor(device_id: str) -> Dict[str, Any]:
+        if device_id not in allowed:
+            return {"success": False, "error": "Insufficient permissions for power control"}
+        return await _execute_device_power_action(device_id, action)
+    
+    async def on_complete(job) -> None:
+        timestamp = datetime.utcnow()
+        for result in job.results:
+            if result["success"]:
+                await audit_sink.write("power_logs", {
+                    "id": str(uuid.uuid4()),
+                    "device_id": result["device_id"],
+                    "action": action,
+                    "timestamp": timestamp,
+                    "status": "success",
+                    "user_id": current_user["id"],
+                    "bulk_job_id": job.id
+                })
+        
+        # One audit record for the whole job
+        summary = job.summary()
+        await log_user_action(
+            user_id=current_user["id"],
+            action="bulk_power_control",
+            details={
+                "job_id": job.id,
+                "power_action": action,
+                "status": summary["status"],
+                "total": summary["total"],
+                "succeeded": summary["succeeded"],
+                "failed": summary["failed"],
+                "results": [
+                    {"device_id": result["device_id"], "success": result["success"], "error": result["error"]}
+                    for result in job.results
+                ]
+            },
+            ip_address=ip_address
+        )
+    
+    job = bulk_power_manager.start_job(
+        action,
+        device_ids,
+        executor,
+        created_by=current_user["id"],
+        concurrency=request.concurrency,
+        stagger_seconds=request.stagger_ms / 1000.0,
+        on_complete=on_complete
+    )
+    
+    return {**job.summary(), "events_url": f"/api/power/bulk/{job.id}/events"}
+
+def _get_bulk_power_job(job_id: str, current_user: dict):
+    job = bulk_power_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Bulk power job not found")
+    if job.created_by != current_user["id"] and current_user.get("role") not in (UserRole.ADMIN, UserRole.SUPER_ADMIN):
+        raise HTTPException(status_code=403, detail="Access denied to this job")
+    return job
+
+@api_router.get("/power/bulk/{job_id}")
+async def get_bulk_power_job(job_id: str, current_user: dict = Depends(get_current_active_user)):
+    """Get progress and per-device results of a bulk power job"""
+    job = _get_bulk_power_job(job_id, current_user)
+    return {**job.summary(), "results": job.results}
+
+@api_router.get("/power/bulk/{job_id}/events")
+async def stream_bulk_power_job(job_id: str, current_user: dict = Depends(get_current_active_user)):
+    """Stream per-device results of a bulk power job as Server-Sent Events"""
+    job = _get_bulk_power_job(job_id, current_user)
+    
+    async def event_stream():
+        async for event in job.events():
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.delete("/power/bulk/{job_id}")
+async def cancel_bulk_power_job(job_id: str, current_user: dict = Depends(get_current_active_user)):
+    """Cancel a running bulk power job"""
+    _get_bulk_power_job(job_id, current_user)
+    if not await bulk_power_manager.cancel_job(job_id):
+        raise HTTPException(status_code=409, detail="Job is not running")
+    return {"message": "Bulk power job cancelled", "job_id": job_id}
+
+@api_router.post("/discovery/scan")
+async def start_discovery_scan(
+    request: DiscoveryRequest,
+    current_user: dict = Depends(require_role(UserRole.ADMIN))
+):
+    """Scan address ranges for PiKVM devices (Admin only)"""
+    try:
+        job = pikvm_discovery.start_job(
+            request.cidrs,
+            created_by=current_user["id"],
+            ports=request.ports,
+            concurrency=request.concurrency,
+            connect_timeout=request.connect_timeout_ms / 1000.0,
+            http_timeout=request.http_timeout_ms / 1000.0,
+            username=request.pikvm_username,
+            password=request.pikvm_password
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    await log_user_action(
+        user_id=current_user["id"],
+        action="discovery_scan",
+        details={"job_id": job.id, "cidrs": request.cidrs, "total_hosts": job.total_hosts}
+    )
+    
+    return {**job.summary(), "events_url": f"/api/discovery/{job.id}/events"}
+
+def _get_discovery_job(job_id: str):
+    job = pikvm_discovery.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Discovery job not found")
+    return job
+
+@api_router.get("/discovery/{job_id}")
+async def get_discovery_job(job_id: str, current_user: dict = Depends(require_role(UserRole.ADMIN))):
+    """Get progress and devices found by a discovery scan (Admin only)"""
+    job = _get_discovery_job(job_id)
+    return {**job.summary(), "devices": job.found}
+
+@api_router.get("/discovery/{job_id}/events")
+async def stream_discovery_job(job_id: str, current_user: dict = Depends(require_role(UserRole.ADMIN))):
+    """Stream devices found by a discovery scan as Server-Sent Events (Admin only)"""
+    job = _get_discovery_job(job_id)
+    
+    async def event_stream():
+        async for event in job.events():
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.delete("/discovery/{job_id}")
+async def cancel_discovery_job(job_id: str, current_user: dict = Depends(require_role(UserRole.ADMIN))):
+    """Cancel a running discovery scan (Admin only)"""
+    _get_discovery_job(job_id)
+    if not await pikvm_discovery.cancel_job(job_id):
+        raise HTTPException(status_code=409, detail="Job is not running")
+    return {"message": "Discovery scan cancelled", "job_id": job_id}
+
 @api_router.post("/hardware/devices/{device_id}/keyboard")
 async def hardware_keyboard_input(
     device_id: str,
@@ -929,11 +1643,11 @@ async def hardware_keyboard_input(
                 "modifiers": modifiers,
                 "user_id": current_user["id"],
                 "username": current_user["username"],
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.utcnow(),
                 "hardware_response": result.get("pikvm_response", {})
             }
             
-            await db.input_logs.insert_one(log_entry)
+            await audit_sink.write("input_logs", log_entry)
         
         return result
         
@@ -951,13 +1665,16 @@ async def hardware_mouse_input(
     if not await has_permission(current_user, device_id, PermissionLevel.CONTROL):
         raise HTTPException(status_code=403, detail="Insufficient permissions for input control")
     
-    try:
-        x = input_data.get("x", 0)
-        y = input_data.get("y", 0)
-        buttons = input_data.get("buttons", [])
-        scroll = input_data.get("scroll", 0)
-        
-        result = await pikvm_hardware_manager.send_mouse_input(device_id, x, y, buttons, scroll)
+    x = input_data.get("x", 0)
+    y = input_data.get("y", 0)
+    buttons = input_data.get("buttons", [])
+    scroll = input_data.get("scroll", 0)
+    
+    async def forward(event: Dict[str, Any]) -> bool:
+        result = await pikvm_hardware_manager.send_mouse_input(
+            device_id, event["x"], event["y"], event["buttons"], event["scroll"]
+        )
+        event["result"] = result
         
         if result["success"]:
             # Log the input
@@ -966,24 +1683,78 @@ async def hardware_mouse_input(
                 "id": log_id,
                 "device_id": device_id,
                 "type": "mouse",
-                "x": x,
-                "y": y,
-                "buttons": buttons,
-                "scroll": scroll,
+                "x": event["x"],
+                "y": event["y"],
+                "buttons": event["buttons"],
+                "scroll": event["scroll"],
                 "user_id": current_user["id"],
                 "username": current_user["username"],
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.utcnow(),
                 "hardware_response": result.get("pikvm_response", {})
             }
             
-            await db.input_logs.insert_one(log_entry)
+            await audit_sink.write("input_logs", log_entry)
         
-        return result
+        return result["success"]
+    
+    try:
+        event = {"x": x, "y": y, "buttons": buttons, "scroll": scroll}
+        
+        # Plain moves are coalesced and rate limited per device
+        shaped = await input_shaper_manager.submit(
+            device_id,
+            event,
+            forward,
+            coalescible=not buttons and not scroll
+        )
+        
+        if shaped["coalesced"]:
+            return {"success": True, "coalesced": True, "device_id": device_id, "x": x, "y": y}
+        
+        return event.get("result", {"success": False, "device_id": device_id})
         
     except Exception as e:
         logger.error(f"Hardware mouse input error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/hardware/devices/{device_id}/text")
+async def hardware_text_input(
+    device_id: str,
+    input_data: dict,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Type a whole string on real PiKVM hardware"""
+    if not await has_permission(current_user, device_id, PermissionLevel.CONTROL):
+        raise HTTPException(status_code=403, detail="Insufficient permissions for input control")
+    
+    text = input_data.get("text", "")
+    keymap = input_data.get("keymap", "en-us")
+    if not text or len(text) > 65536:
+        raise HTTPException(status_code=400, detail="Text must be between 1 and 65536 characters")
+    
+    try:
+        async def forward(event: Dict[str, Any]) -> bool:
+            event["result"] = await pikvm_hardware_manager.type_text(device_id, text, keymap)
+            return event["result"]["success"]
+        
+        event = {}
+        await input_shaper_manager.submit(device_id, event, forward)
+        result = event.get("result", {"success": False, "device_id": device_id})
+        
+        if result["success"]:
+            await log_user_action(
+                user_id=current_user["id"],
+                action="hardware_text_input",
+                device_id=device_id,
+                details={"characters": len(text), "keymap": keymap, "method": result["method"]}
+            )
+        
+        return result
+        
+    except Exception as e:
+        logger.error(f"Hardware text input error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Video Streaming Routes
 @api_router.post("/streaming/start/{device_id}")
 async def start_video_stream(
@@ -1164,6 +1935,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Configure logging
@@ -1173,11 +1945,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def record_system_metrics(sample: Dict[str, Any]):
+    # Every worker samples the same host; one of them stores the samples
+    if event_bus.is_leader:
+        await system_metrics_store.record(sample)
+
+@app.on_event("startup")
+async def startup_load_devices():
+    # Join the other workers first so no change made by them is missed
+    await event_bus.start()
+    # Know which devices this worker owns before anything contacts them
+    await device_sharding.start()
+    # Registry loads in the background so the API serves immediately
+    await index_manager.start()
+    await device_registry.start()
+    await permission_index.start()
+    await system_metrics_store.start()
+    system_metrics_sampler.start(on_sample=record_system_metrics)
+    await device_state.start()
+    await device_telemetry.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await device_registry.cleanup()
+    await permission_index.cleanup()
+    await index_manager.cleanup()
+    await system_metrics_sampler.stop()
+    await device_telemetry.cleanup()
+    await device_state.cleanup()
+    await pubsub_hub.cleanup()
     # Cleanup streaming resources
     await video_stream_manager.cleanup()
     # Cleanup hardware connections
     await pikvm_hardware_manager.cleanup()
+    await superducks_manager.cleanup()
+    await pikvm_drivers.cleanup()
+    await input_shaper_manager.cleanup()
+    await bulk_power_manager.cleanup()
+    await pikvm_discovery.cleanup()
+    password_hasher.cleanup()
+    await device_sharding.cleanup()
+    await event_bus.cleanup()
+    # Flush buffered log entries before the database connection goes away
+    await audit_sink.close()
     # Close database connection
     client.close()
@@ -0,0 +1,332 @@
+"""
+System Metrics Module
+Samples host metrics on a background thread and keeps them as a time series with minute and hour rollups
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import psutil
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+
+logger = logging.getLogger(__name__)
+
+# Database connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ.get('DB_NAME', 'test_database')]
+
+METRIC_FIELDS = ["cpu_usage", "memory_usage", "disk_usage", "temperature"]
+
+RAW = "raw"
+MINUTE = "minute"
+HOUR = "hour"
+
+# Collection and bucket length of each resolution
+RESOLUTIONS = {
+    RAW: ("system_metrics", None),
+    MINUTE: ("system_metrics_1m", timedelta(minutes=1)),
+    HOUR: ("system_metrics_1h", timedelta(hours=1)),
+}
+
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+
+
+def _read_temperature() -> Optional[float]:
+    """CPU temperature in °C; the thermal zone is what vcgencmd reads on a Raspberry Pi"""
+    try:
+        with open(THERMAL_ZONE) as zone:
+            return round(int(zone.read().strip()) / 1000, 1)
+    except (OSError, ValueError):
+        pass
+    sensors = getattr(psutil, "sensors_temperatures", None)
+    if sensors:
+        for entries in (sensors() or {}).values():
+            if entries:
+                return round(entries[0].current, 1)
+    return None
+
+
+def format_uptime(seconds: float) -> str:
+    """Same wording as `uptime -p`"""
+    minutes = int(seconds // 60)
+    parts = []
+    for unit, length in (("week", 10080), ("day", 1440), ("hour", 60), ("minute", 1)):
+        value, minutes = divmod(minutes, length)
+        if value:
+            parts.append(f"{value} {unit}{'s' if value != 1 else ''}")
+    return "up " + (", ".join(parts) if parts else "0 minutes")
+
+
+def collect_system_metrics() -> Dict[str, Any]:
+    """Take one sample without blocking for a measurement interval.
+
+    CPU usage is the average since the previous call, so the first sample of
+    a process reads 0.
+    """
+    return {
+        "cpu_usage": psutil.cpu_percent(interval=None),
+        "memory_usage": psutil.virtual_memory().percent,
+        "disk_usage": psutil.disk_usage("/").percent,
+        "temperature": _read_temperature(),
+        "uptime": format_uptime(time.time() - psutil.boot_time()),
+        "timestamp": datetime.utcnow()
+    }
+
+
+def _bucket_start(timestamp: datetime, length: timedelta) -> datetime:
+    seconds = int(length.total_seconds())
+    epoch = int((timestamp - datetime(1970, 1, 1)).total_seconds())
+    return datetime(1970, 1, 1) + timedelta(seconds=epoch - epoch % seconds)
+
+
+class SystemMetricsSampler:
+    """Collects samples on a dedicated thread at a fixed interval.
+
+    psutil and file reads never run on the event loop. The thread keeps the
+    last ``history`` samples in a ring buffer and hands each new sample to
+    the loop, which passes it to the ``on_sample`` callback (persistence) and
+    pushes it to every subscriber queue. Subscriber queues are small and a
+    slow subscriber loses its oldest samples rather than holding any up.
+    """
+
+    def __init__(self, interval: float = None, history: int = None):
+        self.interval = interval or float(os.getenv("METRICS_SAMPLE_INTERVAL", "5"))
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=history or int(os.getenv("METRICS_RING_SIZE", "120")))
+        self.stats = {"samples": 0, "failures": 0, "late": 0, "subscriber_drops": 0}
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._on_sample: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def latest(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.samples[-1] if self.samples else None
+
+    def recent(self, count: int = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            samples = list(self.samples)
+        return samples[-count:] if count else samples
+
+    def start(self, on_sample: Callable[[Dict[str, Any]], Awaitable[None]] = None):
+        self._loop = asyncio.get_running_loop()
+        self._on_sample = on_sample
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="system-metrics", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        # Prime the CPU counter so the first sample covers a real interval
+        psutil.cpu_percent(interval=None)
+        next_at = time.monotonic() + self.interval
+        while not self._stop.wait(max(next_at - time.monotonic(), 0)):
+            try:
+                sample = collect_system_metrics()
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.warning(f"System metrics sample failed: {str(e)}")
+                sample = None
+
+            if sample is not None:
+                with self._lock:
+                    self.samples.append(sample)
+                self.stats["samples"] += 1
+                try:
+                    self._loop.call_soon_threadsafe(self._publish, sample)
+                except RuntimeError:
+                    # Event loop closed during shutdown
+                    return
+
+            # Stay on the fixed grid; skip ticks that were missed entirely
+            next_at += self.interval
+            now = time.monotonic()
+            if next_at < now:
+                self.stats["late"] += 1
+                next_at = now + self.interval
+
+    def _publish(self, sample: Dict[str, Any]):
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.stats["subscriber_drops"] += 1
+            queue.put_nowait(sample)
+        if self._on_sample is not None:
+            task = asyncio.create_task(self._on_sample(sample))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def subscribe(self, maxsize: int = 4) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "running": bool(self._thread and self._thread.is_alive()),
+            "buffered": len(self.samples),
+            "subscribers": len(self._subscribers),
+            **self.stats
+        }
+
+    async def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, self.interval + 1)
+            self._thread = None
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class SystemMetricsStore:
+    """Persists samples and serves downsampled history.
+
+    Raw samples go to ``system_metrics``, a MongoDB time-series collection
+    where the server supports it. Every sample is also folded into its
+    minute and hour buckets with ``$min``/``$max``/``$inc`` upserts, so the
+    rollups are maintained incrementally and survive restarts. Each
+    resolution expires through a TTL on its time field.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.retention = {
+            RAW: timedelta(hours=float(os.getenv("METRICS_RAW_RETENTION_HOURS", "24"))),
+            MINUTE: timedelta(days=float(os.getenv("METRICS_MINUTE_RETENTION_DAYS", "7"))),
+            HOUR: timedelta(days=float(os.getenv("METRICS_HOUR_RETENTION_DAYS", "365"))),
+        }
+        self.stats = {"stored": 0, "write_failures": 0, "timeseries": False}
+
+    async def start(self):
+        """Create the collections and their retention indexes"""
+        raw_collection = RESOLUTIONS[RAW][0]
+        raw_ttl = int(self.retention[RAW].total_seconds())
+        try:
+            existing = await self.db.list_collection_names()
+            if raw_collection not in existing:
+                await self.db.create_collection(
+                    raw_collection,
+                    timeseries={"timeField": "timestamp", "granularity": "seconds"},
+                    expireAfterSeconds=raw_ttl
+                )
+                self.stats["timeseries"] = True
+            else:
+                options = await self.db[raw_collection].options()
+                self.stats["timeseries"] = "timeseries" in options
+        except Exception as e:
+            # Before MongoDB 5.0 (or on a plain collection from an older version) fall back to a TTL index
+            logger.info(f"Time-series collection unavailable, using a TTL index for raw metrics: {str(e)}")
+
+        try:
+            if not self.stats["timeseries"]:
+                await self.db[raw_collection].create_index(
+                    [("timestamp", ASCENDING)], expireAfterSeconds=raw_ttl
+                )
+            for resolution in (MINUTE, HOUR):
+                collection = RESOLUTIONS[resolution][0]
+                await self.db[collection].create_index(
+                    [("bucket", ASCENDING)], unique=True,
+                    expireAfterSeconds=int(self.retention[resolution].total_seconds())
+                )
+        except Exception as e:
+            logger.warning(f"Could not create system metrics indexes: {str(e)}")
+
+    async def record(self, sample: Dict[str, Any]):
+        values = {field: sample[field] for field in METRIC_FIELDS if sample.get(field) is not None}
+        try:
+            await self.db[RESOLUTIONS[RAW][0]].insert_one({"timestamp": sample["timestamp"], **values})
+            for resolution in (MINUTE, HOUR):
+                collection, length = RESOLUTIONS[resolution]
+                update: Dict[str, Dict[str, Any]] = {"$inc": {"count": 1}, "$min": {}, "$max": {}}
+                for field, value in values.items():
+                    update["$inc"][f"{field}.sum"] = value
+                    update["$inc"][f"{field}.count"] = 1
+                    update["$min"][f"{field}.min"] = value
+                    update["$max"][f"{field}.max"] = value
+                await self.db[collection].update_one(
+                    {"bucket": _bucket_start(sample["timestamp"], length)}, update, upsert=True
+                )
+            self.stats["stored"] += 1
+        except Exception as e:
+            self.stats["write_failures"] += 1
+            logger.warning(f"Failed to store system metrics: {str(e)}")
+
+    def _resolution_for(self, start: datetime, end: datetime, points: int) -> str:
+        """Coarsest stored resolution that still gives about ``points`` values over the range"""
+        step = (end - start) / max(points, 1)
+        if step >= RESOLUTIONS[HOUR][1] or start < datetime.utcnow() - self.retention[MINUTE]:
+            return HOUR
+        if step >= RESOLUTIONS[MINUTE][1] or start < datetime.utcnow() - self.retention[RAW]:
+            return MINUTE
+        return RAW
+
+    async def history(self, start: datetime, end: datetime, points: int = 200) -> Dict[str, Any]:
+        """min/avg/max of every metric over ``points`` equal steps between start and end"""
+        resolution = self._resolution_for(start, end, points)
+        collection, _ = RESOLUTIONS[resolution]
+        time_field = "timestamp" if resolution == RAW else "bucket"
+        step = max((end - start) / max(points, 1), timedelta(seconds=1))
+
+        buckets: Dict[int, Dict[str, Any]] = {}
+        cursor = self.db[collection].find(
+            {time_field: {"$gte": start, "$lt": end}}, {"_id": 0}
+        ).sort(time_field, ASCENDING)
+        async for doc in cursor:
+            index = int((doc[time_field] - start) / step)
+            bucket = buckets.setdefault(index, {})
+            for field in METRIC_FIELDS:
+                value = doc.get(field)
+                if value is None:
+                    continue
+                # Raw documents hold a value, rollups hold min/max/sum/count
+                if not isinstance(value, dict):
+                    value = {"min": value, "max": value, "sum": value, "count": 1}
+                merged = bucket.setdefault(field, {"min": value["min"], "max": value["max"], "sum": 0.0, "count": 0})
+                merged["min"] = min(merged["min"], value["min"])
+                merged["max"] = max(merged["max"], value["max"])
+                merged["sum"] += value["sum"]
+                merged["count"] += value["count"]
+
+        series: List[Dict[str, Any]] = []
+        for index in sorted(buckets):
+            point: Dict[str, Any] = {"timestamp": start + step * index}
+            for field, merged in buckets[index].items():
+                point[field] = {
+                    "min": round(merged["min"], 2),
+                    "avg": round(merged["sum"] / merged["count"], 2),
+                    "max": round(merged["max"], 2)
+                }
+            series.append(point)
+
+        return {
+            "start": start,
+            "end": end,
+            "resolution": resolution,
+            "step_seconds": step.total_seconds(),
+            "points": series
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "retention_seconds": {name: value.total_seconds() for name, value in self.retention.items()},
+            **self.stats
+        }
+
+
+# Global system metrics instances
+system_metrics_store = SystemMetricsStore(db)
+system_metrics_sampler = SystemMetricsSampler()
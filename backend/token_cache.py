@@ -0,0 +1,128 @@
+"""
+Token Cache Module
+Bounded LRU/TTL cache of verified access tokens and the user records they resolve to
+"""
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+
+def token_key(token: str) -> str:
+    """Cache key for a token; raw tokens are never kept in memory longer than the request"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """Maps verified tokens to user records so authenticated requests skip JWT and DB work.
+
+    Entries expire after ``ttl`` seconds but never later than the token's own
+    ``exp``, so a cached token cannot outlive its signature. Changes to a user
+    (role, active flag, deletion) must be followed by ``invalidate_user`` so
+    the next request reloads the record.
+
+    A lookup that races an invalidation could otherwise cache the record it
+    read before the change. Callers take ``generation()`` before reading the
+    user and pass it to ``put``; every invalidation stamps the user with a
+    newer generation, and puts from older reads are dropped.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self.max_entries = max_entries or int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "60"))
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0,
+                      "stale_puts": 0}
+
+        # key -> (expires_at on the monotonic clock, user record)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # user id -> keys of the tokens cached for that user
+        self._by_user: Dict[str, Set[str]] = {}
+        # user id -> generation of the user's last invalidation
+        self._user_generations: Dict[str, int] = {}
+        self._generation = 0
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Cached user record for the token, or None on a miss"""
+        key = token_key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        expires_at, user = entry
+        if time.monotonic() >= expires_at:
+            self.stats["expired"] += 1
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        # Handlers may modify the user dict they are given
+        return dict(user)
+
+    def generation(self) -> int:
+        """Generation to pass to ``put`` for a user record read after this call"""
+        return self._generation
+
+    def put(self, token: str, user: Dict[str, Any], token_exp: Optional[float] = None,
+            generation: Optional[int] = None):
+        """Cache a verified token; ``token_exp`` is the JWT ``exp`` as a UNIX timestamp"""
+        if self.ttl <= 0:
+            return
+        if generation is not None and self._user_generations.get(user["id"], 0) > generation:
+            # The user was invalidated after this record was read
+            self.stats["stale_puts"] += 1
+            return
+        lifetime = self.ttl
+        if token_exp is not None:
+            lifetime = min(lifetime, token_exp - time.time())
+        if lifetime <= 0:
+            return
+
+        key = token_key(token)
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + lifetime, dict(user))
+        self._by_user.setdefault(user["id"], set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def invalidate_user(self, user_id: str) -> int:
+        """Drop every cached token of a user; returns how many were dropped"""
+        self._generation += 1
+        self._user_generations[user_id] = self._generation
+        keys = self._by_user.pop(user_id, set())
+        for key in keys:
+            self._entries.pop(key, None)
+        self.stats["invalidations"] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_user.clear()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[1]["id"]
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["expired"]
+        return {
+            "entries": len(self._entries),
+            "users": len(self._by_user),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            **self.stats
+        }
@@ -6,16 +6,25 @@ WebRTC and real-time video streaming integration
 import asyncio
 import logging
 import json
+import os
 import base64
-from typing import Dict, List, Optional, Any, Set
+from typing import Dict, List, Optional, Any, Awaitable, Callable, Set
 from datetime import datetime
 from fastapi import WebSocket, WebSocketDisconnect
 import aiohttp
 from pydantic import BaseModel
 from enum import Enum
 
+from event_bus import event_bus
+from pubsub import Subscriber
+from device_sharding import device_sharding, HashRing, ShardCallError
+
 logger = logging.getLogger(__name__)
 
+# Event bus channels: stream start/stop notices, and stream output keyed by device
+STREAMS_CHANNEL = "streams"
+FRAMES_CHANNEL = "frames"
+
 class StreamQuality(str, Enum):
     LOW = "low"          # 640x480, 30fps, 1Mbps
     MEDIUM = "medium"    # 1280x720, 30fps, 2Mbps
@@ -50,13 +59,32 @@ class WebRTCConnection(BaseModel):
         arbitrary_types_allowed = True
 
 class VideoStreamManager:
-    """Manages video streaming from PiKVM devices"""
+    """Manages video streaming from PiKVM devices
+    
+    With several workers, a stream runs on the worker that owns its device;
+    other workers forward start requests there. Start and stop notices go
+    to every worker, and the output reaches the viewers connected to other
+    workers over the event bus, only on workers that have viewers of that
+    device. When ownership moves, running streams move with it.
+    
+    Every viewer has a small queue and its own writer task, so delivering a
+    frame never waits on a socket; a viewer that falls behind loses its
+    oldest frames instead of holding up the other viewers or the event bus.
+    """
     
     def __init__(self):
         self.active_streams: Dict[str, VideoStreamConfig] = {}
         self.webrtc_connections: Dict[str, WebRTCConnection] = {}
         self.websocket_connections: Dict[str, Set[WebSocket]] = {}
+        self.viewers: Dict[WebSocket, Subscriber] = {}
+        self.viewer_queue_size = int(os.getenv("STREAM_VIEWER_QUEUE_SIZE", "8"))
+        self.send_timeout = float(os.getenv("STREAM_SEND_TIMEOUT", "10"))
+        self.stats = {"frames_delivered": 0, "frames_dropped": 0, "send_failures": 0}
         self.stream_tasks: Dict[str, asyncio.Task] = {}
+        # Streams running on other workers, by stream id
+        self.remote_streams: Dict[str, Dict[str, Any]] = {}
+        # Registers devices that are not loaded yet, so they are routed by their box
+        self.hydrator: Optional[Callable[[str], Awaitable[Any]]] = None
         
     async def start_stream(self, config: VideoStreamConfig) -> Dict[str, Any]:
         """Start video stream for a device"""
@@ -70,6 +98,9 @@ class VideoStreamManager:
                     "message": "Stream already active",
                     "stream_url": self.get_stream_url(config)
                 }
+            if await self._should_forward(config.device_id):
+                # The owner runs the capture loop; its frames come back over the event bus
+                return await device_sharding.forward("streams.start", config.device_id, config.dict())
             
             self.active_streams[stream_id] = config
             
@@ -82,6 +113,7 @@ class VideoStreamManager:
                 task = asyncio.create_task(self._handle_h264_stream(config))
                 
             self.stream_tasks[stream_id] = task
+            self._announce(stream_id, config, "started")
             
             logger.info(f"Started {config.stream_type.value} stream for device {config.device_id}")
             
@@ -103,9 +135,21 @@ class VideoStreamManager:
                 "device_id": config.device_id
             }
     
-    async def stop_stream(self, device_id: str, stream_type: StreamType = None) -> Dict[str, Any]:
+    async def stop_stream(self, device_id: str, stream_type: StreamType = None,
+                          forward: bool = True) -> Dict[str, Any]:
         """Stop video stream for a device"""
         try:
+            if forward and any(
+                notice["device_id"] == device_id and (stream_type is None or notice["stream_type"] == stream_type.value)
+                for notice in self.remote_streams.values()
+            ):
+                # The worker running the stream stops it and closes its viewers
+                event_bus.publish(STREAMS_CHANNEL, {
+                    "state": "stop",
+                    "device_id": device_id,
+                    "stream_type": stream_type.value if stream_type else None
+                })
+            
             streams_to_stop = []
             
             if stream_type:
@@ -135,16 +179,19 @@ class VideoStreamManager:
                     config = self.active_streams[stream_id]
                     del self.active_streams[stream_id]
                     stopped_streams.append(config.stream_type.value)
+                    self._announce(stream_id, config, "stopped")
                 
                 # Close WebSocket connections
                 if device_id in self.websocket_connections:
                     connections = list(self.websocket_connections[device_id])
                     for ws in connections:
+                        self._drop_viewer(ws)
                         try:
                             await ws.close()
                         except:
                             pass
                     del self.websocket_connections[device_id]
+                    event_bus.set_interest(FRAMES_CHANNEL, device_id, False)
             
             logger.info(f"Stopped streams {stopped_streams} for device {device_id}")
             
@@ -173,41 +220,126 @@ class VideoStreamManager:
         else:
             return f"/api/stream/{config.device_id}"
     
+    def _announce(self, stream_id: str, config: VideoStreamConfig, state: str):
+        event_bus.publish(STREAMS_CHANNEL, {
+            "state": state,
+            "stream_id": stream_id,
+            "device_id": config.device_id,
+            "stream_type": config.stream_type.value,
+            "quality": config.quality.value,
+            "fps": config.fps,
+            "worker": event_bus.worker_id
+        })
+    
+    async def handle_stream_notice(self, notice: Dict[str, Any], key: Optional[str] = None):
+        """Track the streams of other workers and stop ours when another worker asks"""
+        if notice["state"] == "started":
+            self.remote_streams[notice["stream_id"]] = notice
+        elif notice["state"] == "stopped":
+            self.remote_streams.pop(notice["stream_id"], None)
+        elif notice["state"] == "stop":
+            stream_type = StreamType(notice["stream_type"]) if notice["stream_type"] else None
+            await self.stop_stream(notice["device_id"], stream_type, forward=False)
+    
+    async def _start_forwarded(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.start_stream(VideoStreamConfig(**config))
+    
+    async def rebalance(self, previous: HashRing, ring: HashRing):
+        """Move streams to the new owners of their devices and restart those of departed workers"""
+        worker_id = event_bus.worker_id
+        departed = set(previous.members) - set(ring.members)
+        for stream_id, notice in list(self.remote_streams.items()):
+            if notice["worker"] not in departed:
+                continue
+            del self.remote_streams[stream_id]
+            if ring.owner(device_sharding.owner_key(notice["device_id"])) == worker_id:
+                await self.start_stream(VideoStreamConfig(
+                    device_id=notice["device_id"],
+                    stream_type=StreamType(notice["stream_type"]),
+                    quality=StreamQuality(notice["quality"]),
+                    fps=notice["fps"]
+                ))
+        
+        for stream_id, config in list(self.active_streams.items()):
+            if ring.owner(device_sharding.owner_key(config.device_id)) != worker_id:
+                await self._hand_off(stream_id, config)
+    
+    async def _should_forward(self, device_id: str) -> bool:
+        """Whether the capture loop for a device runs on another worker"""
+        if self.hydrator is not None:
+            await self.hydrator(device_id)
+        return device_sharding.should_forward(device_id)
+    
+    async def _hand_off(self, stream_id: str, config: VideoStreamConfig):
+        """Stop a local capture loop and start it on the device's owner; viewers stay connected"""
+        task = self.stream_tasks.pop(stream_id, None)
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        del self.active_streams[stream_id]
+        self._announce(stream_id, config, "stopped")
+        try:
+            await device_sharding.forward("streams.start", config.device_id, config.dict())
+        except ShardCallError as e:
+            logger.error(f"Failed to hand off stream {stream_id}: {str(e)}")
+    
     async def add_websocket_connection(self, device_id: str, websocket: WebSocket):
         """Add WebSocket connection for streaming"""
         if device_id not in self.websocket_connections:
             self.websocket_connections[device_id] = set()
+            event_bus.set_interest(FRAMES_CHANNEL, device_id, True)
         
         self.websocket_connections[device_id].add(websocket)
+        if websocket not in self.viewers:
+            viewer = Subscriber(websocket, None, self.viewer_queue_size)
+            viewer.writer = asyncio.create_task(self._write(device_id, viewer))
+            self.viewers[websocket] = viewer
         logger.info(f"Added WebSocket connection for device {device_id}")
     
     async def remove_websocket_connection(self, device_id: str, websocket: WebSocket):
         """Remove WebSocket connection"""
+        self._drop_viewer(websocket)
         if device_id in self.websocket_connections:
             self.websocket_connections[device_id].discard(websocket)
             if not self.websocket_connections[device_id]:
                 del self.websocket_connections[device_id]
+                event_bus.set_interest(FRAMES_CHANNEL, device_id, False)
         
         logger.info(f"Removed WebSocket connection for device {device_id}")
     
     async def broadcast_to_device_connections(self, device_id: str, message: Dict[str, Any]):
-        """Broadcast message to all connections for a device"""
-        if device_id not in self.websocket_connections:
-            return
-        
-        connections = list(self.websocket_connections[device_id])
-        disconnected = []
-        
-        for websocket in connections:
+        """Broadcast message to all connections for a device, on every worker"""
+        text = json.dumps(message)
+        if len(event_bus.members) > 1:
+            event_bus.publish(FRAMES_CHANNEL, text, key=device_id, lossy=True)
+        self.deliver(text, device_id)
+    
+    def deliver(self, text: str, device_id: str):
+        """Queue an already serialized stream message for this worker's connections to a device"""
+        for websocket in self.websocket_connections.get(device_id, ()):
+            viewer = self.viewers.get(websocket)
+            if viewer is not None and not viewer.offer(text):
+                self.stats["frames_dropped"] += 1
+    
+    async def _write(self, device_id: str, viewer: Subscriber):
+        websocket = viewer.websocket
+        while True:
+            text = await viewer.queue.get()
             try:
-                await websocket.send_json(message)
+                await asyncio.wait_for(websocket.send_text(text), timeout=self.send_timeout)
+                self.stats["frames_delivered"] += 1
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
+                self.stats["send_failures"] += 1
                 logger.warning(f"Failed to send message to websocket: {str(e)}")
-                disconnected.append(websocket)
-        
-        # Clean up disconnected websockets
-        for ws in disconnected:
-            await self.remove_websocket_connection(device_id, ws)
+                await self.remove_websocket_connection(device_id, websocket)
+                return
+    
+    def _drop_viewer(self, websocket: WebSocket):
+        viewer = self.viewers.pop(websocket, None)
+        if viewer is not None and viewer.writer is not None and viewer.writer is not asyncio.current_task():
+            viewer.writer.cancel()
     
     async def _handle_webrtc_stream(self, config: VideoStreamConfig):
         """Handle WebRTC streaming"""
@@ -359,6 +491,13 @@ class VideoStreamManager:
     
     async def _change_stream_quality(self, device_id: str, quality: str):
         """Change stream quality dynamically"""
+        if await self._should_forward(device_id):
+            try:
+                await device_sharding.forward("streams.quality", device_id, quality)
+            except ShardCallError as e:
+                logger.error(f"Failed to change stream quality for device {device_id}: {str(e)}")
+            return
+        
         # Find active stream for device
         for stream_id, config in self.active_streams.items():
             if config.device_id == device_id and config.stream_type == StreamType.WEBRTC:
@@ -393,11 +532,31 @@ class VideoStreamManager:
                 "bitrate": config.bitrate,
                 "resolution": f"{config.width}x{config.height}",
                 "connection_count": connection_count,
-                "stream_url": self.get_stream_url(config)
+                "stream_url": self.get_stream_url(config),
+                "worker": event_bus.worker_id
+            })
+        
+        for stream_id, notice in self.remote_streams.items():
+            streams.append({
+                "stream_id": stream_id,
+                "device_id": notice["device_id"],
+                "stream_type": notice["stream_type"],
+                "quality": notice["quality"],
+                "fps": notice["fps"],
+                "worker": notice["worker"]
             })
         
         return streams
     
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "active_streams": len(self.active_streams),
+            "remote_streams": len(self.remote_streams),
+            "viewers": len(self.viewers),
+            "backlog": sum(viewer.queue.qsize() for viewer in self.viewers.values()),
+            **self.stats
+        }
+    
     async def cleanup(self):
         """Clean up all streaming resources"""
         # Cancel all streaming tasks
@@ -411,6 +570,7 @@ class VideoStreamManager:
         # Close all WebSocket connections
         for device_connections in self.websocket_connections.values():
             for ws in list(device_connections):
+                self._drop_viewer(ws)
                 try:
                     await ws.close()
                 except:
@@ -423,4 +583,9 @@ class VideoStreamManager:
         self.stream_tasks.clear()
 
 # Global video stream manager instance
-video_stream_manager = VideoStreamManager()
\ No newline at end of file
+video_stream_manager = VideoStreamManager()
+event_bus.subscribe(STREAMS_CHANNEL, video_stream_manager.handle_stream_notice)
+event_bus.subscribe(FRAMES_CHANNEL, video_stream_manager.deliver)
+device_sharding.add_listener(video_stream_manager.rebalance)
+device_sharding.register("streams.start", video_stream_manager._start_forwarded)
+device_sharding.register("streams.quality", video_stream_manager._change_stream_quality)
\ No newline at end of file
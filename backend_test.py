@@ -15,7 +15,7 @@ import os
 from pathlib import Path
 
 # Configuration
-BASE_URL = "https://progress-track-4.preview.emergentagent.com/api"
+BASE_URL = os.environ.get("BACKEND_TEST_URL", "http://localhost:8001/api")
 TIMEOUT = 30
 
 class PiKVMAPITester:
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark Server
+Runs the real FastAPI backend under uvicorn with a seeded admin user for benchmarks
+
+Usage:
+    python benchmarks/bench_server.py --port 8001 --db-name bench_db
+    python benchmarks/bench_server.py --port 8001 --in-memory-db   # needs mongomock-motor
+"""
+
+import argparse
+import os
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+BENCH_ADMIN_USERNAME = "bench_admin"
+BENCH_ADMIN_PASSWORD = "bench-admin-password"
+
+
+def _use_in_memory_db():
+    """Point every AsyncIOMotorClient in the backend at one shared in-memory database"""
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("--in-memory-db requires mongomock-motor (pip install mongomock-motor)")
+
+    import motor.motor_asyncio
+
+    shared_client = AsyncMongoMockClient()
+    motor.motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: shared_client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the backend for benchmarking")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default=f"bench_{uuid.uuid4().hex[:8]}")
+    parser.add_argument("--in-memory-db", action="store_true", help="use mongomock-motor instead of MongoDB")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    if args.in_memory_db:
+        _use_in_memory_db()
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    import uvicorn
+    import server
+    from auth import db, get_password_hash
+
+    @server.app.on_event("startup")
+    async def seed_bench_admin():
+        await db.users.update_one(
+            {"username": BENCH_ADMIN_USERNAME},
+            {"$setOnInsert": {
+                "id": str(uuid.uuid4()),
+                "username": BENCH_ADMIN_USERNAME,
+                "email": "bench@superducks-enterprise.local",
+                "password_hash": get_password_hash(BENCH_ADMIN_PASSWORD),
+                "role": "super_admin",
+                "active": True,
+                "created_at": datetime.utcnow(),
+                "last_login": None
+            }},
+            upsert=True
+        )
+
+    uvicorn.run(server.app, host=args.host, port=args.port, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Benchmark Environment
+Starts the PiKVM simulator and the backend as child processes and registers the simulated devices
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from bench_server import BACKEND_DIR, BENCH_ADMIN_USERNAME, BENCH_ADMIN_PASSWORD
+
+REPO_DIR = BACKEND_DIR.parent
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def add_environment_arguments(parser: argparse.ArgumentParser, devices: int = 10):
+    """Options for the spawned simulator and backend, shared by the benchmark scripts"""
+    parser.add_argument("--devices", type=int, default=devices, help="simulated PiKVM devices")
+    parser.add_argument("--sim-port", type=int, default=21000)
+    parser.add_argument("--sim-latency-ms", type=float, default=5.0)
+    parser.add_argument("--sim-jitter-ms", type=float, default=2.0)
+    parser.add_argument("--sim-error-rate", type=float, default=0.0)
+    parser.add_argument("--sim-bandwidth-kbps", type=float, default=0.0)
+    parser.add_argument("--frame-width", type=int, default=1280)
+    parser.add_argument("--frame-height", type=int, default=720)
+    parser.add_argument("--api-port", type=int, default=0, help="backend port (default: any free port)")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--in-memory-db", action="store_true", help="use mongomock-motor instead of MongoDB")
+    parser.add_argument("--keep-db", action="store_true", help="keep the benchmark database afterwards")
+    parser.add_argument("--log-dir", default=None, help="where child process logs go")
+
+
+class BenchEnvironment:
+    """A throwaway backend wired to simulated PiKVMs"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.log_dir = Path(args.log_dir or tempfile.mkdtemp(prefix="superducks-bench-"))
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.api_port = args.api_port or free_port()
+        self.base_url = f"http://127.0.0.1:{self.api_port}/api"
+        self.ws_url = f"ws://127.0.0.1:{self.api_port}/api"
+        self.db_name = f"bench_{uuid.uuid4().hex[:8]}"
+        self.processes: List[subprocess.Popen] = []
+        self.backend: Optional[subprocess.Popen] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.token: Optional[str] = None
+        self.manifest: List[Dict[str, Any]] = []
+        self.hardware_ids: List[str] = []
+        self.device_ids: List[str] = []
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def _spawn(self, argv: List[str], log_name: str) -> subprocess.Popen:
+        log = open(self.log_dir / log_name, "w")
+        process = subprocess.Popen(argv, stdout=log, stderr=subprocess.STDOUT, cwd=REPO_DIR)
+        self.processes.append(process)
+        return process
+
+    async def start(self, session: aiohttp.ClientSession, with_devices: bool = True):
+        """Start everything, log in as the benchmark admin and register the devices"""
+        self.session = session
+        if with_devices and self.args.devices:
+            await self.start_simulator()
+        await self.start_backend()
+        await self.login()
+        if self.manifest:
+            await self.register_devices()
+
+    async def start_simulator(self):
+        args = self.args
+        manifest_path = self.log_dir / "simulator_manifest.json"
+        self._spawn([
+            sys.executable, str(BACKEND_DIR / "pikvm_simulator.py"),
+            "--devices", str(args.devices),
+            "--port", str(args.sim_port),
+            "--latency-ms", str(args.sim_latency_ms),
+            "--jitter-ms", str(args.sim_jitter_ms),
+            "--error-rate", str(args.sim_error_rate),
+            "--bandwidth-kbps", str(args.sim_bandwidth_kbps),
+            "--width", str(args.frame_width),
+            "--height", str(args.frame_height),
+            "--manifest", str(manifest_path),
+            "--stats-interval", "3600"
+        ], "simulator.log")
+
+        for _ in range(600):
+            if manifest_path.exists() and manifest_path.stat().st_size:
+                try:
+                    self.manifest = json.loads(manifest_path.read_text())
+                    return
+                except ValueError:
+                    pass
+            await asyncio.sleep(0.1)
+        raise RuntimeError("Simulator did not start; see simulator.log")
+
+    async def start_backend(self):
+        argv = [
+            sys.executable, str(BENCHMARKS_DIR / "bench_server.py"),
+            "--port", str(self.api_port),
+            "--db-name", self.db_name,
+            "--mongo-url", self.args.mongo_url
+        ]
+        if self.args.in_memory_db:
+            argv.append("--in-memory-db")
+        self.backend = self._spawn(argv, "backend.log")
+
+        for _ in range(300):
+            if self.backend.poll() is not None:
+                raise RuntimeError("Backend exited during startup; see backend.log")
+            try:
+                async with self.session.get(f"{self.base_url}/") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+        raise RuntimeError("Backend did not become ready; see backend.log")
+
+    async def login(self):
+        async with self.session.post(f"{self.base_url}/auth/login", json={
+            "username": BENCH_ADMIN_USERNAME, "password": BENCH_ADMIN_PASSWORD
+        }) as response:
+            response.raise_for_status()
+            self.token = (await response.json())["access_token"]
+
+    async def register_devices(self):
+        """Register every simulated box for both route families (video and input)"""
+        semaphore = asyncio.Semaphore(20)
+
+        async def register(entry: Dict[str, Any]):
+            async with semaphore:
+                async with self.session.post(f"{self.base_url}/hardware/devices", headers=self.headers, json={
+                    "name": entry["name"],
+                    "ip_address": entry["host"],
+                    "port": entry["port"],
+                    "username": entry["pikvm_username"],
+                    "password": entry["pikvm_password"]
+                }) as response:
+                    response.raise_for_status()
+                    self.hardware_ids.append((await response.json())["device"]["id"])
+
+                async with self.session.post(f"{self.base_url}/devices", headers=self.headers, json={
+                    "name": entry["name"],
+                    "ip_address": entry["ip_address"],
+                    "pikvm_username": entry["pikvm_username"],
+                    "pikvm_password": entry["pikvm_password"]
+                }) as response:
+                    response.raise_for_status()
+                    self.device_ids.append((await response.json())["id"])
+
+        await asyncio.gather(*[register(entry) for entry in self.manifest])
+
+    async def get_json(self, url: str, headers: Optional[Dict[str, str]] = None) -> Optional[Any]:
+        try:
+            async with self.session.get(url, headers=headers) as response:
+                if response.status == 200:
+                    return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            pass
+        return None
+
+    async def runtime_stats(self) -> Optional[Dict[str, Any]]:
+        return await self.get_json(f"{self.base_url}/system/runtime", self.headers)
+
+    async def simulator_totals(self) -> Dict[str, int]:
+        stats = await asyncio.gather(*[
+            self.get_json(f"http://{entry['ip_address']}/__sim__/stats") for entry in self.manifest
+        ])
+        totals: Dict[str, int] = {}
+        for device_stats in stats:
+            for key, value in (device_stats or {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    async def stop(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+        if self.backend is not None and not self.args.in_memory_db and not self.args.keep_db:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            client = AsyncIOMotorClient(self.args.mongo_url)
+            try:
+                await client.drop_database(self.db_name)
+            finally:
+                client.close()
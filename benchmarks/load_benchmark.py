@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+End-to-End Load Benchmark
+Drives the real backend with N simulated PiKVMs, M video viewers and K input operators
+
+The simulator and the backend run as child processes so CPU and RSS of the
+backend can be measured on their own. Frame latency runs from the backend
+capturing a snapshot to the viewer receiving it; input latency from sending
+an event to its ack. Results are written as JSON; pass an earlier result
+with --baseline to print the change of the headline numbers.
+
+Usage:
+    python benchmarks/load_benchmark.py --devices 20 --viewers 40 --operators 10 --duration 60 \\
+        --in-memory-db --output results/load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from metrics import LatencyRecorder, ResourceSampler
+from environment import BenchEnvironment, add_environment_arguments, git_commit
+
+
+class LoadBenchmark:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.env = BenchEnvironment(args)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.measuring = False
+
+        self.frame_latency = LatencyRecorder()
+        self.ws_input_latency = LatencyRecorder()
+        self.rest_input_latency = LatencyRecorder()
+        self.dashboard_latency: Dict[str, LatencyRecorder] = {}
+        self.frames = 0
+        self.frame_bytes = 0
+        self.stream_errors = 0
+        self.coalesced = 0
+        self.viewer_frames: List[int] = [0] * args.viewers
+
+    # --- load ---
+
+    async def viewer(self, index: int):
+        device_id = self.env.hardware_ids[index % len(self.env.hardware_ids)]
+        try:
+            async with self.session.ws_connect(f"{self.env.ws_url}/stream/{device_id}", max_msg_size=0) as ws:
+                await ws.send_json({"type": "start_stream", "stream_type": "mjpeg"})
+                async for message in ws:
+                    if message.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    data = json.loads(message.data)
+                    if not self.measuring:
+                        continue
+                    if data.get("type") == "mjpeg_frame":
+                        self.viewer_frames[index] += 1
+                        self.frames += 1
+                        self.frame_bytes += len(data.get("image_data", ""))
+                        # Frames are stamped with the backend's local clock
+                        sent_at = datetime.fromisoformat(data["timestamp"])
+                        self.frame_latency.record((datetime.now() - sent_at).total_seconds() * 1000)
+                    elif data.get("type") == "stream_error":
+                        self.stream_errors += 1
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.frame_latency.record_error(type(e).__name__)
+
+    async def operator(self, index: int):
+        """Moves the mouse over the device socket and periodically types over REST"""
+        device_id = self.env.device_ids[index % len(self.env.device_ids)]
+        interval = 1.0 / self.args.input_rate
+        pending: Dict[int, float] = {}
+
+        async def read_acks(ws: aiohttp.ClientWebSocketResponse):
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                data = json.loads(message.data)
+                if data.get("type") != "input_ack":
+                    continue
+                sent_at = pending.pop(data.get("seq"), None)
+                if sent_at is None or not self.measuring:
+                    continue
+                if not data.get("success"):
+                    self.ws_input_latency.record_error(data.get("error") or "failed")
+                elif data.get("coalesced"):
+                    self.coalesced += 1
+                else:
+                    self.ws_input_latency.record((time.perf_counter() - sent_at) * 1000)
+
+        try:
+            async with self.session.ws_connect(f"{self.env.ws_url}/ws/{device_id}?token={self.env.token}") as ws:
+                reader = asyncio.create_task(read_acks(ws))
+                seq = 0
+                try:
+                    while True:
+                        seq += 1
+                        pending[seq] = time.perf_counter()
+                        await ws.send_json({
+                            "type": "mouse", "seq": seq, "action": "move",
+                            "x": random.randint(0, 1919), "y": random.randint(0, 1079)
+                        })
+                        if seq % self.args.rest_every == 0:
+                            await self.rest_input(device_id)
+                        await asyncio.sleep(interval)
+                finally:
+                    reader.cancel()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.ws_input_latency.record_error(type(e).__name__)
+
+    async def rest_input(self, device_id: str):
+        started = time.perf_counter()
+        try:
+            async with self.session.post(f"{self.env.base_url}/input/keyboard", headers=self.env.headers, json={
+                "device_id": device_id, "keys": "a", "modifiers": []
+            }) as response:
+                await response.read()
+                if not self.measuring:
+                    return
+                if response.status == 200:
+                    self.rest_input_latency.record((time.perf_counter() - started) * 1000)
+                else:
+                    self.rest_input_latency.record_error(f"http_{response.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.rest_input_latency.record_error(type(e).__name__)
+
+    async def dashboard(self, index: int):
+        """Polls the endpoints the dashboard refreshes"""
+        endpoints = ["/devices", "/streaming/active", "/health"]
+        await asyncio.sleep(random.uniform(0, self.args.poll_interval))
+        while True:
+            for endpoint in endpoints:
+                recorder = self.dashboard_latency.setdefault(endpoint, LatencyRecorder())
+                started = time.perf_counter()
+                try:
+                    async with self.session.get(f"{self.env.base_url}{endpoint}", headers=self.env.headers) as response:
+                        await response.read()
+                        if self.measuring:
+                            if response.status == 200:
+                                recorder.record((time.perf_counter() - started) * 1000)
+                            else:
+                                recorder.record_error(f"http_{response.status}")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if self.measuring:
+                        recorder.record_error(type(e).__name__)
+            await asyncio.sleep(self.args.poll_interval)
+
+    # --- results ---
+
+    def build_results(self, resources: Dict[str, Any], runtime: Optional[Dict[str, Any]],
+                      simulator: Dict[str, int], measured_seconds: float) -> Dict[str, Any]:
+        args = self.args
+        viewers_fps = sorted(frames / measured_seconds for frames in self.viewer_frames) or [0.0]
+        return {
+            "benchmark": "load",
+            "git_commit": git_commit(),
+            "started_at": datetime.utcnow().isoformat(),
+            "host": {"platform": platform.platform(), "python": platform.python_version()},
+            "config": {
+                "devices": args.devices,
+                "viewers": args.viewers,
+                "operators": args.operators,
+                "dashboards": args.dashboards,
+                "duration_seconds": args.duration,
+                "warmup_seconds": args.warmup,
+                "input_rate": args.input_rate,
+                "rest_every": args.rest_every,
+                "poll_interval": args.poll_interval,
+                "database": "in_memory" if args.in_memory_db else "mongodb",
+                "simulator": {
+                    "latency_ms": args.sim_latency_ms,
+                    "jitter_ms": args.sim_jitter_ms,
+                    "error_rate": args.sim_error_rate,
+                    "bandwidth_kbps": args.sim_bandwidth_kbps,
+                    "frame": f"{args.frame_width}x{args.frame_height}"
+                }
+            },
+            "frames": {
+                "delivered": self.frames,
+                "per_second": round(self.frames / measured_seconds, 1),
+                "bytes_per_second": round(self.frame_bytes / measured_seconds),
+                "viewer_fps_min": round(viewers_fps[0], 2),
+                "viewer_fps_median": round(viewers_fps[len(viewers_fps) // 2], 2),
+                "stream_errors": self.stream_errors,
+                "latency": self.frame_latency.summary(include_histogram=True)
+            },
+            "input": {
+                "ws": {**self.ws_input_latency.summary(include_histogram=True), "coalesced": self.coalesced},
+                "rest": self.rest_input_latency.summary(include_histogram=True)
+            },
+            "dashboard": {endpoint: recorder.summary() for endpoint, recorder in self.dashboard_latency.items()},
+            "resources": resources,
+            "server_runtime": runtime,
+            "simulator": simulator
+        }
+
+    async def run(self) -> Dict[str, Any]:
+        args = self.args
+        connector = aiohttp.TCPConnector(limit=0)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+        tasks: List[asyncio.Task] = []
+        try:
+            await self.env.start(self.session)
+            print(f"Registered {len(self.env.hardware_ids)} devices, starting load")
+
+            sampler = ResourceSampler(self.env.backend.pid)
+            sampler.start()
+            tasks += [asyncio.create_task(self.viewer(i)) for i in range(args.viewers)]
+            tasks += [asyncio.create_task(self.operator(i)) for i in range(args.operators)]
+            tasks += [asyncio.create_task(self.dashboard(i)) for i in range(args.dashboards)]
+
+            await asyncio.sleep(args.warmup)
+            sampler.reset()
+            self.measuring = True
+            started = time.monotonic()
+            await asyncio.sleep(args.duration)
+            self.measuring = False
+            measured_seconds = time.monotonic() - started
+
+            await sampler.stop()
+            runtime = await self.env.runtime_stats()
+            simulator = await self.env.simulator_totals()
+            return self.build_results(sampler.summary(), runtime, simulator, measured_seconds)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.session.close()
+            await self.env.stop()
+
+
+# Headline numbers compared against a baseline: (path, higher is better)
+HEADLINE_METRICS = [
+    ("frames.per_second", True),
+    ("frames.latency.p50_ms", False),
+    ("frames.latency.p99_ms", False),
+    ("input.ws.p50_ms", False),
+    ("input.ws.p99_ms", False),
+    ("input.rest.p99_ms", False),
+    ("resources.cpu_percent.mean", False),
+    ("resources.rss_mb.max", False),
+]
+
+
+def _lookup(results: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = results
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value if isinstance(value, (int, float)) else None
+
+
+def print_summary(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    print(f"{'metric':32} {'value':>12}" + (f" {'baseline':>12} {'change':>9}" if baseline else ""))
+    for path, higher_is_better in HEADLINE_METRICS:
+        value = _lookup(results, path)
+        line = f"{path:32} {value if value is not None else '-':>12}"
+        if baseline:
+            old = _lookup(baseline, path)
+            if old and value is not None:
+                change = (value - old) / old * 100
+                worse = change < 0 if higher_is_better else change > 0
+                line += f" {old:>12} {change:>+8.1f}%{' !' if worse and abs(change) >= 10 else ''}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark with simulated PiKVMs")
+    add_environment_arguments(parser)
+    parser.add_argument("--viewers", type=int, default=20, help="video viewers spread across devices")
+    parser.add_argument("--operators", type=int, default=5, help="input operators spread across devices")
+    parser.add_argument("--dashboards", type=int, default=5, help="dashboard pollers")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--input-rate", type=float, default=30.0, help="mouse moves per second per operator")
+    parser.add_argument("--rest-every", type=int, default=30, help="send one REST keystroke every N moves")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--output", help="write results JSON to this file")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    benchmark = LoadBenchmark(args)
+    results = asyncio.run(benchmark.run())
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.output}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_summary(results, baseline)
+    print(f"Process logs in {benchmark.env.log_dir}")
+
+
+if __name__ == "__main__":
+    main()
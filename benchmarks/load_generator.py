@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+API Load Generator
+Concurrent virtual users running weighted scenarios against a local backend
+
+Scenarios:
+    login_storm     log in, load the profile and the device list, repeat
+    dashboard       refresh the dashboard endpoints
+    input_burst     fire a burst of concurrent REST mouse moves plus a keystroke
+    ws_input_burst  the same burst over the device WebSocket, waiting for every ack
+    stream_churn    join a video stream, wait for the first frame, leave after a while
+
+Virtual users are started evenly over --ramp-up seconds and loop their
+scenario until --duration ends. Each endpoint gets a latency histogram.
+
+Usage:
+    # Monday-morning login spike against a running server
+    python benchmarks/load_generator.py --base-url http://127.0.0.1:8001/api \\
+        --admin-username admin --admin-password admin123 \\
+        --scenario login_storm --users 500 --concurrency 500 --ramp-up 5 --duration 60
+
+    # Mixed traffic against a throwaway backend with simulated devices
+    python benchmarks/load_generator.py --spawn --in-memory-db --devices 10 \\
+        --scenario dashboard=3 --scenario input_burst=1 --scenario stream_churn=1 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from metrics import LatencyRecorder
+from environment import BenchEnvironment, add_environment_arguments, git_commit
+from bench_server import BENCH_ADMIN_USERNAME, BENCH_ADMIN_PASSWORD
+
+LOAD_USER_PASSWORD = "loadgen-password"
+
+
+class VirtualUser:
+    """Per-user state kept across scenario iterations"""
+
+    def __init__(self, index: int, username: str):
+        self.index = index
+        self.username = username
+        self.token: Optional[str] = None
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.seq = 0
+
+
+class LoadGenerator:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.base_url = args.base_url.rstrip("/")
+        self.ws_url = self.base_url.replace("http", "ws", 1)
+        self.env: Optional[BenchEnvironment] = BenchEnvironment(args) if args.spawn else None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.admin_token: Optional[str] = None
+        self.usernames: List[str] = []
+        self.device_ids: List[str] = []
+        self.stream_device_ids: List[str] = []
+        self.endpoints: Dict[str, LatencyRecorder] = {}
+        self.iterations: Dict[str, int] = {}
+        self.active_users = 0
+        self.peak_users = 0
+        self.stopping = False
+
+        self.scenarios: Dict[str, Callable[[VirtualUser], Any]] = {
+            "login_storm": self.login_storm,
+            "dashboard": self.dashboard,
+            "input_burst": self.input_burst,
+            "ws_input_burst": self.ws_input_burst,
+            "stream_churn": self.stream_churn,
+        }
+
+    # --- requests ---
+
+    def _recorder(self, label: str) -> LatencyRecorder:
+        recorder = self.endpoints.get(label)
+        if recorder is None:
+            recorder = self.endpoints[label] = LatencyRecorder()
+        return recorder
+
+    async def call(self, method: str, label: str, path: str, token: Optional[str] = None,
+                   **kwargs) -> Optional[Any]:
+        """Send one request and record its latency under ``label``"""
+        recorder = self._recorder(label)
+        headers = {"Authorization": f"Bearer {token}"} if token else None
+        started = time.perf_counter()
+        try:
+            async with self.session.request(method, f"{self.base_url}{path}", headers=headers, **kwargs) as response:
+                body = await response.read()
+                elapsed = (time.perf_counter() - started) * 1000
+                if response.status >= 400:
+                    recorder.record_error(f"http_{response.status}")
+                    return None
+                recorder.record(elapsed)
+                return json.loads(body) if body else {}
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            recorder.record_error(type(e).__name__)
+            return None
+
+    async def login(self, user: VirtualUser) -> bool:
+        data = await self.call("POST", "POST /auth/login", "/auth/login",
+                               json={"username": user.username, "password": self._password(user.username)})
+        user.token = data.get("access_token") if data else None
+        return user.token is not None
+
+    def _password(self, username: str) -> str:
+        if username == self.args.admin_username:
+            return self.args.admin_password
+        return LOAD_USER_PASSWORD
+
+    def _device(self, ids: Optional[List[str]] = None) -> Optional[str]:
+        ids = ids if ids is not None else self.device_ids
+        return random.choice(ids) if ids else None
+
+    # --- setup ---
+
+    async def setup(self):
+        """Log in as admin, create the load users and give them control of every device"""
+        data = await self.call("POST", "setup", "/auth/login",
+                               json={"username": self.args.admin_username, "password": self.args.admin_password})
+        if not data:
+            raise RuntimeError(f"Admin login failed for {self.args.admin_username}")
+        self.admin_token = data["access_token"]
+
+        if self.env is not None:
+            self.device_ids = list(self.env.device_ids)
+            self.stream_device_ids = list(self.env.hardware_ids)
+        else:
+            devices = await self.call("GET", "setup", "/devices", self.admin_token) or []
+            self.device_ids = [device["id"] for device in devices]
+            # Without the registry kind we cannot tell video devices apart; let the server sort it out
+            self.stream_device_ids = list(self.device_ids)
+
+        if not self.args.users:
+            self.usernames = [self.args.admin_username]
+            return
+
+        self.usernames = [f"{self.args.user_prefix}{index}" for index in range(self.args.users)]
+        semaphore = asyncio.Semaphore(10)
+
+        async def create(username: str):
+            async with semaphore:
+                # 400 means the user is left over from an earlier run, which is fine
+                async with self.session.post(f"{self.base_url}/auth/register", headers={
+                    "Authorization": f"Bearer {self.admin_token}"
+                }, json={
+                    "username": username,
+                    "email": f"{username}@loadgen.local",
+                    "password": LOAD_USER_PASSWORD,
+                    "role": "operator"
+                }) as response:
+                    await response.read()
+                    if response.status not in (200, 400):
+                        raise RuntimeError(f"Creating {username} failed with HTTP {response.status}")
+
+        await asyncio.gather(*[create(username) for username in self.usernames])
+
+        users = await self.call("GET", "setup", "/users", self.admin_token) or []
+        user_ids = {user["username"]: user["id"] for user in users}
+        permissions = {device_id: "control" for device_id in set(self.device_ids + self.stream_device_ids)}
+
+        async def grant(username: str):
+            async with semaphore:
+                if username in user_ids:
+                    await self.call("PUT", "setup", f"/users/{user_ids[username]}/permissions",
+                                    self.admin_token, json=permissions)
+
+        await asyncio.gather(*[grant(username) for username in self.usernames])
+
+    # --- scenarios ---
+
+    async def login_storm(self, user: VirtualUser):
+        if not await self.login(user):
+            return
+        await self.call("GET", "GET /auth/me", "/auth/me", user.token)
+        await self.call("GET", "GET /devices", "/devices", user.token)
+
+    async def dashboard(self, user: VirtualUser):
+        if user.token is None and not await self.login(user):
+            return
+        await asyncio.gather(
+            self.call("GET", "GET /devices", "/devices", user.token),
+            self.call("GET", "GET /streaming/active", "/streaming/active", user.token),
+            self.call("GET", "GET /health", "/health", user.token),
+        )
+        device_id = self._device()
+        if device_id:
+            await self.call("GET", "GET /devices/{id}", f"/devices/{device_id}", user.token)
+
+    async def input_burst(self, user: VirtualUser):
+        if user.token is None and not await self.login(user):
+            return
+        device_id = self._device()
+        if device_id is None:
+            return
+        await asyncio.gather(*[
+            self.call("POST", "POST /input/mouse", "/input/mouse", user.token, json={
+                "device_id": device_id, "x": random.randint(0, 1919), "y": random.randint(0, 1079),
+                "action": "move"
+            })
+            for _ in range(self.args.burst_size)
+        ])
+        await self.call("POST", "POST /input/keyboard", "/input/keyboard", user.token,
+                        json={"device_id": device_id, "keys": "a", "modifiers": []})
+
+    async def ws_input_burst(self, user: VirtualUser):
+        if user.token is None and not await self.login(user):
+            return
+        recorder = self._recorder("WS /ws/{id} input_ack")
+        if user.ws is None or user.ws.closed:
+            device_id = self._device()
+            if device_id is None:
+                return
+            started = time.perf_counter()
+            try:
+                user.ws = await self.session.ws_connect(f"{self.ws_url}/ws/{device_id}?token={user.token}")
+                self._recorder("WS /ws/{id} connect").record((time.perf_counter() - started) * 1000)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._recorder("WS /ws/{id} connect").record_error(type(e).__name__)
+                return
+
+        sent: Dict[int, float] = {}
+        for _ in range(self.args.burst_size):
+            user.seq += 1
+            sent[user.seq] = time.perf_counter()
+            await user.ws.send_json({"type": "mouse", "seq": user.seq, "action": "move",
+                                     "x": random.randint(0, 1919), "y": random.randint(0, 1079)})
+        try:
+            while sent:
+                message = await user.ws.receive(timeout=10)
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    raise aiohttp.ClientError("socket closed")
+                data = json.loads(message.data)
+                started = sent.pop(data.get("seq"), None)
+                if data.get("type") != "input_ack" or started is None:
+                    continue
+                if data.get("success"):
+                    recorder.record((time.perf_counter() - started) * 1000)
+                else:
+                    recorder.record_error(data.get("error") or "failed")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            recorder.record_error(type(e).__name__)
+            await user.ws.close()
+
+    async def stream_churn(self, user: VirtualUser):
+        device_id = self._device(self.stream_device_ids)
+        if device_id is None:
+            return
+        connect = self._recorder("WS /stream/{id} connect")
+        first_frame = self._recorder("WS /stream/{id} first_frame")
+        started = time.perf_counter()
+        try:
+            async with self.session.ws_connect(f"{self.ws_url}/stream/{device_id}", max_msg_size=0) as ws:
+                connect.record((time.perf_counter() - started) * 1000)
+                await ws.send_json({"type": "start_stream", "stream_type": "mjpeg"})
+                joined = time.perf_counter()
+                hold_until = joined + random.uniform(self.args.hold_min, self.args.hold_max)
+                waiting = True
+                while time.perf_counter() < hold_until:
+                    try:
+                        message = await ws.receive(timeout=max(hold_until - time.perf_counter(), 0.01))
+                    except asyncio.TimeoutError:
+                        break
+                    if message.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    if waiting and json.loads(message.data).get("type") == "mjpeg_frame":
+                        first_frame.record((time.perf_counter() - joined) * 1000)
+                        waiting = False
+                if waiting:
+                    first_frame.record_error("no_frame")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            connect.record_error(type(e).__name__)
+
+    # --- driver ---
+
+    def _assignments(self) -> List[str]:
+        """Scenario for each virtual user, in proportion to the weights"""
+        weights: List[Tuple[str, float]] = []
+        for spec in self.args.scenario or ["dashboard"]:
+            name, _, weight = spec.partition("=")
+            if name not in self.scenarios:
+                raise SystemExit(f"Unknown scenario '{name}'. Available: {', '.join(self.scenarios)}")
+            weights.append((name, float(weight or 1)))
+        total = sum(weight for _, weight in weights)
+
+        assignments: List[str] = []
+        for name, weight in weights:
+            assignments += [name] * round(self.args.concurrency * weight / total)
+        while len(assignments) < self.args.concurrency:
+            assignments.append(weights[0][0])
+        random.shuffle(assignments)
+        return assignments[:self.args.concurrency]
+
+    async def virtual_user(self, index: int, scenario: str, deadline: float):
+        user = VirtualUser(index, self.usernames[index % len(self.usernames)])
+        run = self.scenarios[scenario]
+        self.active_users += 1
+        self.peak_users = max(self.peak_users, self.active_users)
+        try:
+            while time.monotonic() < deadline:
+                await run(user)
+                self.iterations[scenario] = self.iterations.get(scenario, 0) + 1
+                if self.args.think_time:
+                    await asyncio.sleep(random.uniform(0.5, 1.5) * self.args.think_time)
+        finally:
+            self.active_users -= 1
+            if user.ws is not None:
+                await user.ws.close()
+
+    async def run(self) -> Dict[str, Any]:
+        args = self.args
+        connector = aiohttp.TCPConnector(limit=args.connections)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=args.timeout))
+        try:
+            if self.env is not None:
+                await self.env.start(self.session)
+                self.base_url = self.env.base_url
+                self.ws_url = self.env.ws_url
+            await self.setup()
+            self.endpoints.pop("setup", None)
+
+            assignments = self._assignments()
+            print(f"Running {len(assignments)} virtual users for {args.duration}s "
+                  f"(ramp-up {args.ramp_up}s) against {self.base_url}")
+
+            started = time.monotonic()
+            deadline = started + args.duration
+            tasks = []
+            for index, scenario in enumerate(assignments):
+                # Spread user starts evenly over the ramp-up period
+                delay = started + args.ramp_up * index / max(len(assignments), 1) - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(self.virtual_user(index, scenario, deadline)))
+            await asyncio.gather(*tasks)
+            elapsed = time.monotonic() - started
+
+            return self.build_results(assignments, elapsed)
+        finally:
+            await self.session.close()
+            if self.env is not None:
+                await self.env.stop()
+
+    def build_results(self, assignments: List[str], elapsed: float) -> Dict[str, Any]:
+        args = self.args
+        requests = sum(len(recorder.samples) + recorder.errors for recorder in self.endpoints.values())
+        errors = sum(recorder.errors for recorder in self.endpoints.values())
+        endpoints = {}
+        for label, recorder in sorted(self.endpoints.items()):
+            summary = recorder.summary(include_histogram=True)
+            summary["per_second"] = round((summary["count"] + summary["errors"]) / elapsed, 1)
+            endpoints[label] = summary
+
+        return {
+            "benchmark": "load_generator",
+            "git_commit": git_commit(),
+            "started_at": datetime.utcnow().isoformat(),
+            "config": {
+                "base_url": self.base_url,
+                "scenarios": {name: assignments.count(name) for name in set(assignments)},
+                "concurrency": args.concurrency,
+                "ramp_up_seconds": args.ramp_up,
+                "duration_seconds": args.duration,
+                "think_time": args.think_time,
+                "burst_size": args.burst_size,
+                "users": len(self.usernames),
+                "devices": len(self.device_ids)
+            },
+            "totals": {
+                "requests": requests,
+                "errors": errors,
+                "error_rate": round(errors / requests, 4) if requests else 0.0,
+                "requests_per_second": round(requests / elapsed, 1),
+                "elapsed_seconds": round(elapsed, 1),
+                "peak_virtual_users": self.peak_users,
+                "iterations": self.iterations
+            },
+            "endpoints": endpoints
+        }
+
+
+def print_report(results: Dict[str, Any]):
+    totals = results["totals"]
+    print(f"\n{totals['requests']} requests, {totals['errors']} errors, "
+          f"{totals['requests_per_second']} req/s over {totals['elapsed_seconds']}s")
+    print(f"{'endpoint':34} {'count':>7} {'err':>6} {'rps':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for label, stats in results["endpoints"].items():
+        print(f"{label:34} {stats['count']:>7} {stats['errors']:>6} {stats['per_second']:>7} "
+              f"{stats['p50_ms']:>8} {stats['p90_ms']:>8} {stats['p99_ms']:>8} {stats['max_ms']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent scenario-based API load generator")
+    parser.add_argument("--base-url", default=os.environ.get("LOADGEN_BASE_URL", "http://127.0.0.1:8001/api"))
+    parser.add_argument("--admin-username", default=os.environ.get("LOADGEN_ADMIN_USERNAME"))
+    parser.add_argument("--admin-password", default=os.environ.get("LOADGEN_ADMIN_PASSWORD"))
+    parser.add_argument("--scenario", action="append", help="name or name=weight; repeat to mix scenarios")
+    parser.add_argument("--concurrency", type=int, default=50, help="virtual users")
+    parser.add_argument("--users", type=int, default=50, help="distinct load-test accounts (0: use the admin)")
+    parser.add_argument("--user-prefix", default="loadgen_")
+    parser.add_argument("--ramp-up", type=float, default=10.0, help="seconds over which users start")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean pause between iterations")
+    parser.add_argument("--burst-size", type=int, default=20, help="events per input burst")
+    parser.add_argument("--hold-min", type=float, default=1.0, help="shortest stream view in seconds")
+    parser.add_argument("--hold-max", type=float, default=5.0, help="longest stream view in seconds")
+    parser.add_argument("--connections", type=int, default=0, help="client connection pool cap (0: unlimited)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--spawn", action="store_true", help="start a throwaway backend and simulated devices")
+    add_environment_arguments(parser, devices=0)
+    parser.add_argument("--output", help="write results JSON to this file")
+    args = parser.parse_args()
+
+    if args.spawn:
+        args.admin_username = args.admin_username or BENCH_ADMIN_USERNAME
+        args.admin_password = args.admin_password or BENCH_ADMIN_PASSWORD
+    elif not args.admin_username or not args.admin_password:
+        parser.error("--admin-username and --admin-password are required without --spawn")
+
+    results = asyncio.run(LoadGenerator(args).run())
+    print_report(results)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark Metrics
+Latency recording and process resource sampling shared by the benchmark scripts
+"""
+
+import asyncio
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class LatencyRecorder:
+    """Collects latency samples (ms) and error counts for one operation"""
+
+    def __init__(self):
+        self.samples: List[float] = []
+        self.errors = 0
+        self.error_kinds: Dict[str, int] = {}
+
+    def record(self, latency_ms: float):
+        self.samples.append(latency_ms)
+
+    def record_error(self, kind: str = "error"):
+        self.errors += 1
+        self.error_kinds[kind] = self.error_kinds.get(kind, 0) + 1
+
+    def histogram(self) -> Dict[str, int]:
+        buckets = {f"le_{bound}ms": 0 for bound in HISTOGRAM_BUCKETS_MS}
+        buckets["gt_max"] = 0
+        for sample in self.samples:
+            for bound in HISTOGRAM_BUCKETS_MS:
+                if sample <= bound:
+                    buckets[f"le_{bound}ms"] += 1
+                    break
+            else:
+                buckets["gt_max"] += 1
+        return buckets
+
+    def summary(self, include_histogram: bool = False) -> Dict[str, Any]:
+        values = sorted(self.samples)
+        result = {
+            "count": len(values),
+            "errors": self.errors,
+            "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+            "p50_ms": round(percentile(values, 0.50), 2),
+            "p90_ms": round(percentile(values, 0.90), 2),
+            "p99_ms": round(percentile(values, 0.99), 2),
+            "max_ms": round(values[-1], 2) if values else 0.0
+        }
+        if self.error_kinds:
+            result["error_kinds"] = dict(self.error_kinds)
+        if include_histogram:
+            result["histogram"] = self.histogram()
+        return result
+
+
+class ResourceSampler:
+    """Samples CPU and RSS of a process (and its children) at a fixed interval"""
+
+    def __init__(self, pid: int, interval: float = 1.0):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.cpu: List[float] = []
+        self.rss_mb: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def _processes(self) -> List[psutil.Process]:
+        try:
+            return [self.process] + self.process.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+
+    async def _run(self):
+        for process in self._processes():
+            process.cpu_percent(None)
+        while True:
+            await asyncio.sleep(self.interval)
+            cpu = rss = 0.0
+            for process in self._processes():
+                try:
+                    cpu += process.cpu_percent(None)
+                    rss += process.memory_info().rss
+                except psutil.NoSuchProcess:
+                    continue
+            self.cpu.append(cpu)
+            self.rss_mb.append(rss / (1024 * 1024))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reset(self):
+        """Drop samples taken so far (e.g. during warm-up)"""
+        self.cpu.clear()
+        self.rss_mb.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        def stats(values: List[float]) -> Dict[str, float]:
+            if not values:
+                return {"mean": 0.0, "max": 0.0}
+            return {"mean": round(sum(values) / len(values), 1), "max": round(max(values), 1)}
+
+        return {
+            "samples": len(self.cpu),
+            "cpu_percent": stats(self.cpu),
+            "rss_mb": stats(self.rss_mb),
+            "cpu_count": psutil.cpu_count()
+        }
+
+
+class Stopwatch:
+    """Measures elapsed milliseconds with the monotonic clock"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
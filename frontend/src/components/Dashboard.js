@@ -44,14 +44,51 @@ const Dashboard = ({ user, token, onLogout }) => {
     fetchDevices();
     fetchSystemMetrics();
     fetchLogs();
-    
+
+    // System metrics are pushed by the server; polling only covers a dropped socket
+    let metricsSocket = null;
+    let reconnectTimer = null;
+    let reconnectDelay = 1000;
+    let unmounted = false;
+
+    const connectMetrics = () => {
+      metricsSocket = new WebSocket(
+        `${API.replace(/^http/, 'ws')}/ws/system/metrics?token=${encodeURIComponent(token)}`
+      );
+      metricsSocket.onopen = () => {
+        reconnectDelay = 1000;
+      };
+      metricsSocket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'system_metrics') {
+          setSystemMetrics(message.sample);
+        } else if (message.type === 'system_metrics_history' && message.samples.length > 0) {
+          setSystemMetrics(message.samples[message.samples.length - 1]);
+        }
+      };
+      metricsSocket.onclose = () => {
+        if (unmounted) return;
+        // Back off up to 30s so a restarting server is not hammered
+        reconnectTimer = setTimeout(connectMetrics, reconnectDelay);
+        reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+      };
+    };
+    connectMetrics();
+
     // Set up periodic updates
     const interval = setInterval(() => {
-      fetchSystemMetrics();
+      if (metricsSocket.readyState !== WebSocket.OPEN) {
+        fetchSystemMetrics();
+      }
       fetchLogs();
     }, 5000);
-    
-    return () => clearInterval(interval);
+
+    return () => {
+      unmounted = true;
+      clearInterval(interval);
+      clearTimeout(reconnectTimer);
+      metricsSocket.close();
+    };
   }, []);
 
   const fetchDevices = async () => {
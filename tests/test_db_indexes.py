@@ -0,0 +1,46 @@
+"""
+Checks that the hot queries of the API are served by the declared indexes.
+Needs a MongoDB server (MONGO_URL, default localhost); skipped without one.
+"""
+
+import asyncio
+import os
+import uuid
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+
+
+def _mongo_available() -> bool:
+    client = MongoClient(MONGO_URL, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+
+pytestmark = pytest.mark.skipif(not _mongo_available(), reason=f"MongoDB not reachable at {MONGO_URL}")
+
+
+def test_hot_queries_use_indexes():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from db_indexes import IndexManager
+
+    async def run():
+        client = AsyncIOMotorClient(MONGO_URL)
+        name = f"test_indexes_{uuid.uuid4().hex[:8]}"
+        try:
+            manager = IndexManager(client[name])
+            assert await manager.ensure_indexes()
+            return await manager.verify_query_plans()
+        finally:
+            await client.drop_database(name)
+            client.close()
+
+    assert asyncio.run(run()) == []
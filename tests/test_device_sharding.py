@@ -0,0 +1,65 @@
+"""
+Consistent hashing of devices onto workers and routing by PiKVM box.
+"""
+
+from device_sharding import DeviceSharding, HashRing
+from event_bus import EventBus, LOCAL
+
+DEVICES = [f"device-{i}" for i in range(1000)]
+
+
+def _owners(ring, keys):
+    return {key: ring.owner(key) for key in keys}
+
+
+def test_every_member_owns_a_share():
+    ring = HashRing(["1", "2", "3", "4"], replicas=64)
+    counts = {}
+    for owner in _owners(ring, DEVICES).values():
+        counts[owner] = counts.get(owner, 0) + 1
+    assert set(counts) == {"1", "2", "3", "4"}
+    # 64 virtual nodes keep every share within a factor of two of even
+    assert all(125 <= count <= 500 for count in counts.values())
+
+
+def test_ring_is_independent_of_member_order():
+    assert _owners(HashRing(["3", "1", "2"], 64), DEVICES) == _owners(HashRing(["1", "2", "3"], 64), DEVICES)
+
+
+def test_removing_a_member_only_moves_its_devices():
+    before = _owners(HashRing(["1", "2", "3", "4"], 64), DEVICES)
+    after = _owners(HashRing(["1", "2", "3"], 64), DEVICES)
+    moved = [device for device in DEVICES if before[device] != after[device]]
+    assert moved
+    assert all(before[device] == "4" for device in moved)
+
+
+def _sharding(members):
+    sharding = DeviceSharding(EventBus(path="unused.sock", mode=LOCAL), replicas=64)
+    sharding.ring = HashRing(members, sharding.replicas)
+    return sharding
+
+
+def test_devices_of_one_box_share_an_owner():
+    sharding = _sharding(["1", "2", "3", "4"])
+    for index, device_id in enumerate(DEVICES):
+        sharding.bind(device_id, f"10.0.{index // 4}.1:80")
+
+    for start in range(0, len(DEVICES), 4):
+        box = DEVICES[start:start + 4]
+        assert len({sharding.owner(device_id) for device_id in box}) == 1
+        assert sharding.owner(box[0]) == sharding.ring.owner(sharding.owner_key(box[0]))
+
+
+def test_unbound_devices_are_placed_by_their_id():
+    sharding = _sharding(["1", "2", "3", "4"])
+    sharding.bind("a", "10.0.0.1:80")
+    sharding.unbind("a")
+    assert sharding.owner_key("a") == "a"
+    assert sharding.owner("a") == sharding.ring.owner("a")
+
+
+def test_single_worker_owns_everything():
+    sharding = DeviceSharding(EventBus(path="unused.sock", mode=LOCAL), replicas=64)
+    assert all(sharding.owns(device_id) for device_id in DEVICES)
+    assert not sharding.should_forward(DEVICES[0])
@@ -0,0 +1,87 @@
+"""
+Coalescing, rate shaping and shutdown of the per-device input shaper.
+"""
+
+import asyncio
+import time
+
+from input_shaper import COALESCED, InputShaper
+
+
+def _recorder(delay: float = 0.0):
+    forwarded = []
+
+    async def forward(event):
+        if delay:
+            await asyncio.sleep(delay)
+        forwarded.append(event)
+        return True
+
+    return forwarded, forward
+
+
+def test_close_resolves_input_being_forwarded():
+    async def run():
+        shaper = InputShaper("device", max_rate=0)
+        _, forward = _recorder(delay=10)
+        pending = asyncio.create_task(shaper.submit({"keys": "a"}, forward))
+        await asyncio.sleep(0.05)
+        await shaper.close()
+        return await asyncio.wait_for(pending, timeout=1)
+
+    assert asyncio.run(run()) == {"success": False, "coalesced": False}
+
+
+def test_pending_moves_coalesce_to_latest_position():
+    async def run():
+        shaper = InputShaper("device", max_rate=0)
+        forwarded, forward = _recorder()
+        # All five are queued before the shaper gets to run
+        results = await asyncio.gather(*(
+            shaper.submit({"x": x}, forward, coalescible=True) for x in range(5)
+        ))
+        await shaper.close()
+        return forwarded, results, shaper.stats
+
+    forwarded, results, stats = asyncio.run(run())
+
+    assert forwarded == [{"x": 4}]
+    assert results[:4] == [COALESCED] * 4
+    assert results[4] == {"success": True, "coalesced": False}
+    assert stats["coalesced"] == 4
+
+
+def test_clicks_and_keys_are_never_merged():
+    async def run():
+        shaper = InputShaper("device", max_rate=0)
+        forwarded, forward = _recorder()
+        await asyncio.gather(
+            shaper.submit({"x": 1}, forward, coalescible=True),
+            shaper.submit({"x": 2}, forward, coalescible=True),
+            shaper.submit({"button": "left"}, forward),
+            shaper.submit({"x": 3}, forward, coalescible=True),
+            shaper.submit({"keys": "a"}, forward),
+            shaper.submit({"keys": "b"}, forward),
+        )
+        await shaper.close()
+        return forwarded
+
+    # Moves only merge with a move right before them, so the click keeps its place
+    assert asyncio.run(run()) == [{"x": 2}, {"button": "left"}, {"x": 3}, {"keys": "a"}, {"keys": "b"}]
+
+
+def test_moves_are_rate_limited():
+    rate = 20
+
+    async def run():
+        shaper = InputShaper("device", max_rate=rate)
+        _, forward = _recorder()
+        started = time.monotonic()
+        for x in range(4):
+            await shaper.submit({"x": x}, forward, coalescible=True)
+        elapsed = time.monotonic() - started
+        await shaper.close()
+        return elapsed
+
+    # Four sequential moves need at least three intervals between them
+    assert asyncio.run(run()) >= 3 / rate * 0.9
@@ -0,0 +1,46 @@
+"""
+Text to PiKVM key event translation.
+"""
+
+import pytest
+
+from keymaps import text_to_events
+
+
+def _strokes(events):
+    return [(event["event"]["key"], event["event"]["state"]) for event in events]
+
+
+def test_lowercase_letters_press_and_release():
+    assert _strokes(text_to_events("ab")) == [
+        ("KeyA", True), ("KeyA", False), ("KeyB", True), ("KeyB", False)
+    ]
+
+
+def test_shifted_characters_wrap_the_key_in_shift():
+    assert _strokes(text_to_events("A!")) == [
+        ("ShiftLeft", True), ("KeyA", True), ("KeyA", False), ("ShiftLeft", False),
+        ("ShiftLeft", True), ("Digit1", True), ("Digit1", False), ("ShiftLeft", False),
+    ]
+
+
+def test_crlf_is_typed_as_one_enter():
+    assert _strokes(text_to_events("\r\n")) == [("Enter", True), ("Enter", False)]
+
+
+def test_dead_keys_are_committed_with_a_space():
+    assert _strokes(text_to_events("~", keymap="pt-br")) == [
+        ("Quote", True), ("Quote", False), ("Space", True), ("Space", False)
+    ]
+
+
+def test_layouts_differ_for_the_same_character():
+    assert _strokes(text_to_events(";", keymap="en-us"))[0] == ("Semicolon", True)
+    assert _strokes(text_to_events(";", keymap="pt-br"))[0] == ("Slash", True)
+
+
+def test_untypeable_input_is_rejected():
+    with pytest.raises(ValueError):
+        text_to_events("é")
+    with pytest.raises(ValueError):
+        text_to_events("a", keymap="xx")
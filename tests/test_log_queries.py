@@ -0,0 +1,50 @@
+"""
+Log cursor encoding and the filters built from it.
+"""
+
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from log_queries import _after, build_log_filter, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trips_datetimes():
+    timestamp = datetime(2026, 3, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(timestamp, "log-1")) == (timestamp, "log-1")
+
+
+def test_cursor_round_trips_other_timestamps():
+    assert decode_cursor(encode_cursor("2026-03-01", "log-2")) == ("2026-03-01", "log-2")
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(datetime(2026, 3, 1), "ü/+?")
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "e30", ""])
+def test_malformed_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_after_adds_the_keyset_bound_to_the_filter():
+    timestamp = datetime(2026, 3, 1)
+    query = _after({"device_id": "d1"}, encode_cursor(timestamp, "log-1"))
+    assert query == {"$and": [
+        {"device_id": "d1"},
+        {
+            "timestamp": {"$lte": timestamp},
+            "$or": [{"timestamp": {"$lt": timestamp}}, {"id": {"$lt": "log-1"}}]
+        }
+    ]}
+    assert _after({"device_id": "d1"}, None) == {"device_id": "d1"}
+
+
+def test_filter_is_limited_to_accessible_devices():
+    assert build_log_filter(device_ids=["d1", "d2"]) == {"device_id": {"$in": ["d1", "d2"]}}
+    assert build_log_filter(device_ids=["d1"], device_id="d2") is None
+    assert build_log_filter(device_ids=[]) is None
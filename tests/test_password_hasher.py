@@ -0,0 +1,70 @@
+"""
+Bounded hashing pool: load shedding and slot accounting.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from password_hasher import PasswordHasher, PasswordHasherBusy
+
+
+class BlockingContext:
+    """Stands in for CryptContext; hashes block until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def hash(self, password):
+        self.release.wait(5)
+        return f"hashed:{password}"
+
+    def verify(self, password, hashed):
+        self.release.wait(5)
+        return hashed == f"hashed:{password}"
+
+
+def test_requests_beyond_capacity_are_shed():
+    async def run():
+        context = BlockingContext()
+        hasher = PasswordHasher(context, workers=1, max_pending=1)
+        running = [asyncio.create_task(hasher.hash(str(i))) for i in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(PasswordHasherBusy) as busy:
+            await hasher.hash("one too many")
+        context.release.set()
+        results = await asyncio.gather(*running)
+        hasher.cleanup()
+        return busy.value, results, hasher.get_stats()
+
+    busy, results, stats = asyncio.run(run())
+
+    assert busy.retry_after >= 1
+    assert results == ["hashed:0", "hashed:1"]
+    assert stats["rejected"] == 1 and stats["completed"] == 2 and stats["in_flight"] == 0
+
+
+def test_cancelled_caller_keeps_its_slot_until_the_job_ends():
+    async def run():
+        context = BlockingContext()
+        hasher = PasswordHasher(context, workers=1, max_pending=0)
+        caller = asyncio.create_task(hasher.hash("secret"))
+        await asyncio.sleep(0.05)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+
+        # The hash is still running in the pool, so there is no room yet
+        with pytest.raises(PasswordHasherBusy):
+            await hasher.hash("next")
+
+        context.release.set()
+        for _ in range(100):
+            if not hasher.get_stats()["in_flight"]:
+                break
+            await asyncio.sleep(0.01)
+        result = await hasher.verify("next", "hashed:next")
+        hasher.cleanup()
+        return result
+
+    assert asyncio.run(run()) is True
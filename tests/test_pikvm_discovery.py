@@ -0,0 +1,38 @@
+"""
+Discovery against simulated PiKVMs bound to loopback addresses (127.1.1.x).
+"""
+
+import asyncio
+import socket
+
+from pikvm_discovery import PiKVMDiscovery
+from pikvm_simulator import PiKVMSimulator, SimulatorConfig
+
+
+def _free_port(host: str) -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def test_scan_finds_simulated_devices():
+    count = 3
+    port = _free_port("127.1.1.1")
+
+    async def run():
+        simulator = PiKVMSimulator(SimulatorConfig(width=64, height=48, frame_count=1))
+        discovery = PiKVMDiscovery()
+        await simulator.start(count, base_port=port, host_mode=True)
+        try:
+            return await discovery.scan(
+                ["127.1.1.0/28"], ports=[port], connect_timeout=0.5, http_timeout=2.0,
+                username="admin", password="admin"
+            )
+        finally:
+            await discovery.cleanup()
+            await simulator.stop()
+
+    found = asyncio.run(run())
+
+    assert sorted(device["host"] for device in found) == [f"127.1.1.{i}" for i in range(1, count + 1)]
+    assert all(device["port"] == port and device["authenticated"] for device in found)
@@ -0,0 +1,68 @@
+"""
+Token cache expiry, invalidation and the stale-put guard.
+"""
+
+import time
+
+from token_cache import TokenCache
+
+USER = {"id": "u1", "username": "alice", "role": "viewer", "active": True}
+
+
+def test_put_then_get_returns_a_copy():
+    cache = TokenCache(max_entries=10, ttl=60)
+    cache.put("token", USER)
+    user = cache.get("token")
+    user["role"] = "admin"
+    assert cache.get("token") == USER
+
+
+def test_entry_never_outlives_the_token():
+    cache = TokenCache(max_entries=10, ttl=60)
+    cache.put("token", USER, token_exp=time.time() - 1)
+    assert cache.get("token") is None
+
+
+def test_invalidate_user_drops_their_tokens():
+    cache = TokenCache(max_entries=10, ttl=60)
+    cache.put("a", USER)
+    cache.put("b", USER)
+    cache.put("c", {**USER, "id": "u2"})
+    assert cache.invalidate_user("u1") == 2
+    assert cache.get("a") is None and cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_put_read_before_an_invalidation_is_dropped():
+    cache = TokenCache(max_entries=10, ttl=60)
+    generation = cache.generation()
+    # The user changes while their old record is being loaded
+    cache.invalidate_user("u1")
+    cache.put("token", USER, generation=generation)
+    assert cache.get("token") is None
+    assert cache.stats["stale_puts"] == 1
+
+
+def test_put_read_after_an_invalidation_is_kept():
+    cache = TokenCache(max_entries=10, ttl=60)
+    cache.invalidate_user("u1")
+    cache.put("token", USER, generation=cache.generation())
+    assert cache.get("token") == USER
+
+
+def test_invalidating_another_user_does_not_block_puts():
+    cache = TokenCache(max_entries=10, ttl=60)
+    generation = cache.generation()
+    cache.invalidate_user("u2")
+    cache.put("token", USER, generation=generation)
+    assert cache.get("token") == USER
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TokenCache(max_entries=2, ttl=60)
+    cache.put("a", USER)
+    cache.put("b", USER)
+    cache.get("a")
+    cache.put("c", USER)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None